@@ -1,24 +1,27 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
-from rest_framework.authtoken.models import Token
 from django import forms
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import User
+from rest_framework.authtoken.models import Token
+from .exports import export_response
+from .models import LoginAttempt, OneTimeCode, User
+from .otp import discard_codes
+from .utils import normalize_service_number
 import random
 import string
 
-# Unregister Groups and Token models
+# Unregister Groups (registered as a side effect of importing auth.admin).
+# Tokens never get registered: admin autodiscovery is off (SimpleAdminConfig),
+# so rest_framework.authtoken.admin is not imported.
 try:
     admin.site.unregister(Group)
 except admin.sites.NotRegistered:
     pass
 
-try:
-    admin.site.unregister(Token)
-except admin.sites.NotRegistered:
-    pass
-
 def generate_random_code(length=6):
     """Generate a random numeric code of specified length."""
     return ''.join(random.choices(string.digits, k=length))
@@ -63,6 +66,35 @@ class UserChangeForm(forms.ModelForm):
         model = User
         fields = ('username', 'email', 'name', 'serviceNumber', 'profile_image', 'phone', 'is_active', 'is_admin', 'is_staff')
 
+class CappedCountPaginator(Paginator):
+    """
+    Paginator for very large tables. Counting stops at max_count rows
+    (SELECT COUNT(*) over a LIMITed subquery), so the changelist never
+    scans millions of rows just to print the number of pages.
+    """
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.max_count].count()
+
+
+def revoke_logins(queryset):
+    """
+    Delete the API tokens and pending SMS codes of queryset's users, with
+    one DELETE each whatever the selection size. Returns the number of
+    tokens and codes deleted.
+    """
+    tokens, _ = Token.objects.filter(user__in=queryset.values('pk')).delete()
+    # Only users with a live code need their resend timer cleared; codes last
+    # minutes, so these are a few rows even when the whole roster is selected
+    pending = OneTimeCode.objects.filter(service_number__in=queryset.values('serviceNumber'))
+    service_numbers = list(pending.values_list('service_number', flat=True))
+    codes, _ = pending.delete()
+    discard_codes(service_numbers)
+    return tokens, codes
+
+
 class UserAdmin(BaseUserAdmin):
     # The forms to add and change user instances
     form = UserChangeForm
@@ -70,7 +102,10 @@ class UserAdmin(BaseUserAdmin):
 
     # The fields to be used in displaying the User model.
     list_display = ('profile_image_thumbnail', 'serviceNumber', 'name', 'username', 'email', 'plain_code', 'is_admin', 'is_staff')
-    list_filter = ()
+    list_filter = ('is_active',)
+    # Every action works on the queryset in SQL, so "select all" across
+    # the changelist costs the same as one page
+    actions = ('deactivate_users', 'activate_users', 'reset_logins', 'export_csv', 'export_xlsx')
     fieldsets = (
         (None, {'fields': ('username',)}),
         ('Personal info', {'fields': ('name', 'serviceNumber', 'email', 'phone', 'profile_image',)}),
@@ -89,6 +124,11 @@ class UserAdmin(BaseUserAdmin):
     )
     search_fields = ('username', 'email', 'name')
     ordering = ('username',)
+    # An exact count, unlike LoginAttemptAdmin: "select all" and the bulk
+    # actions cover every matching user, so the changelist must say how
+    # many that is. The unfiltered total isn't shown, which saves a second
+    # COUNT per page.
+    show_full_result_count = False
     filter_horizontal = ()
     readonly_fields = ('plain_code',)
 
@@ -109,6 +149,71 @@ class UserAdmin(BaseUserAdmin):
             return format_html('<div style="width: 45px; height: 45px; border-radius: 50%; background-color: #e0e0e0; display: flex; align-items: center; justify-content: center; color: #757575;font-size:10px;">No<br>Image</div>')
     profile_image_thumbnail.short_description = 'Profile'
 
+    # is_active, tokens and codes aren't part of the roster, so none of
+    # these actions needs a snapshot rebuild (authentication.snapshots)
+
+    @admin.action(description='Deactivate selected users and sign them out', permissions=['change'])
+    def deactivate_users(self, request, queryset):
+        # Never the admin doing it, who would be locked out mid-session
+        queryset = queryset.exclude(pk=request.user.pk)
+        with transaction.atomic():
+            revoke_logins(queryset)
+            updated = queryset.filter(is_active=True).update(is_active=False)
+        self.message_user(request, f'Deactivated {updated} users.', messages.SUCCESS)
+
+    @admin.action(description='Activate selected users', permissions=['change'])
+    def activate_users(self, request, queryset):
+        updated = queryset.filter(is_active=False).update(is_active=True)
+        self.message_user(request, f'Activated {updated} users.', messages.SUCCESS)
+
+    @admin.action(description='Reset logins of selected users (revoke tokens and pending codes)', permissions=['change'])
+    def reset_logins(self, request, queryset):
+        with transaction.atomic():
+            tokens, codes = revoke_logins(queryset)
+        self.message_user(request, f'Revoked {tokens} tokens and {codes} pending codes.', messages.SUCCESS)
+
+    @admin.action(description='Export selected users as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export_response(request, queryset, 'csv')
+
+    @admin.action(description='Export selected users as XLSX', permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export_response(request, queryset, 'xlsx')
+
+
+class LoginAttemptAdmin(admin.ModelAdmin):
+    """Read-only view of the login audit log, built to stay fast over millions of rows."""
+    list_display = ('created_at', 'username', 'successful', 'ip_address', 'latency_ms', 'user_agent')
+    list_filter = ('successful',)
+    # Searches are exact matches on indexed columns (see get_search_results)
+    search_fields = ('username', 'ip_address')
+    search_help_text = 'Exact service number or IP address'
+    ordering = ('-created_at',)
+    raw_id_fields = ('user',)
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default icontains search can't use an index; match exactly instead
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if any(c in search_term for c in '.:') and '/' not in search_term:
+            return queryset.filter(ip_address=search_term), False
+        return queryset.filter(username=normalize_service_number(search_term)), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Also removes delete_selected, which would load every row to delete it
+        return False
+
+
 # Register the model with the custom admin
 admin.site.register(User, UserAdmin)
+admin.site.register(LoginAttempt, LoginAttemptAdmin)
 admin.site.site_header = "NAIM Users Endpoint"
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Async versions of the auth endpoints, routed by urls.py when ASYNC_API is
+on (the ASGI entry point, core/asgi.py, turns it on).
+
+Each class mixes AsyncAPIView into the sync view of the same name in
+views.py. It keeps that view's permissions, throttles and renderers, and
+rewrites only the handler with the async ORM. Responses are the same,
+byte for byte; tests compare the two.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aauthenticate
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+
+from core.async_api import AsyncAPIView, aiterate
+
+from . import snapshots, views
+from .audit import record_login_attempt
+from .models import User
+from .otp import issue_code
+from .serializers import (
+    UsernameCheckSerializer, BatchUsernameCheckSerializer, CodeVerificationSerializer,
+    UserListSerializer, roster_row_serializer
+)
+from .utils import mask_phone_number, normalize_service_number
+
+
+class UsernameCheckView(AsyncAPIView, views.UsernameCheckView):
+    async def post(self, request):
+        serializer = UsernameCheckSerializer(data=request.data)
+        if serializer.is_valid():
+            username = serializer.validated_data['username']
+            user = await User.objects.filter(serviceNumber=username).values_list('serviceNumber', 'phone', 'is_active').afirst()
+
+            if user:
+                service_number, phone, is_active = user
+                response_data = {
+                    'exists': True,
+                    'serviceNumber': service_number,
+                    'phone': mask_phone_number(phone)
+                }
+                if settings.LOGIN_CODE_MODE == 'sms':
+                    response_data['codeSent'] = is_active and await sync_to_async(issue_code)(service_number, phone)
+                return Response(response_data, status=status.HTTP_200_OK)
+            else:
+                return Response({
+                    'exists': False,
+                    'message': 'Username not found'
+                }, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BatchUsernameCheckView(AsyncAPIView, views.BatchUsernameCheckView):
+    async def post(self, request):
+        serializer = BatchUsernameCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        usernames = serializer.validated_data['usernames']
+        normalized = [normalize_service_number(username) for username in usernames]
+        phones = {
+            service_number: phone
+            async for service_number, phone in User.objects.filter(
+                serviceNumber__in=set(normalized)
+            ).values_list('serviceNumber', 'phone')
+        }
+        return StreamingHttpResponse(
+            self.astream_results(usernames, normalized, phones),
+            content_type='application/json',
+        )
+
+    async def astream_results(self, usernames, normalized, phones):
+        # An async iterator, so ASGI streams it without a thread per chunk
+        for chunk in self.stream_results(usernames, normalized, phones):
+            yield chunk
+
+
+class CodeVerificationView(AsyncAPIView, views.CodeVerificationView):
+    async def post(self, request):
+        started = time.perf_counter()
+        serializer = CodeVerificationSerializer(data=request.data)
+        if serializer.is_valid():
+            username = serializer.validated_data['username']
+            code = serializer.validated_data['code']
+
+            if settings.LOGIN_CODE_MODE == 'sms':
+                user = await aauthenticate(request, username=username, otp=code)
+            else:
+                user = await aauthenticate(username=username, password=code)
+
+            if user:
+                token, created = await Token.objects.aget_or_create(user=user)
+
+                response_data = {
+                    'token': token.key,
+                    'id': user.pk,
+                    'name': user.name,
+                    'serviceNumber': user.serviceNumber,
+                    'username': user.username,
+                    'email': user.email,
+                    'phone': user.phone
+                }
+
+                if hasattr(user, 'profile_image') and user.profile_image:
+                    response_data['profile_image'] = request.build_absolute_uri(user.profile_image.url)
+                else:
+                    response_data['profile_image'] = None
+
+                record_login_attempt(request, user.serviceNumber, user, True, time.perf_counter() - started)
+                return Response(response_data, status=status.HTTP_200_OK)
+            record_login_attempt(
+                request, normalize_service_number(username), None, False, time.perf_counter() - started
+            )
+            return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UserListView(AsyncAPIView, views.UserListView):
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = aiterate(
+            queryset.values_list(*UserListSerializer.Meta.fields), chunk_size=settings.ROSTER_CHUNK_SIZE
+        )
+        serialize_row = roster_row_serializer(request)
+        return Response([serialize_row(row) async for row in rows])
+
+
+class RosterSnapshotView(AsyncAPIView, views.RosterSnapshotView):
+    async def get(self, request):
+        # The manifest is one stat and a cached read; only a first build leaves the loop
+        snapshot = snapshots.current_snapshot() or await sync_to_async(snapshots.build_snapshot)()
+        return self.snapshot_response(request, snapshot)
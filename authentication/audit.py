@@ -0,0 +1,180 @@
+"""
+Write-behind login audit log.
+
+Views call record_login_attempt(), which only appends to an in-memory
+buffer. The buffer is written with one bulk_create when it reaches
+LOGIN_AUDIT_BUFFER_SIZE events, every LOGIN_AUDIT_FLUSH_INTERVAL seconds
+from a background thread, and on interpreter/worker shutdown. Each worker
+process has its own buffer, so the verify-code path never waits on the
+database write lock.
+
+A failed attempt reaches the buffer without a user: the view only knows
+the account when the login succeeds. The flush links each one to the
+account its identifier names, with one lookup per batch.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LoginAttempt, User
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    def __init__(self, max_size, flush_interval, max_pending=None):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        # If the database is unavailable or the flusher falls behind, keep
+        # at most this many events, dropping the oldest
+        self.max_pending = max_pending or max_size * 100
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.events = []
+        self.pid = None
+        self.wakeup = threading.Event()
+
+    def record(self, event):
+        self._ensure_flusher()
+        with self.lock:
+            if len(self.events) >= self.max_pending:
+                del self.events[0]
+                self.dropped += 1
+            self.events.append(event)
+            full = len(self.events) >= self.max_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Write everything buffered so far. Safe to call from any thread."""
+        with self.flush_lock:
+            with self.lock:
+                events, self.events = self.events, []
+            if not events:
+                return 0
+            try:
+                link_users(events)
+                LoginAttempt.objects.bulk_create(events, batch_size=500)
+            except DatabaseError:
+                logger.exception("Could not write %d login audit events", len(events))
+                with self.lock:
+                    # Put them back in front, dropping the oldest if it's piling up
+                    self.events = (events + self.events)[-self.max_pending:]
+                return 0
+            except Exception:
+                # Not a database outage: retrying the same events would fail again
+                logger.exception("Dropped %d login audit events", len(events))
+                return 0
+            return len(events)
+
+    def _ensure_flusher(self):
+        # Threads don't survive fork, so start one per worker process,
+        # lazily, after gunicorn has forked
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.lock:
+            if self.pid == pid:
+                return
+            self.pid = pid
+            self.events = []
+            threading.Thread(target=self._run, name='login-audit-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Whatever happens, keep the thread alive to drain the buffer
+                logger.exception("Login audit flush failed")
+            finally:
+                # This thread owns its own connection; don't leave it open
+                connections.close_all()
+
+
+def link_users(events, batch_size=500):
+    """Set the user of failed attempts whose identifier names an account."""
+    unlinked = [event for event in events if event.user_id is None]
+    for start in range(0, len(unlinked), batch_size):
+        batch = unlinked[start:start + batch_size]
+        # The identifier is stored normalized like a service number; it may
+        # also be a username (see CodeBackend.get_login_user)
+        identifiers = {event.username for event in batch}
+        by_username, by_service_number = {}, {}
+        for pk, service_number, username in User.objects.filter(
+            Q(serviceNumber__in=identifiers) | Q(username__in={identifier.lower() for identifier in identifiers})
+        ).values_list('pk', 'serviceNumber', 'username'):
+            by_service_number[service_number] = pk
+            by_username[username.upper()] = pk
+        for event in batch:
+            event.user_id = by_service_number.get(event.username) or by_username.get(event.username)
+
+
+buffer = AuditBuffer(
+    max_size=getattr(settings, 'LOGIN_AUDIT_BUFFER_SIZE', 100),
+    flush_interval=getattr(settings, 'LOGIN_AUDIT_FLUSH_INTERVAL', 5.0),
+)
+atexit.register(buffer.flush)
+
+
+def get_client_ip(request):
+    return request.META.get('REMOTE_ADDR') or None
+
+
+def record_login_attempt(request, username, user, successful, latency):
+    """Queue one verify-code attempt; latency is in seconds."""
+    if not getattr(settings, 'LOGIN_AUDIT_ENABLED', True):
+        return
+    buffer.record(LoginAttempt(
+        created_at=timezone.now(),
+        username=username[:50],
+        user=user,
+        successful=successful,
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+        latency_ms=round(latency * 1000),
+    ))
+
+
+def flush():
+    """Write buffered events now (tests, shutdown hooks)."""
+    return buffer.flush()
+
+
+# Query API. Every helper filters on a leading indexed column and orders by
+# created_at descending, so it reads an index range instead of the table.
+
+def recent_attempts(since=None, limit=100):
+    queryset = LoginAttempt.objects.order_by('-created_at')
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return queryset[:limit]
+
+
+def attempts_for_username(username, since=None, limit=100):
+    queryset = LoginAttempt.objects.filter(username=username).order_by('-created_at')
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return queryset[:limit]
+
+
+def attempts_from_ip(ip_address, since=None, limit=100):
+    queryset = LoginAttempt.objects.filter(ip_address=ip_address).order_by('-created_at')
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return queryset[:limit]
+
+
+def failed_attempts_count(username, since):
+    return LoginAttempt.objects.filter(
+        username=username, created_at__gte=since, successful=False
+    ).count()
@@ -1,14 +1,91 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from .otp import verify_code
+from .utils import normalize_service_number, normalize_username
 
 User = get_user_model()
 
+# What a login needs: the hashed code to check, and the fields
+# CodeVerificationView returns. Everything else stays deferred.
+LOGIN_FIELDS = ('serviceNumber', 'username', 'name', 'email', 'phone', 'profile_image', 'code', 'is_active')
+
 class CodeBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None or password is None:
+            return None
+        user = self.get_login_user(username)
+        if user is None:
+            return None
+        # Known user, wrong code or deactivated: stop here instead of letting
+        # ModelBackend look the same user up and hash the code a second time
+        if not self.user_can_authenticate(user):
+            raise PermissionDenied
+        if user.check_password(password):  # This uses our overridden check_password method
+            return user
+        raise PermissionDenied
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None or password is None:
+            return None
+        user = await self.aget_login_user(username)
+        if user is None:
+            return None
+        if not self.user_can_authenticate(user):
+            raise PermissionDenied
+        if await user.acheck_password(password):
+            return user
+        raise PermissionDenied
+
+    def get_login_user(self, username):
+        """
+        Clients log in with either their username or their service number.
+        Both are stored normalized with unique indexes, so one query with
+        two exact index probes resolves either form.
+        """
         try:
-            user = User.objects.get(username=username)
-            if user.check_password(password):  # This uses our overridden check_password method
-                return user
-        except User.DoesNotExist:
+            return User.objects.only(*LOGIN_FIELDS).get(
+                Q(username=normalize_username(username)) |
+                Q(serviceNumber=normalize_service_number(username))
+            )
+        except (User.DoesNotExist, User.MultipleObjectsReturned):
+            return None
+
+    async def aget_login_user(self, username):
+        try:
+            return await User.objects.only(*LOGIN_FIELDS).aget(
+                Q(username=normalize_username(username)) |
+                Q(serviceNumber=normalize_service_number(username))
+            )
+        except (User.DoesNotExist, User.MultipleObjectsReturned):
+            return None
+
+
+class OTPBackend(CodeBackend):
+    """
+    Checks a one-time SMS code (authentication.otp) instead of the user's
+    passcode. CodeVerificationView calls authenticate(username=..., otp=...)
+    when LOGIN_CODE_MODE is 'sms'; the other backends ignore that call.
+    """
+    def authenticate(self, request, username=None, otp=None, **kwargs):
+        if username is None or otp is None:
+            return None
+        user = self.get_login_user(username)
+        if user is None:
+            return None
+        # Checked first, so a deactivated user's code isn't used up
+        if self.user_can_authenticate(user) and verify_code(user.serviceNumber, otp):
+            return user
+        raise PermissionDenied
+
+    async def aauthenticate(self, request, username=None, otp=None, **kwargs):
+        if username is None or otp is None:
+            return None
+        user = await self.aget_login_user(username)
+        if user is None:
             return None
-        return None
+        if self.user_can_authenticate(user) and await sync_to_async(verify_code)(user.serviceNumber, otp):
+            return user
+        raise PermissionDenied
@@ -0,0 +1,204 @@
+"""
+Streaming exports of the user changelist (UserAdmin's export actions).
+
+Rows are read with .iterator() and sent in ROSTER_CHUNK_SIZE batches as
+they arrive, one response chunk per batch. Memory stays flat however many
+users are selected, and the first bytes leave before the last row is read.
+
+CSV is plain RFC 4180 with a UTF-8 byte order mark, which Excel needs to
+read names outside ASCII. XLSX is a zip of XML parts. The worksheet is
+deflated into the zip as rows come in, with data descriptors instead of
+sizes written up front, so no temporary file is needed. Cells hold inline
+strings, so there is no shared-strings table to build in memory either.
+"""
+import csv
+import io
+import re
+import time
+import zipfile
+from datetime import datetime
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# (field, column header); plain_code is left out on purpose
+EXPORT_FIELDS = (
+    ('serviceNumber', 'Service number'),
+    ('name', 'Name'),
+    ('username', 'Username'),
+    ('email', 'Email'),
+    ('phone', 'Phone'),
+    ('is_active', 'Active'),
+    ('is_staff', 'Staff'),
+    ('is_admin', 'Admin'),
+    ('last_login', 'Last login'),
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_rows(queryset):
+    """Batches of EXPORT_FIELDS value tuples, in the queryset's order."""
+    chunk_size = settings.ROSTER_CHUNK_SIZE
+    rows = queryset.values_list(*(field for field, _ in EXPORT_FIELDS)).iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        yield batch
+
+
+def format_datetime(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# A spreadsheet evaluates a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+PHONE_RE = re.compile(r'^\+\d+$')
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not PHONE_RE.match(value):
+        return "'" + value
+    return value
+
+
+def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # byte order mark
+    writer.writerow([header for _, header in EXPORT_FIELDS])
+    for batch in batches:
+        writer.writerows([csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # the header, for an empty export
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Users" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+SHEET_NAME = 'xl/worksheets/sheet1.xml'
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+# XML 1.0 can't carry these control characters, escaped or not
+XML_ILLEGAL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, datetime):
+        value = format_datetime(value)
+    text = escape(XML_ILLEGAL_RE.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+
+class ZipOutput:
+    """A write-only file for zipfile; stream_xlsx() takes what was written after each batch."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_xlsx(batches):
+    output = ZipOutput()
+    # No tell() or seek(): zipfile streams, with a data descriptor per entry
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        info = zipfile.ZipInfo(SHEET_NAME, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w') as sheet:
+            sheet.write((SHEET_START + xlsx_row(header for _, header in EXPORT_FIELDS)).encode())
+            for batch in batches:
+                sheet.write(''.join(xlsx_row(row) for row in batch).encode())
+                if data := output.take():
+                    yield data
+            sheet.write(SHEET_END.encode())
+    yield output.take()
+
+
+async def aiterate_chunks(chunks):
+    # Django's ASGI handler reads a sync iterator into a list before sending
+    # any of it; fetch one chunk at a time in a thread instead
+    fetch = sync_to_async(next)
+    while (chunk := await fetch(chunks, None)) is not None:
+        yield chunk
+
+
+def export_response(request, queryset, format):
+    """A streamed attachment of queryset's users, format 'csv' or 'xlsx'."""
+    writer = stream_csv if format == 'csv' else stream_xlsx
+    chunks = writer(export_rows(queryset))
+    if isinstance(request, ASGIRequest):
+        chunks = aiterate_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = f'attachment; filename="users-{timezone.localdate():%Y%m%d}.{format}"'
+    return response
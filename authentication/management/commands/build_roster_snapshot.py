@@ -0,0 +1,19 @@
+"""
+Build the roster snapshot now (see authentication.snapshots):
+
+    python manage.py build_roster_snapshot
+
+Useful after a deploy or a bulk import that bypassed model signals. The
+running workers pick the new snapshot up from its manifest.
+"""
+from django.core.management.base import BaseCommand
+
+from authentication.snapshots import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write a fresh roster snapshot and make it current.'
+
+    def handle(self, *args, **options):
+        snapshot = build_snapshot()
+        self.stdout.write(f"{snapshot['name']}: {snapshot['count']} users, {snapshot['size']} bytes")
@@ -0,0 +1,89 @@
+"""
+Merge the request profiles written by core.profiling.ProfilingMiddleware
+into one collapsed-stack file ("frame;frame;frame weight" per line,
+weights in microseconds), the input format of flamegraph.pl, inferno and
+speedscope:
+
+    python manage.py collapse_profiles > stacks.folded
+    python manage.py collapse_profiles --path api_auth_users --latest 50 -o users.folded
+    flamegraph.pl stacks.folded > stacks.svg
+
+.folded profiles from the stack sampler are already collapsed. cProfile
+only records caller/callee pairs, not whole stacks, so .prof files are
+collapsed to two-frame "caller;callee" stacks weighted by the callee's self
+time in calls from that caller: the flame graph then shows where self time
+is spent and which call sites spend it. Whole stacks need the sampler.
+"""
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import PROFILE_SUFFIXES, frame_label
+
+
+def read_folded(path, stacks):
+    for line in path.read_text().splitlines():
+        stack, _, weight = line.rpartition(' ')
+        if stack:
+            stacks[stack] += int(weight)
+
+
+def read_cprofile(path, stacks):
+    stats = pstats.Stats(str(path)).stats
+    for func, (_, _, tottime, _, callers) in stats.items():
+        label = frame_label(*func)
+        attributed = 0.0
+        for caller, edge in callers.items():
+            # edge[2] is the self time of func spent in calls from caller
+            stacks[f'{frame_label(*caller)};{label}'] += round(edge[2] * 1e6)
+            attributed += edge[2]
+        if tottime - attributed >= 0.5e-6:
+            # Calls made from outside the profiled code
+            stacks[label] += round((tottime - attributed) * 1e6)
+
+
+class Command(BaseCommand):
+    help = 'Aggregate stored request profiles into a flamegraph-compatible collapsed-stack file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*',
+            help='Profiles to read (default: everything in PROFILING_DIR)',
+        )
+        parser.add_argument('--dir', default=None, help='Profile directory (default: PROFILING_DIR)')
+        parser.add_argument('--path', default=None, help='Only profiles whose file name contains this')
+        parser.add_argument('--latest', type=int, default=None, help='Only the newest N profiles')
+        parser.add_argument('-o', '--output', default=None, help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        if options['files']:
+            paths = [Path(name) for name in options['files']]
+        else:
+            directory = Path(options['dir'] or settings.PROFILING_DIR)
+            if not directory.is_dir():
+                raise CommandError(f'No profile directory at {directory}')
+            paths = sorted(p for p in directory.iterdir() if p.name.endswith(PROFILE_SUFFIXES))
+        if options['path']:
+            paths = [p for p in paths if options['path'] in p.name]
+        if options['latest']:
+            paths = paths[-options['latest']:]
+        if not paths:
+            raise CommandError('No profiles matched')
+
+        stacks = Counter()
+        for path in paths:
+            if path.suffix == '.folded':
+                read_folded(path, stacks)
+            else:
+                read_cprofile(path, stacks)
+
+        lines = [f'{stack} {weight}\n' for stack, weight in sorted(stacks.items()) if weight > 0]
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.writelines(lines)
+        else:
+            self.stdout.write(''.join(lines), ending='')
+        self.stderr.write(f'{len(paths)} profiles, {len(stacks)} distinct stacks')
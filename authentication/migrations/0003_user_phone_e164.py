@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-19 15:12
+
+import authentication.models
+import django.core.validators
+from django.db import migrations, models
+from authentication.utils import (
+    normalize_email, normalize_phone, normalize_service_number, normalize_username
+)
+
+
+def normalize_existing_users(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    fields = ('id', 'username', 'email', 'serviceNumber', 'phone', 'phone_e164')
+    # Rows that only differed in case or spacing would collide on the unique
+    # indexes once normalized. Stop with a list of them before changing
+    # anything, so an operator can merge or rename the accounts first.
+    seen = {'username': {}, 'email': {}, 'serviceNumber': {}}
+    collisions = []
+    for user in User.objects.only(*fields).order_by('pk').iterator():
+        for field, normalize in (
+            ('username', normalize_username), ('email', normalize_email), ('serviceNumber', normalize_service_number),
+        ):
+            value = normalize(getattr(user, field))
+            if value in seen[field]:
+                collisions.append(f'{field} {value!r}: users {seen[field][value]} and {user.pk}')
+            else:
+                seen[field][value] = user.pk
+    if collisions:
+        raise ValueError(
+            'These users would share a login once normalized; resolve them and migrate again:\n  '
+            + '\n  '.join(collisions)
+        )
+
+    for user in User.objects.only(*fields).iterator():
+        values = {
+            'username': normalize_username(user.username),
+            'email': normalize_email(user.email),
+            'serviceNumber': normalize_service_number(user.serviceNumber),
+            'phone_e164': normalize_phone(user.phone),
+        }
+        if any(getattr(user, field) != value for field, value in values.items()):
+            User.objects.filter(pk=user.pk).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_alter_user_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone',
+            field=models.CharField(blank=True, help_text='Phone number (e.g., 08012345678 or +2348012345678)', max_length=14, null=True, validators=[django.core.validators.MinLengthValidator(11, message='Phone Number must be at least 11 characters long.'), authentication.models.validate_nigerian_phone]),
+        ),
+        migrations.RunPython(normalize_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 15:27
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('authentication', '0004_loginattempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_senior',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(serviceNumber__startswith='N/', then=models.Value(True)), default=models.Value(False)), output_field=models.BooleanField()),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='numeric_part',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(serviceNumber__startswith='N/', then=django.db.models.functions.comparison.Cast(django.db.models.functions.text.Substr('serviceNumber', 3, django.db.models.functions.text.Length('serviceNumber')), output_field=models.IntegerField())), default=models.Value(0)), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_superuser', False)), fields=['-is_senior', 'numeric_part', 'serviceNumber'], name='user_roster_order_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 16:48
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+import django.db.models.lookups
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_onetimecode'),
+    ]
+
+    # A generated field can't be altered in place; drop it with its index
+    # and add it back with the new expression
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_roster_order_idx',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='numeric_part',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='numeric_part',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(django.db.models.lookups.Exact(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(django.db.models.functions.text.Substr('serviceNumber', 3), models.Value('0'), models.Value('')), models.Value('1'), models.Value('')), models.Value('2'), models.Value('')), models.Value('3'), models.Value('')), models.Value('4'), models.Value('')), models.Value('5'), models.Value('')), models.Value('6'), models.Value('')), models.Value('7'), models.Value('')), models.Value('8'), models.Value('')), models.Value('9'), models.Value('')), models.Value('')), django.db.models.lookups.GreaterThan(django.db.models.functions.text.Length('serviceNumber'), 2), django.db.models.lookups.LessThanOrEqual(django.db.models.functions.text.Length('serviceNumber'), 11), ('serviceNumber__startswith', 'N/')), then=django.db.models.functions.comparison.Cast(django.db.models.functions.text.Substr('serviceNumber', 3, django.db.models.functions.text.Length('serviceNumber')), output_field=models.IntegerField())), default=models.Value(0)), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_superuser', False)), fields=['-is_senior', 'numeric_part', 'serviceNumber'], name='user_roster_order_idx'),
+        ),
+    ]
@@ -1,8 +1,15 @@
+import functools
+
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Cast, Length, Replace, Substr
+from django.db.models.lookups import Exact, GreaterThan, LessThanOrEqual
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.validators import MinLengthValidator, RegexValidator
 from django.core.exceptions import ValidationError
+from .utils import normalize_email, normalize_phone, normalize_service_number, normalize_username
 
 class UserManager(BaseUserManager):
     def create_user(self, username, code, email=None, phone=None, name=None, serviceNumber=None):
@@ -24,6 +31,16 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
     
+    def roster(self):
+        """Users listed on the roster (no superusers), in roster order."""
+        # is_senior and numeric_part are generated columns; this filter and
+        # ordering match user_roster_order_idx, so no sort step is needed
+        return self.filter(is_superuser=False).order_by('-is_senior', 'numeric_part', 'serviceNumber')
+
+    def get_by_natural_key(self, serviceNumber):
+        # Used by ModelBackend and the admin login; normalize so the lookup
+        # hits the unique index whatever casing or spacing was typed
+        return self.get(serviceNumber=normalize_service_number(serviceNumber))
         
     def create_superuser(self, username, password=None, code=None, email=None, phone=None, name=None, serviceNumber=None):
         """
@@ -62,6 +79,13 @@ def validate_nigerian_phone(value):
         )
         
         
+# What is left of a service number after "N/" once its digits are removed:
+# '' for a plain number (or none at all). Nested REPLACE works in every backend's SQL.
+SERVICE_NUMBER_NON_DIGITS = functools.reduce(
+    lambda text, digit: Replace(text, Value(digit), Value('')), '0123456789', Substr('serviceNumber', 3),
+)
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=100, blank=True, null=True)
     serviceNumber = models.CharField(max_length=20, unique=True)
@@ -77,7 +101,38 @@ class User(AbstractBaseUser, PermissionsMixin):
         ],
         help_text="Phone number (e.g., 08012345678 or +2348012345678)"
     )
+    # Canonical E.164 form of phone, kept in sync by save() for indexed lookups
+    phone_e164 = models.CharField(max_length=14, blank=True, null=True, db_index=True, editable=False)
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
+    # Roster sort keys (see UserListView): seniors ("N/") first, by the numeric
+    # part of their service number (0 when it isn't a plain number). Computed
+    # by the database, so the roster is read in order off
+    # user_roster_order_idx instead of being sorted.
+    is_senior = models.GeneratedField(
+        expression=Case(When(serviceNumber__startswith='N/', then=Value(True)), default=Value(False)),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+    numeric_part = models.GeneratedField(
+        expression=Case(
+            # Only all-digit numbers that fit an integer: on PostgreSQL a
+            # failing cast would reject the row, not just sort it last. Plain
+            # SQL only; a regex would need Django's REGEXP function on SQLite,
+            # and then nothing else could write to the table.
+            When(
+                Q(
+                    Exact(SERVICE_NUMBER_NON_DIGITS, Value('')),
+                    GreaterThan(Length('serviceNumber'), 2),
+                    LessThanOrEqual(Length('serviceNumber'), 11),
+                    serviceNumber__startswith='N/',
+                ),
+                then=Cast(Substr('serviceNumber', 3, Length('serviceNumber')), output_field=models.IntegerField()),
+            ),
+            default=Value(0),
+        ),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
     
     # Admin fields
     is_active = models.BooleanField(default=True)
@@ -88,6 +143,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ['username', 'code', 'name', 'email', 'phone']
     
     objects = UserManager()
+
+    class Meta:
+        indexes = [
+            # Same filter and ordering as UserListView.get_queryset()
+            models.Index(
+                fields=['-is_senior', 'numeric_part', 'serviceNumber'],
+                name='user_roster_order_idx',
+                condition=Q(is_superuser=False),
+            ),
+        ]
     
     def __str__(self):
         return self.username
@@ -103,6 +168,13 @@ class User(AbstractBaseUser, PermissionsMixin):
         Override the check_password method to use the code field instead
         """
         return check_password(raw_code, self.code)
+
+    async def acheck_password(self, raw_code):
+        """
+        check_password() off the event loop: hashing the code is the slow,
+        CPU-bound part of a login, and hashlib releases the GIL for it
+        """
+        return await sync_to_async(check_password, thread_sensitive=False)(raw_code, self.code)
         
     def set_password(self, raw_code):
         """
@@ -113,7 +185,50 @@ class User(AbstractBaseUser, PermissionsMixin):
         self._password = None
     
     def save(self, *args, **kwargs):
-        self.username = self.username.lower()
-        self.email = self.email.lower()
-        self.serviceNumber = self.serviceNumber.upper()
+        self.username = normalize_username(self.username)
+        self.email = normalize_email(self.email)
+        self.serviceNumber = normalize_service_number(self.serviceNumber)
+        self.phone_e164 = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_e164'}
         super().save(*args, **kwargs)
+
+
+class LoginAttempt(models.Model):
+    """
+    One verify-code attempt. Written in batches by authentication.audit,
+    never on the request path.
+    """
+    created_at = models.DateTimeField()
+    username = models.CharField(max_length=50)  # service number, or the submitted identifier normalized like one
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='login_attempts')
+    successful = models.BooleanField()
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    latency_ms = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='loginattempt_created_idx'),
+            models.Index(fields=['username', '-created_at'], name='loginattempt_username_idx'),
+            models.Index(fields=['ip_address', '-created_at'], name='loginattempt_ip_idx'),
+        ]
+
+    def __str__(self):
+        outcome = 'success' if self.successful else 'failure'
+        return f"{self.username} {outcome} at {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+
+class OneTimeCode(models.Model):
+    """
+    Database copy of a live SMS login code (see authentication.otp), read
+    when the cache doesn't have it. Holds a keyed hash, never the code.
+    """
+    service_number = models.CharField(max_length=20, unique=True)
+    code_hash = models.CharField(max_length=64)
+    expires_at = models.DateTimeField(db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.service_number} until {self.expires_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,122 @@
+"""
+One-time login codes sent by SMS (LOGIN_CODE_MODE = 'sms').
+
+check-username calls issue_code(). It passes the database write and the
+SMS to the dispatcher thread (authentication.sms), so the request never
+waits on the provider. verify-code checks the code through OTPBackend,
+which calls verify_code().
+
+The OneTimeCode table is the only record of a live code: a per-process
+cache would let each worker accept the same code once. The row holds a
+keyed hash and is written before the SMS is sent, so a code the user has
+received can always be found. Using a code is one conditional DELETE, so
+of two concurrent requests only one gets the row. Codes expire after
+OTP_TTL seconds and are locked after OTP_MAX_ATTEMPTS wrong guesses,
+counted on the row. The cache only holds the resend timer, which at worst
+lets each worker send one extra SMS.
+"""
+import logging
+import secrets
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from . import sms
+from .models import OneTimeCode
+
+logger = logging.getLogger(__name__)
+
+
+def resend_key(service_number):
+    return f'otp:sent:{service_number}'
+
+
+def generate_code():
+    return f'{secrets.randbelow(10 ** settings.OTP_LENGTH):0{settings.OTP_LENGTH}d}'
+
+
+def hash_code(service_number, code):
+    # A keyed HMAC rather than a password hasher: the code lives for minutes
+    # and guesses are capped by the attempt counter, so PBKDF2 would only
+    # add latency
+    return salted_hmac('authentication.otp', f'{service_number}:{code}', algorithm='sha256').hexdigest()
+
+
+def issue_code(service_number, phone):
+    """
+    Send a new code to phone unless one went out in the last
+    OTP_RESEND_INTERVAL seconds. Returns True if a code is on its way.
+    """
+    if not phone:
+        return False
+    if not cache.add(resend_key(service_number), True, settings.OTP_RESEND_INTERVAL):
+        return True
+    code = generate_code()
+    code_hash = hash_code(service_number, code)
+    expires_at = timezone.now() + timedelta(seconds=settings.OTP_TTL)
+    message = settings.OTP_MESSAGE.format(code=code, minutes=settings.OTP_TTL // 60)
+    return sms.dispatch(deliver_code, service_number, code_hash, expires_at, phone, message)
+
+
+def deliver_code(service_number, code_hash, expires_at, phone, message):
+    """Dispatcher job: store the code in the database, then send it."""
+    try:
+        OneTimeCode.objects.bulk_create(
+            [OneTimeCode(service_number=service_number, code_hash=code_hash, expires_at=expires_at)],
+            update_conflicts=True,
+            unique_fields=['service_number'],
+            update_fields=['code_hash', 'expires_at', 'attempts'],
+        )
+        OneTimeCode.objects.filter(expires_at__lt=timezone.now()).delete()
+    except DatabaseError:
+        # A code that can't be verified isn't worth sending; let the user
+        # ask for another one straight away
+        logger.exception("Could not store the login code for %s", service_number)
+        cache.delete(resend_key(service_number))
+        return
+    sms.send_sms(phone, message)
+
+
+def verify_code(service_number, code):
+    """True if code is service_number's live code; the code is then used up."""
+    try:
+        used, _ = OneTimeCode.objects.filter(
+            service_number=service_number,
+            code_hash=hash_code(service_number, code),
+            expires_at__gt=timezone.now(),
+            attempts__lt=settings.OTP_MAX_ATTEMPTS,
+        ).delete()
+    except DatabaseError:
+        logger.exception("Could not check the login code for %s", service_number)
+        return False
+    if used:
+        return True
+    record_failure(service_number)
+    return False
+
+
+def record_failure(service_number):
+    """Count a wrong guess on the row; the code is deleted at OTP_MAX_ATTEMPTS."""
+    try:
+        codes = OneTimeCode.objects.filter(service_number=service_number)
+        if codes.update(attempts=F('attempts') + 1):
+            codes.filter(attempts__gte=settings.OTP_MAX_ATTEMPTS).delete()
+    except DatabaseError:
+        logger.exception("Could not count a wrong login code for %s", service_number)
+
+
+def discard_codes(service_numbers):
+    """
+    Reset the resend timers of service_numbers, ROSTER_CHUNK_SIZE users per
+    delete_many(), so a new code can be sent at once. Their OneTimeCode rows
+    are the caller's to delete, with one DELETE for the whole selection.
+    """
+    service_numbers = iter(service_numbers)
+    while batch := list(islice(service_numbers, settings.ROSTER_CHUNK_SIZE)):
+        cache.delete_many([resend_key(service_number) for service_number in batch])
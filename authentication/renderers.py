@@ -0,0 +1,53 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it the renderer is not offered
+    msgpack = None
+
+
+def to_columnar(data):
+    """
+    Turn a list of flat objects into {"fields": [...], "rows": [[...], ...]}.
+    Anything else (error payloads, single objects) is returned unchanged.
+    """
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        return data
+    fields = list(data[0]) if data else []
+    return {
+        'fields': fields,
+        'rows': [[item.get(field) for field in fields] for item in data],
+    }
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    JSON with field names sent once instead of repeated in every row.
+    Requested with `Accept: application/vnd.naim.columnar+json`.
+    """
+    media_type = 'application/vnd.naim.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Binary MessagePack encoding, requested with `Accept: application/msgpack`.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+# Extra renderers offered by list endpoints on top of the project defaults
+COMPACT_RENDERER_CLASSES = [ColumnarJSONRenderer]
+if msgpack is not None:
+    COMPACT_RENDERER_CLASSES.append(MessagePackRenderer)
@@ -1,11 +1,26 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import User
+from .utils import normalize_service_number
 
 
 # serializers for two-step login
 class UsernameCheckSerializer(serializers.Serializer):
     username = serializers.CharField(max_length=50)
 
+    def validate_username(self, value):
+        # The "username" sent in step 1 is a service number
+        return normalize_service_number(value)
+
+
+# serializer for checking many service numbers in one request
+class BatchUsernameCheckSerializer(serializers.Serializer):
+    usernames = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        allow_empty=False,
+        max_length=settings.CHECK_USERNAME_BATCH_LIMIT,
+    )
+
 
 # serializers for code verification
 class CodeVerificationSerializer(serializers.Serializer):
@@ -31,3 +46,35 @@ class UserListSerializer(serializers.ModelSerializer):
     
 #     def create(self, validated_data):
 #         return User.objects.create_user(**validated_data)
+
+
+def roster_row_serializer(request=None):
+    """
+    Returns a function turning one values_list(*UserListSerializer.Meta.fields)
+    row into the dict UserListSerializer would produce for that user.
+    """
+    fields = UserListSerializer.Meta.fields
+    image_index = fields.index('profile_image')
+    storage = User._meta.get_field('profile_image').storage
+
+    def serialize_row(row):
+        item = dict(zip(fields, row))
+        name = row[image_index]
+        if name:
+            url = storage.url(name)
+            item['profile_image'] = request.build_absolute_uri(url) if request is not None else url
+        else:
+            item['profile_image'] = None
+        return item
+
+    return serialize_row
+
+
+def serialize_roster(rows, request=None):
+    """
+    UserListSerializer(many=True) output built straight from
+    values_list(*UserListSerializer.Meta.fields) rows, without creating a
+    User instance per row. The two must stay in step; tests compare them.
+    """
+    serialize_row = roster_row_serializer(request)
+    return [serialize_row(row) for row in rows]
@@ -1,25 +1,145 @@
+"""
+Outgoing SMS.
+
+send_sms() delivers one message through the backend named by SMS_BACKEND:
+
+    authentication.sms.SmartSMSBackend   Smart SMS Solutions HTTP API
+    authentication.sms.LocMemBackend     appends to sms.outbox; for tests
+                                         and benchmarks
+
+dispatch() hands a job (usually one that ends in send_sms) to this worker's
+SMS thread, so the request that triggered it never waits on the provider.
+At most SMS_QUEUE_SIZE jobs wait; beyond that they are dropped and logged.
+"""
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+
 import requests
 from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
 
-def send_sms(phone_number, message):
+logger = logging.getLogger(__name__)
+
+# Messages "sent" through LocMemBackend, like django.core.mail.outbox
+outbox = []
+
+
+class SmartSMSBackend:
     """
     Send SMS using Smart SMS Solution API
     """
     api_url = "https://app.smartsmssolutions.com/io/api/client/v1/sms/"
-    
-    params = {
-        'token': settings.SMS_API_TOKEN,
-        'sender': settings.SMS_SENDER_ID,
-        'to': phone_number,
-        'message': message,
-        'type': '0',  # 0 for plain text
-        'routing': '3'  # Route to Nigeria
-    }
-    
-    try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f"SMS sending failed: {e}")
-        return None
\ No newline at end of file
+
+    def __init__(self):
+        # One keep-alive connection per worker instead of a TLS handshake per message
+        self.session = requests.Session()
+
+    def send(self, phone_number, message):
+        params = {
+            'token': settings.SMS_API_TOKEN,
+            'sender': settings.SMS_SENDER_ID,
+            'to': phone_number,
+            'message': message,
+            'type': '0',  # 0 for plain text
+            'routing': '3'  # Route to Nigeria
+        }
+        try:
+            response = self.session.get(self.api_url, params=params, timeout=settings.SMS_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+        except requests.RequestException:
+            logger.exception("SMS sending failed")
+            return None
+
+
+class LocMemBackend:
+    """
+    Keeps messages in outbox instead of sending them. SMS_LOCMEM_DELAY
+    seconds of sleep stand in for the provider's round trip.
+    """
+
+    def send(self, phone_number, message):
+        if settings.SMS_LOCMEM_DELAY:
+            time.sleep(settings.SMS_LOCMEM_DELAY)
+        outbox.append({'to': phone_number, 'message': message})
+        return {'status': 'ok'}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _get_backend(settings.SMS_BACKEND)
+
+
+def send_sms(phone_number, message):
+    """Send one message now, on the calling thread."""
+    return get_backend().send(phone_number, message)
+
+
+class Dispatcher:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.queue = None
+        self.pid = None
+
+    def submit(self, func, *args):
+        jobs = self._ensure_worker()
+        try:
+            jobs.put_nowait((func, args))
+        except queue.Full:
+            logger.error("SMS queue full, dropping %s", func.__name__)
+            return False
+        return True
+
+    def join(self):
+        """Block until every queued job has run (tests, benchmarks)."""
+        if self.pid == os.getpid():
+            self.queue.join()
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so start one per worker process,
+        # lazily, after gunicorn has forked
+        pid = os.getpid()
+        if self.pid == pid:
+            return self.queue
+        with self.lock:
+            if self.pid != pid:
+                self.queue = queue.Queue(self.max_size)
+                threading.Thread(target=self._run, args=(self.queue,), name='sms-dispatcher', daemon=True).start()
+                self.pid = pid
+        return self.queue
+
+    def _run(self, jobs):
+        while True:
+            func, args = jobs.get()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("SMS job %s failed", func.__name__)
+            finally:
+                # Jobs may touch the database; don't leave this thread's connection open
+                connections.close_all()
+                jobs.task_done()
+
+
+dispatcher = Dispatcher(max_size=getattr(settings, 'SMS_QUEUE_SIZE', 1000))
+
+
+def dispatch(func, *args):
+    """
+    Run func(*args) on the SMS thread, or inline when SMS_DISPATCH_ASYNC
+    is off. Returns False if the job was dropped.
+    """
+    if not settings.SMS_DISPATCH_ASYNC:
+        func(*args)
+        return True
+    return dispatcher.submit(func, *args)
@@ -0,0 +1,372 @@
+"""
+Precomputed roster snapshots.
+
+The roster (UserListView) changes a few times a day and is read thousands
+of times. build_snapshot() renders it once, as users/ would, and writes
+it to ROSTER_SNAPSHOT_DIR:
+
+    roster.<hash>.json        the roster, named by a hash of its content
+    roster.<hash>.json.gz     precompressed copies for clients that accept
+    roster.<hash>.json.br     gzip or brotli
+    roster.json               the manifest: which snapshot is current
+
+Each file is written under a temporary name and renamed into place, so
+readers never see a partial file. The manifest is replaced last. Builds
+take an flock on roster.lock in the directory and read the roster only
+once they hold it, so when workers build at the same time the manifest
+they leave behind comes from the last read.
+
+users/snapshot/ gives an authenticated client a URL for the current
+snapshot, signed and valid for ROSTER_SNAPSHOT_URL_MAX_AGE seconds.
+SnapshotMiddleware checks the signature and sends the file through
+WhiteNoise (precompressed variant, ETag, Range) without reaching a view,
+the ORM or a serializer. A superseded snapshot is kept until URLs signed
+for it have expired.
+
+Saving or deleting a User schedules a rebuild. It runs on a per-process
+thread once no change has come in for ROSTER_SNAPSHOT_DEBOUNCE seconds,
+or at most ROSTER_SNAPSHOT_MAX_DELAY seconds after the first change, so a
+burst of edits costs one rebuild. Code that changes users through
+queryset.update() or bulk_create() sends no signals and must call
+schedule_rebuild() itself.
+
+Profile image URLs in a snapshot are relative (/media/...). The snapshot
+is shared by every client, so it can't carry any one request's host.
+"""
+import atexit
+import contextlib
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .models import User
+from .serializers import UserListSerializer, serialize_roster
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; clients then get gzip
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where only one process builds anyway
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'roster.json'
+LOCK_NAME = 'roster.lock'
+SNAPSHOT_RE = re.compile(r'^roster\.[0-9a-f]{12}\.json$')
+
+signer = signing.TimestampSigner(salt='authentication.snapshots')
+
+
+def snapshot_dir():
+    return Path(settings.ROSTER_SNAPSHOT_DIR)
+
+
+def write_atomic(path, content):
+    """Write content to path through a temporary file in the same directory."""
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+_build_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def directory_lock(directory):
+    """Hold the build lock of directory, shared by every process on the host."""
+    with open(directory / LOCK_NAME, 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)  # released when the file is closed
+        yield
+
+
+def build_snapshot():
+    """Write a snapshot of the current roster and make it current; returns its manifest."""
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with _build_lock, directory_lock(directory):
+        # Read under the lock: a build that read earlier can't replace the
+        # manifest of one that read later
+        rows = User.objects.roster().values_list(*UserListSerializer.Meta.fields).iterator(
+            chunk_size=settings.ROSTER_CHUNK_SIZE
+        )
+        roster = serialize_roster(rows)
+        content = JSONRenderer().render(roster)
+        digest = hashlib.sha256(content).hexdigest()
+        name = f'roster.{digest[:12]}.json'
+        path = directory / name
+        if not path.exists():
+            # The variants first: once the plain file exists WhiteNoise serves them
+            write_atomic(path.with_name(name + '.gz'), gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write_atomic(
+                    path.with_name(name + '.br'),
+                    brotli.compress(content, quality=settings.ROSTER_SNAPSHOT_BROTLI_QUALITY),
+                )
+            write_atomic(path, content)
+
+        previous = current_snapshot()
+        manifest = {
+            'name': name,
+            'hash': digest,
+            'count': len(roster),
+            'size': len(content),
+            'builtAt': timezone.now().isoformat(),
+        }
+        write_atomic(directory / MANIFEST_NAME, json.dumps(manifest).encode())
+        if previous is not None and previous['name'] != name:
+            retire(directory, previous['name'])
+        prune(directory, name)
+        return manifest
+
+
+def retire(directory, name):
+    # A retired snapshot's mtime records when it stopped being current,
+    # which is what prune() ages it by
+    for suffix in ('', '.gz', '.br'):
+        try:
+            os.utime(directory / (name + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def prune(directory, current):
+    """Delete superseded snapshots once every URL signed for them has expired."""
+    cutoff = time.time() - settings.ROSTER_SNAPSHOT_URL_MAX_AGE
+    for entry in os.scandir(directory):
+        if not SNAPSHOT_RE.match(entry.name) or entry.name == current:
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        for suffix in ('', '.gz', '.br'):
+            try:
+                os.unlink(directory / (entry.name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+_manifest = (None, None)
+
+
+def current_snapshot():
+    """The manifest of the current snapshot, or None if none has been built."""
+    global _manifest
+    path = snapshot_dir() / MANIFEST_NAME
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # One stat per call; the file is only read again after it's replaced
+    key = (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+    cached_key, manifest = _manifest
+    if cached_key != key:
+        manifest = json.loads(path.read_bytes())
+        _manifest = (key, manifest)
+    return manifest
+
+
+def signed_path(name):
+    """Path of snapshot name with a signature that expires after ROSTER_SNAPSHOT_URL_MAX_AGE."""
+    token = signer.sign(name)[len(name) + 1:]
+    return f"/{settings.ROSTER_SNAPSHOT_URL.lstrip('/')}{name}?token={token}"
+
+
+def check_signature(name, token):
+    try:
+        signer.unsign(f'{name}:{token}', max_age=settings.ROSTER_SNAPSHOT_URL_MAX_AGE)
+    except signing.BadSignature:  # includes SignatureExpired
+        return False
+    return True
+
+
+class SnapshotMiddleware:
+    """
+    Serves signed snapshot URLs. It sits at the top of the stack with
+    MediaMiddleware, so a snapshot download skips everything below it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.ROSTER_SNAPSHOT_URL.lstrip('/')
+        # autorefresh makes WhiteNoise look for files per request (a few
+        # stats): snapshots appear after start-up
+        self.files = WhiteNoise(
+            None, autorefresh=True, allow_all_origins=False,
+            add_headers_function=self.add_cache_headers,
+        )
+        self.files.add_files(settings.ROSTER_SNAPSHOT_DIR, prefix=self.prefix)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path_info.startswith(self.prefix):
+            return self.serve(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.prefix):
+            return self.serve(request)
+        return await self.get_response(request)
+
+    def serve(self, request):
+        path = request.path_info
+        name = path[len(self.prefix):]
+        if request.method not in ('GET', 'HEAD') or not SNAPSHOT_RE.match(name):
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        if not check_signature(name, request.GET.get('token', '')):
+            return JsonResponse({'detail': 'Snapshot link is invalid or has expired.'}, status=403)
+        static_file = self.files.find_file(path)
+        if static_file is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return WhiteNoiseMiddleware.serve(static_file, request)
+
+    @staticmethod
+    def add_cache_headers(headers, path, url):
+        # The content never changes under a name, but it is personal data
+        headers['Cache-Control'] = f'private, max-age={settings.ROSTER_SNAPSHOT_URL_MAX_AGE}'
+
+
+class Debouncer:
+    """Calls func on a per-process thread once trigger() calls stop coming."""
+
+    def __init__(self, func, delay, max_delay):
+        self.func = func
+        self.delay = delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.condition = None
+        self.pid = None
+        # Monotonic times of the first and the latest change not yet built
+        self.first = self.last = None
+
+    def trigger(self):
+        condition = self._ensure_worker()
+        with condition:
+            now = time.monotonic()
+            if self.first is None:
+                self.first = now
+            self.last = now
+            condition.notify()
+
+    def flush(self):
+        """Run func now if a change is pending in this process (exit, tests)."""
+        if self.pid != os.getpid():
+            return
+        with self.condition:
+            pending = self.first is not None
+            self.first = self.last = None
+        if pending:
+            self._call()
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so start one per worker process,
+        # lazily, after gunicorn has forked
+        pid = os.getpid()
+        if self.pid == pid:
+            return self.condition
+        with self.lock:
+            if self.pid != pid:
+                self.condition = threading.Condition()
+                self.first = self.last = None
+                threading.Thread(target=self._run, args=(self.condition,), name='roster-snapshot', daemon=True).start()
+                # A daemon thread dies with the process: don't lose a
+                # pending rebuild when a command or worker exits
+                atexit.register(self.flush)
+                self.pid = pid
+        return self.condition
+
+    def _run(self, condition):
+        while True:
+            with condition:
+                while self.first is None:
+                    condition.wait()
+                while self.first is not None:
+                    remaining = min(self.last + self.delay, self.first + self.max_delay) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    condition.wait(remaining)
+                if self.first is None:
+                    continue  # flushed while waiting
+                self.first = self.last = None
+            self._call()
+
+    def _call(self):
+        try:
+            self.func()
+        except Exception:
+            logger.exception("Roster snapshot rebuild failed")
+        finally:
+            connections.close_all()
+
+
+debouncer = Debouncer(
+    build_snapshot,
+    delay=getattr(settings, 'ROSTER_SNAPSHOT_DEBOUNCE', 2.0),
+    max_delay=getattr(settings, 'ROSTER_SNAPSHOT_MAX_DELAY', 30.0),
+)
+
+
+def schedule_rebuild():
+    """
+    Rebuild the snapshot after the current transaction commits, debounced.
+    With ROSTER_SNAPSHOT_DEBOUNCE = 0 it is rebuilt on commit, inline.
+    """
+    if settings.ROSTER_SNAPSHOT_DEBOUNCE:
+        transaction.on_commit(debouncer.trigger)
+    else:
+        transaction.on_commit(build_snapshot)
+
+
+# Columns a snapshot is made of; saves that touch none of them (last_login
+# on every admin login, for one) don't change it
+SNAPSHOT_FIELDS = {*UserListSerializer.Meta.fields, 'is_superuser', 'serviceNumber'}
+
+
+@receiver(post_save, sender=User, dispatch_uid='roster-snapshot-save')
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and SNAPSHOT_FIELDS.isdisjoint(update_fields):
+        return
+    schedule_rebuild()
+
+
+@receiver(post_delete, sender=User, dispatch_uid='roster-snapshot-delete')
+def user_deleted(sender, instance, **kwargs):
+    schedule_rebuild()
@@ -0,0 +1,30 @@
+"""
+Test data shared by the test suite and the benchmarks in benchmarks/.
+"""
+
+
+def seed_users(count, batch_size=5000, code='123456'):
+    """
+    Bulk insert count ordinary users sharing one passcode. The passcode is
+    hashed once, so seeding a million rows takes seconds, not hours.
+    Service numbers alternate between the senior "N/<n>" form and "NA/<n>".
+    """
+    from django.contrib.auth.hashers import make_password
+    from authentication.models import User
+    from authentication.utils import normalize_phone
+
+    hashed = make_password(code)
+    for start in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(
+                username=f'officer{i}',
+                name=f'Officer {i}',
+                serviceNumber=f'N/{i}' if i % 2 else f'NA/{i}',
+                email=f'officer{i}@example.com',
+                phone=f'0803{i % 10_000_000:07d}',
+                phone_e164=normalize_phone(f'0803{i % 10_000_000:07d}'),
+                code=hashed,
+                plain_code=code,
+            )
+            for i in range(start, min(start + batch_size, count))
+        ], batch_size=batch_size)
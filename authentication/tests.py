@@ -1,3 +1,1246 @@
-from django.test import TestCase
+"""
+Tests of the authentication app and the core middleware it is served through.
 
-# Create your tests here.
+QueryBudgetTests holds the query budgets for every endpoint and admin page.
+Each test issues one request against a seeded database and fails when it
+runs more queries or spends more time in the database than its budget.
+Time depends on the machine and its load, so it is only checked against
+QUERY_BUDGET_DB_SLACK (default 5) times the budget. The plan of every query
+is compared with the snapshot in query_plans.json, and any full scan of the
+user table fails unless the page reads the whole roster by design.
+
+Test classes that log in use IsolatedAuditMixin: their audit events are
+only written by explicit audit.flush() calls.
+
+After an intended change to queries or indexes, refresh the snapshot:
+
+    UPDATE_QUERY_PLANS=1 python manage.py test authentication
+"""
+import asyncio
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipIf
+from xml.etree import ElementTree
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import warmup
+from core.concurrency import AIMDLimit, ConcurrencyLimitMiddleware
+from core.media import MediaMiddleware
+from core.middleware import CompressionMiddleware, negotiate_encoding
+from core.profiling import PROFILE_SUFFIXES, ProfilingMiddleware
+from core.querylog import QueryLog, full_scans
+
+from .backends import CodeBackend
+from . import async_views, audit, exports, sms, snapshots, views
+from .models import LoginAttempt, OneTimeCode, User
+from .renderers import to_columnar
+from .serializers import UserListSerializer, serialize_roster
+from .testing import seed_users
+from .throttling import UsernameCheckRateThrottle
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PLANS_FILE = Path(__file__).resolve().parent / 'query_plans.json'
+UPDATE_PLANS = os.environ.get('UPDATE_QUERY_PLANS', '').lower() in ('1', 'true', 'yes')
+DB_TIME_SLACK = float(os.environ.get('QUERY_BUDGET_DB_SLACK', '5'))
+USER_TABLE = User._meta.db_table
+
+SEEDED_USERS = 2000
+SEEDED_ATTEMPTS = 5000
+
+
+class IsolatedAuditMixin:
+    """
+    Gives each test its own login audit buffer, written only by explicit
+    audit.flush() calls. The process-wide flusher thread never sees the
+    events a test records, so it can't write them behind the test's back.
+    """
+
+    def setUp(self):
+        super().setUp()
+        buffer = audit.AuditBuffer(max_size=10 ** 6, flush_interval=3600)
+        for patcher in (mock.patch.object(buffer, '_ensure_flusher'), mock.patch.object(audit, 'buffer', buffer)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+def read_body(response):
+    """The body of a response, including one streamed from an async iterator."""
+    if getattr(response, 'is_async', False):
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(collect)()
+    return response.getvalue()
+
+
+@override_settings(
+    # Hashing cost is not what these tests measure
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(IsolatedAuditMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(PLANS_FILE) as f:
+            cls.snapshot = json.load(f)
+        cls.observed = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_PLANS:
+            cls.snapshot.setdefault(connection.vendor, {}).update(cls.observed)
+            with open(PLANS_FILE, 'w') as f:
+                json.dump(cls.snapshot, f, indent=2, sort_keys=True)
+                f.write('\n')
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(SEEDED_USERS)
+        cls.user = User.objects.get(serviceNumber='N/1')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', serviceNumber='N/999999', code='654321',
+        )
+        now = timezone.now()
+        LoginAttempt.objects.bulk_create([
+            LoginAttempt(
+                created_at=now - timedelta(minutes=i),
+                username=f'N/{i % SEEDED_USERS}',
+                successful=bool(i % 4),
+                ip_address=f'10.0.{i // 250 % 250}.{i % 250}',
+                user_agent='python-requests/2.32',
+                latency_ms=40,
+            )
+            for i in range(SEEDED_ATTEMPTS)
+        ])
+        if connection.vendor == 'postgresql':
+            # Plans depend on table statistics; give the planner real ones
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertWithinBudget(self, name, request, max_queries, max_db_ms, reads_all_users=False):
+        """
+        Run request() and check its queries against the budget and the plan
+        snapshot. Returns the response body.
+        """
+        with QueryLog() as log:
+            response = request()
+            # Streamed bodies can query while they are consumed
+            content = read_body(response)
+        self.assertLess(response.status_code, 400, content[:500])
+
+        queries = '\n'.join(query.sql for query in log.queries)
+        self.assertLessEqual(log.count, max_queries, f'{name} ran {log.count} queries:\n{queries}')
+        # Budgets are what the query costs on a developer machine; CI and
+        # loaded machines get DB_TIME_SLACK times as long
+        self.assertLessEqual(
+            log.duration * 1000, max_db_ms * DB_TIME_SLACK,
+            f'{name} spent {log.duration * 1000:.1f} ms in the database (budget {max_db_ms} ms)',
+        )
+
+        plans = [{'sql': sql, 'plan': plan} for sql, plan in log.plans()]
+        if not reads_all_users:
+            for entry in plans:
+                scans = full_scans(entry['plan'], USER_TABLE, connection.vendor)
+                self.assertFalse(scans, f"{name} scans {USER_TABLE}:\n{entry['sql']}\n{scans}")
+
+        self.observed[name] = plans
+        expected = self.snapshot.get(connection.vendor, {}).get(name)
+        if not UPDATE_PLANS and expected is not None:
+            self.assertEqual(expected, plans, f'Query plans of {name} changed; see {PLANS_FILE.name}')
+        return content
+
+    # API
+
+    def test_check_username(self):
+        self.assertWithinBudget(
+            'check-username',
+            lambda: self.client.post('/api/auth/check-username/', {'username': ' n/17 '}),
+            max_queries=1, max_db_ms=5,
+        )
+
+    def test_check_username_batch(self):
+        usernames = [f'N/{n}' for n in range(1, 1000, 2)]
+        content = self.assertWithinBudget(
+            'check-username-batch',
+            lambda: self.client.post(
+                '/api/auth/check-username/batch/', {'usernames': usernames}, content_type='application/json',
+            ),
+            max_queries=1, max_db_ms=10,
+        )
+        self.assertEqual(len(json.loads(content)), len(usernames))
+
+    def test_verify_code(self):
+        self.assertWithinBudget(
+            'verify-code',
+            lambda: self.client.post('/api/auth/verify-code/', {'username': 'N/1', 'code': '123456'}),
+            max_queries=2, max_db_ms=5,
+        )
+
+    def test_verify_code_wrong_code(self):
+        with QueryLog() as log:
+            response = self.client.post('/api/auth/verify-code/', {'username': 'N/1', 'code': '000000'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(log.count, 1)
+
+    def test_verify_code_audit_is_write_behind(self):
+        # Recording an attempt adds no query to the request; the flush is one INSERT
+        for _ in range(3):
+            self.client.post('/api/auth/verify-code/', {'username': 'N/1', 'code': '123456'})
+        with QueryLog() as log:
+            self.assertEqual(audit.flush(), 3)
+        inserts = [query for query in log.queries if query.sql.startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_user_list(self):
+        content = self.assertWithinBudget(
+            'users',
+            lambda: self.client.get('/api/auth/users/', HTTP_AUTHORIZATION=f'Token {self.token.key}'),
+            max_queries=2, max_db_ms=30, reads_all_users=True,
+        )
+        self.assertEqual(len(json.loads(content)), SEEDED_USERS)
+
+    def test_user_list_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(ROSTER_SNAPSHOT_DIR=directory):
+            snapshots.build_snapshot()
+            content = self.assertWithinBudget(
+                'users-snapshot',
+                lambda: self.client.get('/api/auth/users/snapshot/', HTTP_AUTHORIZATION=f'Token {self.token.key}'),
+                max_queries=1, max_db_ms=5,
+            )
+            url = json.loads(content)['url'].removeprefix('http://testserver')
+            content = self.assertWithinBudget(
+                'users-snapshot-file', lambda: self.client.get(url), max_queries=0, max_db_ms=0,
+            )
+        self.assertEqual(len(json.loads(content)), SEEDED_USERS)
+
+    # Admin
+
+    def admin_get(self, path):
+        self.client.force_login(self.admin)
+        return lambda: self.client.get(path)
+
+    def test_admin_index(self):
+        self.assertWithinBudget('admin-index', self.admin_get('/admin/'), max_queries=3, max_db_ms=5)
+
+    def test_admin_user_changelist(self):
+        self.assertWithinBudget(
+            'admin-user-changelist', self.admin_get('/admin/authentication/user/'),
+            max_queries=4, max_db_ms=10,
+        )
+
+    def test_admin_user_change(self):
+        self.assertWithinBudget(
+            'admin-user-change', self.admin_get(f'/admin/authentication/user/{self.user.pk}/change/'),
+            max_queries=3, max_db_ms=5,
+        )
+
+    def test_admin_user_add(self):
+        self.assertWithinBudget(
+            'admin-user-add', self.admin_get('/admin/authentication/user/add/'),
+            max_queries=3, max_db_ms=5,
+        )
+
+    def test_admin_loginattempt_changelist(self):
+        self.assertWithinBudget(
+            'admin-loginattempt-changelist', self.admin_get('/admin/authentication/loginattempt/'),
+            max_queries=4, max_db_ms=30,
+        )
+
+    def test_admin_loginattempt_search(self):
+        self.assertWithinBudget(
+            'admin-loginattempt-search-ip', self.admin_get('/admin/authentication/loginattempt/?q=10.0.1.7'),
+            max_queries=4, max_db_ms=10,
+        )
+        self.assertWithinBudget(
+            'admin-loginattempt-search-service-number',
+            self.admin_get('/admin/authentication/loginattempt/?q=n/17'),
+            max_queries=4, max_db_ms=10,
+        )
+
+    def admin_action(self, action):
+        # "Select all" across the changelist: the action gets every user,
+        # not just the checked row
+        self.client.force_login(self.admin)
+        return lambda: self.client.post('/admin/authentication/user/', {
+            'action': action, 'select_across': '1', 'index': '0', '_selected_action': [self.user.pk],
+        })
+
+    def test_admin_user_deactivate_all(self):
+        self.assertWithinBudget(
+            'admin-user-deactivate-all', self.admin_action('deactivate_users'),
+            max_queries=9, max_db_ms=100, reads_all_users=True,
+        )
+        self.assertEqual(User.objects.filter(is_active=True).get(), self.admin)
+        self.assertFalse(Token.objects.exists())
+
+    def test_admin_user_export_all(self):
+        content = self.assertWithinBudget(
+            'admin-user-export-csv', self.admin_action('export_csv'),
+            max_queries=4, max_db_ms=50, reads_all_users=True,
+        )
+        # Header and every user, admin included
+        self.assertEqual(len(content.decode('utf-8-sig').splitlines()), SEEDED_USERS + 2)
+
+
+class RosterProjectionTests(TestCase):
+    def test_matches_user_list_serializer(self):
+        seed_users(3)
+        User.objects.filter(serviceNumber='N/1').update(profile_image='profile_images/me.0123456789ab.jpg')
+        request = RequestFactory().get('/api/auth/users/')
+        queryset = User.objects.order_by('pk')
+
+        rows = queryset.values_list(*UserListSerializer.Meta.fields)
+        expected = UserListSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(serialize_roster(rows, request), expected)
+        self.assertEqual(
+            serialize_roster(rows), UserListSerializer(queryset, many=True).data,
+        )
+
+    def test_roster_order(self):
+        # Service numbers that aren't a plain number, or overflow an integer,
+        # would fail the numeric_part cast on PostgreSQL; they sort as 0
+        for number in ('N/10', 'N/9', 'N/ABC', 'N/', 'N/12345678901', 'N/1-2', 'NA/3', 'NA/1'):
+            User.objects.create(
+                username=number.lower(), serviceNumber=number, email=f'{number.lower()}@example.com',
+                phone='08031234567', code='x',
+            )
+        self.assertEqual(
+            list(User.objects.roster().values_list('serviceNumber', 'numeric_part')),
+            [
+                ('N/', 0), ('N/1-2', 0), ('N/12345678901', 0), ('N/ABC', 0), ('N/9', 9), ('N/10', 10),
+                ('NA/1', 0), ('NA/3', 0),
+            ],
+        )
+
+    @skipIf(connection.vendor != 'sqlite', 'SQLite only')
+    def test_plain_sqlite_clients_can_write_users(self):
+        # The sqlite3 CLI, backups and restore scripts don't have the
+        # functions Django registers on its connections
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT sql FROM sqlite_master WHERE name = %s', [USER_TABLE])
+            (schema,) = cursor.fetchone()
+        with tempfile.TemporaryDirectory() as directory:
+            copy = sqlite3.connect(Path(directory) / 'copy.sqlite3')
+            try:
+                copy.execute(schema)
+                copy.executemany(
+                    f'INSERT INTO {USER_TABLE} (password, is_superuser, name, "serviceNumber", username, code, '
+                    'plain_code, email, phone, is_active, is_staff, is_admin) '
+                    "VALUES ('', 0, '', ?, ?, '', '', ?, '08031234567', 1, 0, 0)",
+                    [(number, number.lower(), f'{number.lower()}@example.com') for number in ('N/42', 'N/4X2', 'NA/7')],
+                )
+                rows = copy.execute(
+                    f'SELECT "serviceNumber", numeric_part FROM {USER_TABLE} ORDER BY "serviceNumber"'
+                ).fetchall()
+            finally:
+                copy.close()
+        self.assertEqual(rows, [('N/42', 42), ('N/4X2', 0), ('NA/7', 0)])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginLookupTests(IsolatedAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(3)
+
+    def test_username_or_service_number_in_any_case_or_spacing(self):
+        user = User.objects.get(serviceNumber='N/1')
+        backend = CodeBackend()
+        for username in ('officer1', ' OFFICER1 ', 'N/1', ' n/ 1 ', 'n/1'):
+            with self.subTest(username=username):
+                self.assertEqual(backend.get_login_user(username), user)
+                response = self.client.post('/api/auth/verify-code/', {'username': username, 'code': '123456'})
+                self.assertEqual(response.status_code, 200)
+        self.assertIsNone(backend.get_login_user('officer9'))
+
+    def test_ambiguous_identifier_matches_no_one(self):
+        # One user's username is another's service number
+        User.objects.create_user(
+            username='na/2x', code='123456', email='x@example.com', serviceNumber='N/77',
+        )
+        User.objects.filter(serviceNumber='N/77').update(username='n/1')
+        self.assertIsNone(CodeBackend().get_login_user('n/1'))
+        # ModelBackend then resolves it as a service number, the USERNAME_FIELD
+        response = self.client.post('/api/auth/verify-code/', {'username': 'N/1', 'code': '123456'})
+        self.assertEqual(response.json()['serviceNumber'], 'N/1')
+
+    def test_deactivated_user_is_rejected(self):
+        User.objects.filter(serviceNumber='N/1').update(is_active=False)
+        for username in ('N/1', 'officer1'):
+            response = self.client.post('/api/auth/verify-code/', {'username': username, 'code': '123456'})
+            self.assertEqual(response.status_code, 401)
+        view = async_views.CodeVerificationView.as_view()
+        request = RequestFactory().post('/api/auth/verify-code/', {'username': 'N/1', 'code': '123456'})
+        self.assertEqual(async_to_sync(view)(request).status_code, 401)
+
+    def test_backfill_normalizes_and_stops_on_collisions(self):
+        migration = importlib.import_module('authentication.migrations.0003_user_phone_e164')
+        # Rows as they were stored before save() normalized them
+        User.objects.filter(serviceNumber='N/1').update(
+            username=' Officer1', email='Officer1@Example.com ', serviceNumber='n/ 1',
+        )
+        migration.normalize_existing_users(apps, None)
+        user = User.objects.get(serviceNumber='N/1')
+        self.assertEqual((user.username, user.email), ('officer1', 'officer1@example.com'))
+
+        User.objects.filter(serviceNumber='NA/2').update(username='OFFICER1', serviceNumber='na/2')
+        with self.assertRaisesMessage(ValueError, "username 'officer1'"):
+            migration.normalize_existing_users(apps, None)
+        self.assertTrue(User.objects.filter(serviceNumber='na/2').exists())  # nothing changed
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginAuditTests(IsolatedAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(3)
+
+    def attempt(self, username='N/1'):
+        return LoginAttempt(
+            created_at=timezone.now(), username=username, successful=False, latency_ms=1,
+        )
+
+    def test_failed_attempts_are_linked_to_the_account(self):
+        for username, code in [('N/1', '000000'), (' officer2 ', '000000'), ('N/404', '000000'), ('n/1', '123456')]:
+            self.client.post('/api/auth/verify-code/', {'username': username, 'code': code})
+        self.assertEqual(audit.flush(), 4)
+        users = dict(LoginAttempt.objects.values_list('username', 'user__serviceNumber').filter(successful=False))
+        self.assertEqual(users, {'N/1': 'N/1', 'OFFICER2': 'NA/2', 'N/404': None})
+
+    def test_buffer_is_bounded(self):
+        buffer = audit.AuditBuffer(max_size=100, flush_interval=3600, max_pending=3)
+        with mock.patch.object(buffer, '_ensure_flusher'):
+            for n in range(5):
+                buffer.record(self.attempt(f'N/{n}'))
+        self.assertEqual([event.username for event in buffer.events], ['N/2', 'N/3', 'N/4'])
+        self.assertEqual(buffer.dropped, 2)
+
+    def test_unexpected_errors_drop_the_batch(self):
+        buffer = audit.AuditBuffer(max_size=100, flush_interval=3600)
+        buffer.events = [self.attempt()]
+        with mock.patch.object(LoginAttempt.objects, 'bulk_create', side_effect=ValueError), \
+                self.assertLogs('authentication.audit', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.events, [])
+        # A database outage keeps them for the next flush
+        buffer.events = [self.attempt()]
+        with mock.patch.object(LoginAttempt.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('authentication.audit', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer.events), 1)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    LOGIN_CODE_MODE='sms',
+    SMS_BACKEND='authentication.sms.LocMemBackend',
+    # Inline, so the code's row is written inside the test transaction
+    SMS_DISPATCH_ASYNC=False,
+    OTP_MAX_ATTEMPTS=3,
+)
+class OneTimeCodeTests(IsolatedAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(3)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        sms.outbox.clear()
+
+    def request_code(self):
+        response = self.client.post('/api/auth/check-username/', {'username': 'n/1'})
+        self.assertTrue(response.json()['codeSent'])
+        return sms.outbox[-1]['message'].split()[4].rstrip('.')
+
+    def verify(self, code):
+        return self.client.post('/api/auth/verify-code/', {'username': 'N/1', 'code': code})
+
+    def test_code_logs_in_once(self):
+        code = self.request_code()
+        self.assertEqual(sms.outbox[-1]['to'], '08030000001')
+        self.assertEqual(self.verify('123456').status_code, 401)  # the static passcode
+        self.assertEqual(self.verify(code).status_code, 200)
+        self.assertEqual(self.verify(code).status_code, 401)
+        self.assertFalse(OneTimeCode.objects.exists())
+
+    def test_code_is_stored_hashed_and_found_without_the_cache(self):
+        code = self.request_code()
+        self.assertNotIn(code, OneTimeCode.objects.get(service_number='N/1').code_hash)
+        cache.clear()  # another worker, an eviction or a restart
+        self.assertEqual(self.verify(code).status_code, 200)
+
+    def test_used_code_is_rejected_by_every_worker(self):
+        code = self.request_code()
+        # What another worker's local cache still holds after this one used the code
+        cached = cache._cache.copy(), cache._expire_info.copy()
+        self.assertEqual(self.verify(code).status_code, 200)
+        cache._cache.update(cached[0])
+        cache._expire_info.update(cached[1])
+        self.assertEqual(self.verify(code).status_code, 401)
+
+    def test_resend_waits_for_interval(self):
+        self.request_code()
+        self.request_code()
+        self.assertEqual(len(sms.outbox), 1)
+
+    def test_wrong_guesses_lock_the_code(self):
+        code = self.request_code()
+        wrong = f'{(int(code) + 1) % 10 ** 6:06d}'
+        for _ in range(3):
+            self.assertEqual(self.verify(wrong).status_code, 401)
+        self.assertEqual(self.verify(code).status_code, 401)
+
+    def test_attempts_are_counted_across_caches(self):
+        code = self.request_code()
+        wrong = f'{(int(code) + 1) % 10 ** 6:06d}'
+        for _ in range(3):
+            cache.clear()  # each guess on a fresh worker
+            self.assertEqual(self.verify(wrong).status_code, 401)
+        self.assertEqual(self.verify(code).status_code, 401)
+        self.assertFalse(OneTimeCode.objects.exists())
+
+    def test_deactivated_user_gets_no_code(self):
+        code = self.request_code()
+        User.objects.filter(serviceNumber='N/1').update(is_active=False)
+        self.assertEqual(self.verify(code).status_code, 401)
+        self.assertTrue(OneTimeCode.objects.exists())  # not used up by the refused login
+        cache.clear()
+        response = self.client.post('/api/auth/check-username/', {'username': 'N/1'})
+        self.assertIs(response.json()['codeSent'], False)
+        self.assertEqual(len(sms.outbox), 1)
+
+    @override_settings(OTP_TTL=0)
+    def test_expired_code_is_rejected(self):
+        code = self.request_code()
+        self.assertEqual(self.verify(code).status_code, 401)
+
+
+@mock.patch.object(UsernameCheckRateThrottle, 'THROTTLE_RATES', {'check_username': '10/min'})
+class UsernameCheckThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(20)
+
+    def setUp(self):
+        cache.clear()
+
+    def check(self, username='N/1'):
+        return self.client.post('/api/auth/check-username/', {'username': username})
+
+    def check_batch(self, count):
+        usernames = [f'N/{n}' for n in range(count)]
+        return self.client.post(
+            '/api/auth/check-username/batch/', {'usernames': usernames}, content_type='application/json',
+        )
+
+    def test_single_checks(self):
+        for _ in range(10):
+            self.assertEqual(self.check().status_code, 200)
+        response = self.check()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_batch_costs_one_per_entry(self):
+        self.assertEqual(self.check_batch(7).status_code, 200)
+        self.assertEqual(self.check_batch(4).status_code, 429)  # 7 + 4 > 10
+        self.assertEqual(self.check_batch(3).status_code, 200)
+        self.assertEqual(self.check().status_code, 429)
+
+    def test_budget_is_per_client(self):
+        self.check_batch(10)
+        self.assertEqual(self.check().status_code, 429)
+        response = self.client.post('/api/auth/check-username/', {'username': 'N/1'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncViewTests(IsolatedAuditMixin, TestCase):
+    """The async views served under ASGI answer exactly like the sync ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(20)
+        cls.token = Token.objects.create(user=User.objects.get(serviceNumber='N/1'))
+
+    def assertSameResponse(self, name, method, path, data=None, **extra):
+        results = []
+        for module in (views, async_views):
+            cache.clear()  # the check-username throttle
+            view = getattr(module, name).as_view()
+            request = getattr(RequestFactory(), method)(path, data, **extra)
+            with QueryLog() as log:
+                response = async_to_sync(view)(request) if module is async_views else view(request)
+                if hasattr(response, 'render'):
+                    response.render()
+                body = read_body(response)
+            results.append((response.status_code, response.get('Content-Type'), body, log.count))
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_check_username(self):
+        path = '/api/auth/check-username/'
+        self.assertEqual(self.assertSameResponse('UsernameCheckView', 'post', path, {'username': ' n/1 '})[0], 200)
+        self.assertEqual(self.assertSameResponse('UsernameCheckView', 'post', path, {'username': 'N/999'})[0], 404)
+        self.assertEqual(self.assertSameResponse('UsernameCheckView', 'post', path, {})[0], 400)
+
+    def test_check_username_batch(self):
+        path = '/api/auth/check-username/batch/'
+        usernames = ['N/1', 'n/3', 'N/999', 'NA/2', 'N/1']
+        self.assertEqual(self.assertSameResponse(
+            'BatchUsernameCheckView', 'post', path, json.dumps({'usernames': usernames}),
+            content_type='application/json',
+        )[0], 200)
+        self.assertEqual(self.assertSameResponse(
+            'BatchUsernameCheckView', 'post', path, json.dumps({'usernames': []}), content_type='application/json',
+        )[0], 400)
+
+    def test_verify_code(self):
+        path = '/api/auth/verify-code/'
+        for data, expected in [
+            ({'username': 'N/1', 'code': '123456'}, 200),
+            ({'username': 'officer1', 'code': '123456'}, 200),
+            ({'username': 'N/1', 'code': '000000'}, 401),
+            ({'username': 'N/999', 'code': '123456'}, 401),
+            ({'username': 'N/1'}, 400),
+        ]:
+            self.assertEqual(self.assertSameResponse('CodeVerificationView', 'post', path, data)[0], expected)
+
+    def test_user_list(self):
+        path = '/api/auth/users/'
+        for headers, expected in [
+            ({'HTTP_AUTHORIZATION': f'Token {self.token.key}'}, 200),
+            ({'HTTP_AUTHORIZATION': f'Token {self.token.key}', 'HTTP_ACCEPT': 'application/msgpack'}, 200),
+            ({}, 401),
+            ({'HTTP_AUTHORIZATION': 'Token not-a-token'}, 401),
+            ({'HTTP_AUTHORIZATION': 'Token'}, 401),
+        ]:
+            self.assertEqual(self.assertSameResponse('UserListView', 'get', path, **headers)[0], expected)
+
+    @override_settings(
+        LOGIN_CODE_MODE='sms', SMS_BACKEND='authentication.sms.LocMemBackend', SMS_DISPATCH_ASYNC=False,
+    )
+    def test_sms_code_login(self):
+        cache.clear()
+        sms.outbox.clear()
+        factory = RequestFactory()
+        check = async_views.UsernameCheckView.as_view()
+        verify = async_views.CodeVerificationView.as_view()
+        response = async_to_sync(check)(factory.post('/api/auth/check-username/', {'username': 'N/1'}))
+        self.assertTrue(response.data['codeSent'])
+        code = sms.outbox[-1]['message'].split()[4].rstrip('.')
+        response = async_to_sync(verify)(factory.post('/api/auth/verify-code/', {'username': 'N/1', 'code': code}))
+        self.assertEqual(response.status_code, 200)
+
+
+class MediaTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        (self.root / 'avatar.0123456789ab.png').write_bytes(bytes(range(100)))
+        (self.root / 'notes.txt').write_bytes(b'hello world')
+        (self.root / 'empty.txt').write_bytes(b'')
+        settings = override_settings(MEDIA_ROOT=self.root, MEDIA_SENDFILE_HEADER=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.middleware = MediaMiddleware(lambda request: HttpResponse('not media'))
+        self.factory = RequestFactory()
+
+    def get(self, name, method='get', **headers):
+        response = self.middleware(getattr(self.factory, method)(f'/media/{name}', **headers))
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_file_and_caching(self):
+        response = self.get('avatar.0123456789ab.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), bytes(range(100)))
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', self.get('notes.txt')['Cache-Control'])
+        head = self.get('notes.txt', method='head')
+        self.assertEqual((head.status_code, head.content, head['Content-Length']), (200, b'', '11'))
+        self.assertEqual(self.get('missing.txt').status_code, 404)
+        self.assertEqual(self.get('../secret.txt').status_code, 404)
+        self.assertEqual(self.middleware(self.factory.get('/api/')).content, b'not media')
+
+    def test_conditional_requests(self):
+        response = self.get('notes.txt')
+        self.assertEqual(self.get('notes.txt', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get('notes.txt', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        not_modified = self.get('notes.txt', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_ranges(self):
+        for header, status, body, content_range in [
+            ('bytes=0-4', 206, b'hello', 'bytes 0-4/11'),
+            ('bytes=6-', 206, b'world', 'bytes 6-10/11'),
+            ('bytes=-5', 206, b'world', 'bytes 6-10/11'),
+            ('bytes=6-100', 206, b'world', 'bytes 6-10/11'),
+            ('bytes=11-', 416, b'', 'bytes */11'),
+            ('bytes=-0', 416, b'', 'bytes */11'),
+            ('bytes=0-1,4-5', 200, b'hello world', None),  # multiple ranges: ignored
+            ('items=0-1', 200, b'hello world', None),
+        ]:
+            with self.subTest(header=header):
+                response = self.get('notes.txt', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(self.body(response), body)
+                self.assertEqual(response.get('Content-Range'), content_range)
+                if status == 206:
+                    self.assertEqual(response['Content-Length'], str(len(body)))
+
+    def test_empty_file(self):
+        self.assertEqual(self.body(self.get('empty.txt')), b'')
+        for header in ('bytes=-5', 'bytes=0-'):
+            with self.subTest(header=header):
+                response = self.get('empty.txt', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_if_range(self):
+        etag = self.get('notes.txt')['ETag']
+        self.assertEqual(self.get('notes.txt', HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE=etag).status_code, 206)
+        stale = self.get('notes.txt', HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((stale.status_code, self.body(stale)), (200, b'hello world'))
+
+    def test_sendfile_header(self):
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.get('notes.txt')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/notes.txt')
+        self.assertEqual(response.content, b'')
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings = override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.root, PROFILING_SECRET='s3cret',
+            PROFILING_SAMPLE_RATE=0, PROFILING_MAX_FILES=3,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.factory = RequestFactory()
+
+    def slow_view(self, request):
+        time.sleep(0.03)
+        return HttpResponse('ok')
+
+    def get(self, **headers):
+        return ProfilingMiddleware(self.slow_view)(self.factory.get('/api/auth/users/', headers=headers))
+
+    def profiles(self):
+        return sorted(path.name for path in self.root.iterdir() if path.name.endswith(PROFILE_SUFFIXES))
+
+    def test_disabled(self):
+        with override_settings(PROFILING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(self.slow_view)
+
+    def test_header_needs_the_secret(self):
+        for headers in ({'X-Profile': 'cprofile'}, {'X-Profile': 'cprofile', 'X-Profile-Key': 'wrong'}):
+            response = self.get(**headers)
+            self.assertNotIn('X-Profile-Id', response)
+        with override_settings(PROFILING_SECRET=''):
+            response = self.get(**{'X-Profile': 'cprofile', 'X-Profile-Key': ''})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.profiles(), [])
+
+    def test_cprofile_and_sample(self):
+        response = self.get(**{'X-Profile': 'cprofile', 'X-Profile-Key': 's3cret'})
+        self.assertTrue(response['X-Profile-Id'].endswith('-GET-api_auth_users.prof'))
+        response = self.get(**{'X-Profile': 'sample', 'X-Profile-Key': 's3cret'})
+        name = response['X-Profile-Id']
+        self.assertTrue(name.endswith('.folded'))
+        self.assertIn('slow_view', (self.root / name).read_text())
+        self.assertEqual(len(self.profiles()), 2)
+
+    def test_sampling_and_ring(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            for _ in range(5):
+                response = self.get()
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(self.profiles()), 3)
+
+    def test_async(self):
+        async def slow_view(request):
+            await asyncio.sleep(0.03)
+            return HttpResponse('ok')
+
+        middleware = ProfilingMiddleware(slow_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = AsyncRequestFactory()
+        request = factory.get('/api/auth/users/', headers={'X-Profile': 'sample', 'X-Profile-Key': 's3cret'})
+        response = async_to_sync(middleware)(request)
+        self.assertTrue(response['X-Profile-Id'].endswith('.folded'))
+        request = factory.get('/api/auth/users/', headers={'X-Profile': 'cprofile', 'X-Profile-Key': 's3cret'})
+        self.assertTrue(async_to_sync(middleware)(request)['X-Profile-Id'].endswith('.prof'))
+        # A request arriving while another is profiled on the same loop isn't profiled
+        middleware.profiling = True
+        self.assertNotIn('X-Profile-Id', async_to_sync(middleware)(request))
+        self.assertEqual(len(self.profiles()), 2)
+
+    def test_collapse_profiles(self):
+        self.get(**{'X-Profile': 'cprofile', 'X-Profile-Key': 's3cret'})
+        (self.root / '1-1-GET-api_auth_users.folded').write_text('a;b 5\na;c 2\n')
+        (self.root / '2-1-GET-api_auth_users.folded').write_text('a;b 1\n')
+        (self.root / '3-1-GET-admin.folded').write_text('x 7\n')
+        output = io.StringIO()
+        call_command('collapse_profiles', path='api_auth_users', latest=2, stdout=output, stderr=io.StringIO())
+        lines = output.getvalue().splitlines()
+        self.assertIn('a;b 1', lines)  # only the newest two api_auth_users profiles
+        self.assertNotIn('x 7', lines)
+        self.assertTrue(any('slow_view' in line for line in lines))
+        output = io.StringIO()
+        call_command('collapse_profiles', path='api_auth_users', stdout=output, stderr=io.StringIO())
+        self.assertIn('a;b 6', output.getvalue().splitlines())
+        with self.assertRaises(CommandError):
+            call_command('collapse_profiles', path='nothing', stderr=io.StringIO())
+
+
+class SiteMiddlewareTests(TestCase):
+    """The admin keeps CSRF and X-Frame-Options; API views opt out of both."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_admin_enforces_csrf(self):
+        response = self.client.post('/admin/login/', {'username': 'officer1', 'password': 'x'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_denies_framing(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_api_skips_csrf_and_framing(self):
+        response = self.client.post('/api/auth/check-username/', {'username': 'N/1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertEqual(response.cookies, {})
+
+    def test_deploy_checks_see_the_middleware(self):
+        ids = {message.id for message in checks.run_checks(include_deployment_checks=True)}
+        self.assertNotIn('security.W002', ids)
+        self.assertNotIn('security.W003', ids)
+
+
+class CompressionTests(SimpleTestCase):
+    body = json.dumps([{'serviceNumber': f'N/{n}', 'name': f'Officer {n}'} for n in range(200)])
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def respond(self, accept_encoding=None, path='/api/auth/users/', body=None, streaming=False):
+        content = (body or self.body).encode()
+        if streaming:
+            get_response = lambda request: StreamingHttpResponse(iter([content[:500], content[500:]]))
+        else:
+            get_response = lambda request: HttpResponse(content, content_type='application/json')
+        headers = {} if accept_encoding is None else {'HTTP_ACCEPT_ENCODING': accept_encoding}
+        return CompressionMiddleware(get_response)(self.factory.get(path, **headers))
+
+    def test_negotiation(self):
+        for header, expected in [
+            ('gzip', 'gzip'),
+            ('gzip, deflate, br', 'br' if brotli else 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('gzip;q=0, br', 'br' if brotli else None),
+            ('*', 'br' if brotli else 'gzip'),
+            ('*;q=0', None),
+            ('identity', None),
+            ('', None),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(negotiate_encoding(header), expected)
+
+    def test_gzip(self):
+        response = self.respond('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content).decode(), self.body)
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        response = self.respond('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content).decode(), self.body)
+        response = self.respond('br', streaming=True)
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)).decode(), self.body)
+
+    def test_wildcard_is_compressed(self):
+        with mock.patch('core.middleware.brotli', None):
+            response = self.respond('*')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), self.body)
+
+    def test_uncompressed(self):
+        small = self.respond('gzip', body='{"ok": true}')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        outside = self.respond('gzip', path='/admin/')
+        self.assertFalse(outside.has_header('Content-Encoding'))
+        refused = self.respond('identity')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+        self.assertEqual(refused['Vary'], 'Accept-Encoding')
+        self.assertEqual(refused.content.decode(), self.body)
+
+
+class RendererTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(3)
+        cls.token = Token.objects.create(user=User.objects.get(serviceNumber='N/1'))
+
+    def get_users(self, accept):
+        return self.client.get(
+            '/api/auth/users/', HTTP_ACCEPT=accept, HTTP_AUTHORIZATION=f'Token {self.token.key}',
+        )
+
+    def test_columnar(self):
+        rows = self.get_users('application/json').json()
+        response = self.get_users('application/vnd.naim.columnar+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.naim.columnar+json')
+        columnar = response.json()
+        self.assertEqual(columnar['fields'], list(rows[0]))
+        self.assertEqual([dict(zip(columnar['fields'], row)) for row in columnar['rows']], rows)
+        self.assertEqual(to_columnar({'detail': 'x'}), {'detail': 'x'})
+        self.assertEqual(to_columnar([]), {'fields': [], 'rows': []})
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        rows = self.get_users('application/json').json()
+        response = self.get_users('application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), rows)
+
+
+@override_settings(
+    CONCURRENCY_LIMIT_ENABLED=True,
+    CONCURRENCY_LIMIT_INITIAL=2,
+    CONCURRENCY_MAX_QUEUE_WAIT=2.0,
+)
+class ConcurrencyLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.middleware = ConcurrencyLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.limiter = self.middleware.limiter
+        self.factory = RequestFactory()
+
+    def hold(self, path, count=1):
+        for _ in range(count):
+            self.assertIsNotNone(self.limiter.acquire(*self.limiter.match(path)))
+
+    def test_limit_follows_latency(self):
+        limit = AIMDLimit(target=0.1, initial=10, min_limit=1, max_limit=20, backoff=0.5)
+        limit.update(0.2, inflight=9)
+        self.assertEqual(limit.limit, 5)
+        limit.update(0.05, inflight=0)  # barely used: no growth
+        self.assertEqual(limit.limit, 5)
+        for _ in range(5):
+            limit.update(0.05, inflight=4)
+        self.assertAlmostEqual(limit.limit, 6, delta=0.1)
+        for _ in range(10):
+            limit.update(1.0, inflight=4)
+        self.assertEqual(limit.limit, 1)
+
+    def test_background_is_shed_first(self):
+        # Three routes at limit 2: background may fill half of the 6 slots
+        self.hold('/api/auth/verify-code/', 2)
+        self.hold('/api/auth/check-username/')
+        response = self.middleware(self.factory.get('/api/auth/users/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(self.middleware(self.factory.post('/api/auth/check-username/')).status_code, 200)
+        self.assertEqual(self.middleware(self.factory.post('/api/auth/verify-code/')).status_code, 503)
+        self.assertEqual(self.limiter.shed, 2)
+
+    def test_requests_that_queued_too_long_are_shed(self):
+        queued = f't={time.time() - 1.5:.3f}'
+        for path, expected in [
+            ('/api/auth/users/', 503),  # background: half of the 2s budget
+            ('/api/auth/check-username/', 200),
+            ('/admin/', 200),  # not a limited route
+        ]:
+            response = self.middleware(self.factory.get(path, HTTP_X_REQUEST_START=queued))
+            self.assertEqual(response.status_code, expected, path)
+        self.assertEqual(self.limiter.inflight, 0)
+
+    def test_async(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+        middleware = ConcurrencyLimitMiddleware(get_response)
+        for _ in range(2):
+            middleware.limiter.acquire(*middleware.limiter.match('/api/auth/check-username/'))
+        request = self.factory.post('/api/auth/check-username/')
+        self.assertEqual(async_to_sync(middleware)(request).status_code, 503)
+
+
+
+class WarmUpTests(SimpleTestCase):
+    def setUp(self):
+        self.connected = []
+        patcher = mock.patch.object(
+            BaseDatabaseWrapper, 'ensure_connection', autospec=True,
+            side_effect=lambda wrapper: self.connected.append(threading.get_ident()),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connects_every_request_thread(self):
+        with ThreadPoolExecutor(max_workers=3) as executor, mock.patch.object(warmup, 'caches') as caches:
+            timings = warmup.warm_up(executor, 3)
+        self.assertEqual(list(timings), ['warm_urls', 'warm_serializers', 'warm_database', 'warm_caches'])
+        self.assertEqual(len(set(self.connected)), 3)
+        self.assertNotIn(threading.get_ident(), self.connected)
+        caches.__getitem__.return_value.get.assert_called_with('warmup')
+        warmup.warm_database()
+        self.assertEqual(self.connected[-1], threading.get_ident())
+
+    def test_database_down(self):
+        BaseDatabaseWrapper.ensure_connection.side_effect = OperationalError('connection refused')
+        with mock.patch.object(warmup, 'caches') as caches, self.assertLogs('core.warmup', 'ERROR') as logs:
+            timings = warmup.warm_up()
+        self.assertIn('warm_database failed', logs.output[0])
+        self.assertIn('warm_database', timings)
+        caches.__getitem__.return_value.get.assert_called_with('warmup')
+
+class RosterSnapshotTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.settings = override_settings(ROSTER_SNAPSHOT_DIR=cls.directory.name, ROSTER_SNAPSHOT_DEBOUNCE=0)
+        cls.settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings.disable()
+        cls.directory.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(5)
+        cls.token = Token.objects.create(user=User.objects.get(serviceNumber='N/1'))
+
+    def setUp(self):
+        for entry in Path(self.directory.name).iterdir():
+            entry.unlink()
+
+    def download(self, url, **extra):
+        return self.client.get(url.removeprefix('http://testserver'), **extra)
+
+    def test_build_writes_roster_and_variants(self):
+        snapshot = snapshots.build_snapshot()
+        path = Path(self.directory.name) / snapshot['name']
+        content = path.read_bytes()
+        rows = User.objects.roster().values_list(*UserListSerializer.Meta.fields)
+        self.assertEqual(json.loads(content), serialize_roster(rows))
+        self.assertEqual(snapshot['count'], 5)
+        self.assertEqual(gzip.decompress(path.with_name(path.name + '.gz').read_bytes()), content)
+        if brotli is not None:
+            self.assertEqual(brotli.decompress(path.with_name(path.name + '.br').read_bytes()), content)
+        self.assertEqual(snapshots.current_snapshot(), snapshot)
+        self.assertEqual(snapshots.build_snapshot()['name'], snapshot['name'])
+
+    def test_user_changes_rebuild_on_commit(self):
+        old = snapshots.build_snapshot()
+        user = User.objects.get(serviceNumber='N/3')
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            user.name = 'Renamed'
+            user.save()
+        new = snapshots.current_snapshot()
+        self.assertNotEqual(new['name'], old['name'])
+        self.assertIn(b'Renamed', (Path(self.directory.name) / new['name']).read_bytes())
+        # Kept for the URLs already signed for it
+        self.assertTrue((Path(self.directory.name) / old['name']).exists())
+
+    def test_signed_download(self):
+        self.assertEqual(self.client.get('/api/auth/users/snapshot/').status_code, 401)
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        response = self.client.get('/api/auth/users/snapshot/', **auth)
+        self.assertEqual(response.status_code, 200)
+        snapshot = response.json()
+        self.assertEqual(snapshot['count'], 5)
+        not_modified = self.client.get('/api/auth/users/snapshot/', HTTP_IF_NONE_MATCH=response['ETag'], **auth)
+        self.assertEqual(not_modified.status_code, 304)
+
+        content = (Path(self.directory.name) / snapshots.current_snapshot()['name']).read_bytes()
+        response = self.download(snapshot['url'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), content)
+        response = self.download(snapshot['url'])
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+        self.assertEqual(self.download(snapshot['url'][:-1] + 'x').status_code, 403)
+        self.assertEqual(self.download(snapshot['url'].split('?')[0]).status_code, 403)
+        with override_settings(ROSTER_SNAPSHOT_URL_MAX_AGE=-1):
+            self.assertEqual(self.download(snapshot['url']).status_code, 403)
+
+    def test_async_view(self):
+        view = async_views.RosterSnapshotView.as_view()
+        request = RequestFactory().get('/api/auth/users/snapshot/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{snapshots.current_snapshot()["hash"]}"')
+
+    @skipIf(snapshots.fcntl is None, 'needs fcntl')
+    def test_build_waits_for_other_processes(self):
+        reads = []
+        with open(Path(self.directory.name) / snapshots.LOCK_NAME, 'a') as lock, \
+                mock.patch.object(snapshots, 'serialize_roster', side_effect=lambda rows: reads.append(1) or []):
+            # Another worker's build; flock locks conflict across open files
+            snapshots.fcntl.flock(lock, snapshots.fcntl.LOCK_EX)
+            build = threading.Thread(target=snapshots.build_snapshot)
+            build.start()
+            time.sleep(0.2)
+            self.assertEqual(reads, [])  # hasn't read the roster yet
+            self.assertIsNone(snapshots.current_snapshot())
+            snapshots.fcntl.flock(lock, snapshots.fcntl.LOCK_UN)
+            build.join(5)
+        self.assertEqual(reads, [1])
+        self.assertEqual(snapshots.current_snapshot()['count'], 0)
+
+    def test_debouncer_coalesces_changes(self):
+        calls = []
+        done = threading.Event()
+        debouncer = snapshots.Debouncer(lambda: (calls.append(1), done.set()), delay=0.05, max_delay=5)
+        for _ in range(3):
+            debouncer.trigger()
+        self.assertTrue(done.wait(5))
+        time.sleep(0.1)
+        self.assertEqual(calls, [1])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserAdminActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_users(3)
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', serviceNumber='N/999999', code='654321',
+        )
+        User.objects.filter(serviceNumber='N/1').update(name='=HYPERLINK("http://example.com")')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def act(self, action, *users):
+        return self.client.post('/admin/authentication/user/', {
+            'action': action, 'index': '0', '_selected_action': [user.pk for user in users],
+        })
+
+    def test_deactivate_and_activate(self):
+        users = list(User.objects.exclude(pk=self.admin.pk))
+        Token.objects.create(user=users[0])
+        self.act('deactivate_users', self.admin, *users)
+        self.assertEqual(list(User.objects.filter(is_active=True)), [self.admin])
+        self.assertFalse(Token.objects.exists())
+        self.act('activate_users', users[0])
+        self.assertEqual(User.objects.filter(is_active=True).count(), 2)
+
+    def test_reset_logins(self):
+        officer, other = User.objects.get(serviceNumber='N/1'), User.objects.get(serviceNumber='NA/2')
+        for user in (officer, other):
+            Token.objects.create(user=user)
+            OneTimeCode.objects.create(
+                service_number=user.serviceNumber, code_hash='0' * 64,
+                expires_at=timezone.now() + timedelta(minutes=5),
+            )
+            cache.set(f'otp:sent:{user.serviceNumber}', True)
+        self.act('reset_logins', officer)
+        self.assertEqual(list(Token.objects.values_list('user', flat=True)), [other.pk])
+        self.assertEqual(list(OneTimeCode.objects.values_list('service_number', flat=True)), ['NA/2'])
+        self.assertIsNone(cache.get('otp:sent:N/1'))
+        self.assertIsNotNone(cache.get('otp:sent:NA/2'))
+        self.assertTrue(User.objects.get(pk=officer.pk).is_active)
+
+    def test_login_attempts_are_read_only(self):
+        attempt = LoginAttempt.objects.create(
+            created_at=timezone.now(), username='N/1', successful=False, latency_ms=1,
+        )
+        url = '/admin/authentication/loginattempt/'
+        response = self.client.get(url)
+        self.assertContains(response, 'N/1')
+        self.assertNotContains(response, 'delete_selected')
+        self.client.post(url, {'action': 'delete_selected', 'index': '0', '_selected_action': [attempt.pk]})
+        self.assertEqual(self.client.get(f'{url}{attempt.pk}/delete/').status_code, 403)
+        self.assertTrue(LoginAttempt.objects.filter(pk=attempt.pk).exists())
+
+    def test_export_csv(self):
+        response = self.act('export_csv', *User.objects.all())
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.reader(read_body(response).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][:2], ['Service number', 'Name'])
+        self.assertEqual(len(rows), 5)
+        row = next(row for row in rows if row[0] == 'N/1')
+        self.assertEqual(row[1], '\'=HYPERLINK("http://example.com")')  # not a formula
+        self.assertEqual(row[4], '08030000001')
+
+    def test_export_xlsx_streams_under_asgi(self):
+        request = AsyncRequestFactory().get('/admin/authentication/user/')
+        response = exports.export_response(request, User.objects.order_by('username'), 'xlsx')
+        self.assertTrue(response.is_async)
+        with zipfile.ZipFile(io.BytesIO(read_body(response))) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            [cell.findtext('s:is/s:t', namespaces=namespace) for cell in rows[1]][:3],
+            ['N/999999', None, 'admin'],
+        )
@@ -0,0 +1,36 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class UsernameCheckRateThrottle(SimpleRateThrottle):
+    """
+    Limits service-number lookups per client. A request costs as many
+    lookups as it checks (see the view's get_throttle_cost), so the batch
+    endpoint draws from the same budget as repeated single checks.
+    """
+    scope = 'check_username'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        self.cost = view.get_throttle_cost(request) if hasattr(view, 'get_throttle_cost') else 1
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        if len(self.history) + self.cost > self.num_requests:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        self.history[:0] = [self.now] * self.cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
@@ -1,12 +1,24 @@
+from django.conf import settings
 from django.urls import path
-from .views import (
-    UsernameCheckView, CodeVerificationView, UserListView
-)
+from django.views.decorators.clickjacking import xframe_options_exempt
+from . import async_views, views
+
+# Native async views under ASGI (core/asgi.py sets ASYNC_API), sync ones
+# under WSGI, where an async view would need an event loop per request
+api = async_views if settings.ASYNC_API else views
+
+
+def api_view(view_class):
+    # JSON isn't framed; DRF's as_view() already makes the view csrf_exempt
+    return xframe_options_exempt(view_class.as_view())
+
 
 urlpatterns = [
-    path('check-username/', UsernameCheckView.as_view(), name='check-username'),
-    path('verify-code/', CodeVerificationView.as_view(), name='verify-code'),
-    path('users/', UserListView.as_view(), name='user-list'),
+    path('check-username/', api_view(api.UsernameCheckView), name='check-username'),
+    path('check-username/batch/', api_view(api.BatchUsernameCheckView), name='check-username-batch'),
+    path('verify-code/', api_view(api.CodeVerificationView), name='verify-code'),
+    path('users/', api_view(api.UserListView), name='user-list'),
+    path('users/snapshot/', api_view(api.RosterSnapshotView), name='user-list-snapshot'),
     # path('register/', UserRegistrationView.as_view(), name='register'),
     # path('profile/', UserProfileView.as_view(), name='profile'),
 ]
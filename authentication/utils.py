@@ -27,3 +27,42 @@ def mask_phone_number(phone_number):
     
     # Return masked number
     return f"{prefix}{'*' * mask_length}{suffix}"
+
+
+# Canonical forms for lookup keys. User.save stores these and every login
+# path normalizes incoming values the same way, so lookups are plain exact
+# matches that can use the unique indexes (never iexact scans).
+
+def normalize_service_number(value):
+    """Uppercase with all whitespace removed, e.g. ' n/ 1234 ' -> 'N/1234'."""
+    if value is None:
+        return None
+    return ''.join(value.split()).upper()
+
+
+def normalize_username(value):
+    if value is None:
+        return None
+    return value.strip().lower()
+
+
+def normalize_email(value):
+    if value is None:
+        return None
+    return value.strip().lower()
+
+
+def normalize_phone(value):
+    """
+    Convert a Nigerian phone number to E.164 (+234XXXXXXXXXX).
+    Accepts 0XXXXXXXXXX, 234XXXXXXXXXX and +234XXXXXXXXXX with any spacing
+    or punctuation. Returns None for anything that isn't such a number.
+    """
+    if not value:
+        return None
+    digits = ''.join(c for c in value if c.isdigit())
+    if len(digits) == 11 and digits.startswith('0'):
+        digits = '234' + digits[1:]
+    if len(digits) == 13 and digits.startswith('234'):
+        return '+' + digits
+    return None
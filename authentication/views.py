@@ -3,14 +3,24 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.settings import api_settings
+import json
+import time
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Case, When, BooleanField, Value, IntegerField
-from django.db.models.functions import Substr, Cast, Length
+from django.http import StreamingHttpResponse
+from django.utils.http import quote_etag
+from . import snapshots
 from .models import User
 from .serializers import (
-    UsernameCheckSerializer, CodeVerificationSerializer, UserListSerializer
+    UsernameCheckSerializer, BatchUsernameCheckSerializer, CodeVerificationSerializer,
+    UserListSerializer, serialize_roster
 )
-from .utils import mask_phone_number
+from .audit import record_login_attempt
+from .otp import issue_code
+from .renderers import COMPACT_RENDERER_CLASSES
+from .throttling import UsernameCheckRateThrottle
+from .utils import mask_phone_number, normalize_service_number
 
 
 class UsernameCheckView(APIView):
@@ -18,21 +28,27 @@ class UsernameCheckView(APIView):
     Step 1: Check if a username exists in the system
     """
     permission_classes = [AllowAny]
+    throttle_classes = [UsernameCheckRateThrottle]
     
     def post(self, request):
         serializer = UsernameCheckSerializer(data=request.data)
         if serializer.is_valid():
             username = serializer.validated_data['username']
-            # Use filter instead of get to avoid exceptions
-            user_exists = User.objects.filter(serviceNumber=username).exists()
+            # username is already normalized, so this is one unique-index probe;
+            # only the columns the response needs are fetched
+            user = User.objects.filter(serviceNumber=username).values_list('serviceNumber', 'phone', 'is_active').first()
             
-            if user_exists:
-                user = User.objects.get(serviceNumber=username)
-                return Response({
+            if user:
+                service_number, phone, is_active = user
+                response_data = {
                     'exists': True,
-                    'serviceNumber': user.serviceNumber,
-                    'phone': mask_phone_number(user.phone)
-                }, status=status.HTTP_200_OK)
+                    'serviceNumber': service_number,
+                    'phone': mask_phone_number(phone)
+                }
+                if settings.LOGIN_CODE_MODE == 'sms':
+                    # Queued for the SMS thread; the provider call is not awaited
+                    response_data['codeSent'] = is_active and issue_code(service_number, phone)
+                return Response(response_data, status=status.HTTP_200_OK)
             else:
                 return Response({
                     'exists': False,
@@ -41,6 +57,65 @@ class UsernameCheckView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BatchUsernameCheckView(APIView):
+    """
+    Step 1 for many service numbers at once (gateways, roll calls).
+    Resolves the whole batch with a single IN query and streams one result
+    per entry back, in request order, as a JSON array.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [UsernameCheckRateThrottle]
+    # Entries per chunk written to the response stream
+    chunk_size = 100
+
+    def get_throttle_cost(self, request):
+        """Every entry counts against the same budget as a single check."""
+        data = request.data
+        usernames = data.getlist('usernames') if hasattr(data, 'getlist') else data.get('usernames')
+        if isinstance(usernames, list):
+            return max(1, min(len(usernames), settings.CHECK_USERNAME_BATCH_LIMIT))
+        return 1
+
+    def post(self, request):
+        serializer = BatchUsernameCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        usernames = serializer.validated_data['usernames']
+        normalized = [normalize_service_number(username) for username in usernames]
+        phones = dict(
+            User.objects.filter(serviceNumber__in=set(normalized))
+            .values_list('serviceNumber', 'phone')
+        )
+        return StreamingHttpResponse(
+            self.stream_results(usernames, normalized, phones),
+            content_type='application/json',
+        )
+
+    def stream_results(self, usernames, normalized, phones):
+        yield '['
+        chunk = []
+        masked = {}
+        for index, (username, service_number) in enumerate(zip(usernames, normalized)):
+            if service_number in phones:
+                # Only hits pay for masking, once per distinct service number
+                if service_number not in masked:
+                    masked[service_number] = mask_phone_number(phones[service_number])
+                entry = {
+                    'username': username,
+                    'exists': True,
+                    'serviceNumber': service_number,
+                    'phone': masked[service_number],
+                }
+            else:
+                entry = {'username': username, 'exists': False}
+            chunk.append(('' if index == 0 else ',') + json.dumps(entry))
+            if len(chunk) >= self.chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + ']'
+
+
 class CodeVerificationView(APIView):
     """
     Step 2: Verify the user's code and complete the login process
@@ -48,12 +123,17 @@ class CodeVerificationView(APIView):
     permission_classes = [AllowAny]  # Allow anyone to login
     
     def post(self, request):
+        started = time.perf_counter()
         serializer = CodeVerificationSerializer(data=request.data)
         if serializer.is_valid():
             username = serializer.validated_data['username']
             code = serializer.validated_data['code']
             
-            user = authenticate(username=username, password=code)
+            if settings.LOGIN_CODE_MODE == 'sms':
+                # The code texted by check-username; the static passcode is not accepted
+                user = authenticate(request, username=username, otp=code)
+            else:
+                user = authenticate(username=username, password=code)
             
             if user:
                 token, created = Token.objects.get_or_create(user=user)
@@ -73,8 +153,13 @@ class CodeVerificationView(APIView):
                     response_data['profile_image'] = request.build_absolute_uri(user.profile_image.url)
                 else:
                     response_data['profile_image'] = None
-                    
+                
+                # Buffered in memory; written in batches off the request path
+                record_login_attempt(request, user.serviceNumber, user, True, time.perf_counter() - started)
                 return Response(response_data, status=status.HTTP_200_OK)
+            record_login_attempt(
+                request, normalize_service_number(username), None, False, time.perf_counter() - started
+            )
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -84,40 +169,50 @@ class CodeVerificationView(APIView):
 class UserListView(generics.ListAPIView):
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated]  # Only allow authenticated users to access this
+    # Large rosters can also be fetched as columnar JSON or MessagePack via Accept
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + COMPACT_RENDERER_CLASSES
     
     def get_queryset(self):
         """
         Return all users except superusers, ordered by service number
         with "N/" prefix first (seniors), and correctly orders numeric parts.
         """
-        # Get all non-superuser users
-        queryset = User.objects.filter(is_superuser=False)
-        
-        # Annotate queryset with a boolean field indicating if service number starts with "N/"
-        queryset = queryset.annotate(
-            is_senior=Case(
-                When(serviceNumber__startswith='N/', then=True),
-                default=False,
-                output_field=BooleanField()
-            )
-        )
-        
-        # For "N/" service numbers, extract the numeric part and convert to integer for proper ordering
-        queryset = queryset.annotate(
-            numeric_part=Case(
-                When(serviceNumber__startswith='N/', 
-                     then=Cast(
-                         Substr('serviceNumber', 3, Length('serviceNumber')), 
-                         output_field=IntegerField()
-                     )
-                ),
-                default=Value(0),
-                output_field=IntegerField()
-            )
+        return User.objects.roster()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Read-only projection: tuples of the serialized columns instead of
+        # User instances, serialized as they are fetched. On PostgreSQL
+        # iterator() reads through a server-side cursor.
+        rows = queryset.values_list(*UserListSerializer.Meta.fields).iterator(
+            chunk_size=settings.ROSTER_CHUNK_SIZE
         )
-        
-        # Order by is_senior (True first), then by numeric_part for seniors, then by serviceNumber for others
-        return queryset.order_by('-is_senior', 'numeric_part', 'serviceNumber')
+        return Response(serialize_roster(rows, request))
+
+
+class RosterSnapshotView(APIView):
+    """
+    Where to download the whole roster as a precomputed file (see
+    authentication.snapshots). The URL is signed and short-lived. The ETag
+    is the snapshot's hash, so a client holding the current copy gets a 304.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        snapshot = snapshots.current_snapshot() or snapshots.build_snapshot()
+        return self.snapshot_response(request, snapshot)
+
+    def snapshot_response(self, request, snapshot):
+        response = Response({
+            'url': request.build_absolute_uri(snapshots.signed_path(snapshot['name'])),
+            'hash': snapshot['hash'],
+            'count': snapshot['count'],
+            'builtAt': snapshot['builtAt'],
+            'expiresIn': settings.ROSTER_SNAPSHOT_URL_MAX_AGE,
+        })
+        response['ETag'] = quote_etag(snapshot['hash'])
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 
 
@@ -0,0 +1,122 @@
+"""
+UserAdmin's bulk actions and exports with every user selected.
+
+Seeds a throwaway SQLite file and drives the admin changelist in-process
+with Django's test client, "select all" across the changelist, as an
+admin would for a whole unit:
+
+    deactivate     tokens and pending codes revoked, one UPDATE
+    activate       one UPDATE
+    reset logins   tokens and pending codes revoked
+    per-row saves  deactivation by loading and saving each user, which is
+                   what an action written around instances costs
+    export CSV     streamed, one chunk per ROSTER_CHUNK_SIZE rows
+    export XLSX
+
+Exports print the time to the first chunk, the total, the body size and
+the tracemalloc peak while the body is consumed, which stays flat as
+--users grows.
+
+    python -m benchmarks.bench_admin [--users 100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_databases import prepare
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+ACTIONS_SCRIPT = r'''
+import json, time, tracemalloc
+from benchmarks.utils import setup_django
+setup_django()
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from authentication.models import User
+
+admin = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser(
+    username='benchadmin', email='benchadmin@example.com', serviceNumber='X/1', code='654321',
+)
+client = Client(HTTP_HOST='localhost')
+client.force_login(admin)
+some_user = User.objects.exclude(pk=admin.pk).values_list('pk', flat=True).first()
+
+def act(action):
+    return client.post('/admin/authentication/user/', {
+        'action': action, 'select_across': '1', 'index': '0', '_selected_action': [some_user],
+    })
+
+results = {}
+for action in ('deactivate_users', 'activate_users', 'reset_logins'):
+    Token.objects.bulk_create([
+        Token(key=Token.generate_key(), user_id=pk)
+        for pk in User.objects.exclude(pk=admin.pk).values_list('pk', flat=True)[:1000]
+    ], ignore_conflicts=True)
+    start = time.perf_counter()
+    response = act(action)
+    results[action] = {'seconds': time.perf_counter() - start, 'status': response.status_code}
+
+start = time.perf_counter()
+for user in User.objects.exclude(pk=admin.pk).iterator(chunk_size=2000):
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+results['per-row saves'] = {'seconds': time.perf_counter() - start}
+User.objects.update(is_active=True)
+
+for action in ('export_csv', 'export_xlsx'):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = act(action)
+    chunks = iter(response.streaming_content)
+    size = len(next(chunks))
+    first = time.perf_counter() - start
+    for chunk in chunks:
+        size += len(chunk)
+    results[action] = {
+        'seconds': time.perf_counter() - start, 'first': first, 'bytes': size,
+        'traced_peak': tracemalloc.get_traced_memory()[1],
+    }
+    tracemalloc.stop()
+print(json.dumps(results))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DJANGO_DEBUG='false',
+            SQLITE_PATH=str(Path(tmp) / 'admin.sqlite3'),
+            ROSTER_SNAPSHOT_DIR=str(Path(tmp) / 'snapshots'),
+        )
+        prepare(env, args.users)
+        result = subprocess.run(
+            [sys.executable, '-c', ACTIONS_SCRIPT],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            sys.exit(result.stderr)
+        results = json.loads(result.stdout.strip().splitlines()[-1])
+
+    mb = 1024 * 1024
+    print(f'{args.users:,} users selected')
+    for name in ('deactivate_users', 'activate_users', 'reset_logins', 'per-row saves'):
+        print(f"  {name:<16} {results[name]['seconds']:8.2f}s")
+    print(f"  {'':<16} {'first chunk':>11} {'total':>8} {'body MB':>8} {'traced peak MB':>15}")
+    for name in ('export_csv', 'export_xlsx'):
+        entry = results[name]
+        print(f"  {name:<16} {entry['first'] * 1000:>9.0f}ms {entry['seconds']:>7.2f}s "
+              f"{entry['bytes'] / mb:>8.1f} {entry['traced_peak'] / mb:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
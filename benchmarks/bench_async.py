@@ -0,0 +1,77 @@
+"""
+Sync WSGI deployment vs the async ASGI one at high client concurrency.
+
+Seeds a throwaway SQLite file, then serves it three ways through
+gunicorn.conf.py and drives check-username, verify-code and users/ with
+--concurrency keep-alive clients (1000 by default):
+
+    wsgi          gthread workers, core.wsgi, the sync views
+    asgi-sync     uvicorn workers, core.asgi with DJANGO_ASYNC_API=false:
+                  the sync views behind Django's sync bridge
+    asgi-async    uvicorn workers, core.asgi, the async views
+
+Prints throughput, the latency percentiles, and the requests that failed
+or timed out (--timeout) for each.
+
+    python -m benchmarks.bench_async [--users 1000] [--concurrency 1000] [--duration 10]
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_databases import endpoint_requests, prepare
+from benchmarks.bench_server import HOST, start_server, stop_server
+from benchmarks.loadgen import free_port, run_load
+
+DEPLOYMENTS = {
+    'wsgi': {'WEB_WORKER_CLASS': 'gthread'},
+    'asgi-sync': {'WEB_WORKER_CLASS': 'uvicorn', 'DJANGO_ASYNC_API': 'false'},
+    'asgi-async': {'WEB_WORKER_CLASS': 'uvicorn', 'DJANGO_ASYNC_API': 'true'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000, help='rows seeded into the roster')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per endpoint')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a request counts as failed')
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) + 1)
+    parser.add_argument('--threads', type=int, default=4, help='threads per gthread worker')
+    parser.add_argument('--deployments', nargs='+', default=list(DEPLOYMENTS), choices=list(DEPLOYMENTS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DJANGO_DEBUG='false',
+            SQLITE_PATH=str(Path(tmp) / 'async.sqlite3'),
+            WEB_CONCURRENCY=str(args.workers),
+            GUNICORN_THREADS=str(args.threads),
+            # Every request comes from one address; keep the throttle out of it
+            CHECK_USERNAME_RATE='1000000/min',
+        )
+        token = prepare(env, args.users)
+        requests = endpoint_requests(token, args.users)
+
+        print(f'{args.users} users, {args.workers} workers, {args.concurrency} clients, '
+              f'{args.duration}s per endpoint')
+        for deployment in args.deployments:
+            port = free_port()
+            server = start_server(dict(env, **DEPLOYMENTS[deployment]), port)
+            try:
+                print(deployment)
+                for name, payloads in requests.items():
+                    run_load(HOST, port, payloads, concurrency=min(args.concurrency, 64), duration=1.0)
+                    result = run_load(
+                        HOST, port, payloads, concurrency=args.concurrency,
+                        duration=args.duration, timeout=args.timeout,
+                    )
+                    print(f'  {name:<15} {result.summary()}  p99.9 {result.percentile(99.9) * 1000:.1f} ms')
+            finally:
+                stop_server(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Worker boot time.
+
+1. Import-time profile of core.wsgi or core.asgi (python -X importtime), rolled up to
+   the heaviest modules and top-level packages.
+2. Boot phases measured in fresh interpreters (WSGI): importing core.wsgi
+   (django.setup + middleware), core.warmup.warm_up(), and the first and
+   second check-username requests, with and without warm-up. The first
+   request without warm-up is the cold-start spike max_requests recycling
+   produces.
+
+    python -m benchmarks.bench_boot [--runs 5] [--top 15] [--module core.asgi]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PHASES_SCRIPT = r'''
+import io, json, sys, time
+start = time.perf_counter()
+from core.wsgi import application
+timings = {'import': time.perf_counter() - start}
+
+if sys.argv[1] == 'warm':
+    from core.warmup import warm_up
+    start = time.perf_counter()
+    warm_up()
+    timings['warm_up'] = time.perf_counter() - start
+
+body = b'username=N%2F1'
+environ = {
+    'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/auth/check-username/',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.url_scheme': 'http', 'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+    'CONTENT_LENGTH': str(len(body)), 'REMOTE_ADDR': '127.0.0.1',
+}
+
+def request():
+    env = dict(environ, **{'wsgi.input': io.BytesIO(body)})
+    b''.join(application(env, lambda status, headers: None))
+
+for name in ('first_request', 'second_request'):
+    start = time.perf_counter()
+    request()
+    timings[name] = time.perf_counter() - start
+print(json.dumps(timings))
+'''
+
+
+def import_profile(module, env):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name, int(cumulative_us), int(self_us)))
+    return modules
+
+
+def print_import_profile(module, env, top):
+    modules = import_profile(module, env)
+    total = sum(self_us for _, _, self_us in modules)
+    print(f'import {module}: {total / 1000:.1f} ms across {len(modules)} modules\n')
+
+    print(f'Heaviest modules (cumulative, top {top})')
+    for name, cumulative, _ in sorted(modules, key=lambda m: m[1], reverse=True)[:top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+    packages = defaultdict(int)
+    for name, _, self_us in modules:
+        packages[name.strip().split('.')[0]] += self_us
+    print(f'\nTop-level packages (self time, top {top})')
+    for name, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]:
+        print(f'  {self_us / 1000:8.1f} ms  {name}')
+
+
+def boot_phases(env, mode, runs):
+    samples = defaultdict(list)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PHASES_SCRIPT, mode],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            samples[name].append(seconds)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='core.wsgi', choices=['core.wsgi', 'core.asgi'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DJANGO_DEBUG='false', SQLITE_PATH=str(Path(tmp) / 'boot.sqlite3'))
+        subprocess.run(
+            [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+            cwd=BASE_DIR, env=env, check=True, capture_output=True,
+        )
+
+        print_import_profile(args.module, env, args.top)
+
+        print(f'\nBoot phases (core.wsgi), median of {args.runs} fresh interpreters')
+        for mode in ('cold', 'warm'):
+            phases = boot_phases(env, mode, args.runs)
+            total = sum(phases.values())
+            detail = '  '.join(f'{name} {seconds * 1000:7.1f} ms' for name, seconds in phases.items())
+            print(f'  {mode:<5} total {total * 1000:7.1f} ms  {detail}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Throughput of the SQLite and PostgreSQL profiles under gunicorn.
+
+Seeds the same roster into a throwaway SQLite file and a throwaway
+PostgreSQL database, starts gunicorn (gunicorn.conf.py) against each, and
+drives check-username, verify-code and users/ with the asyncio load
+generator.
+
+PostgreSQL is reached through the usual POSTGRES_HOST/PORT/USER/PASSWORD
+variables. The benchmark DROPS and recreates the database named by
+--postgres-db, so point it at a scratch name, never a real one.
+
+    python -m benchmarks.bench_databases [--users 5000] [--postgres-db login_api_bench]
+    python -m benchmarks.bench_databases --worker-class gthread --workers 3 --threads 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_server import HOST, start_server, stop_server
+from benchmarks.loadgen import build_request, free_port, run_load
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SEED_SCRIPT = '''
+import sys
+from authentication.testing import seed_users
+from benchmarks.utils import create_token, setup_django
+setup_django()
+from django.db import connection
+seed_users(int(sys.argv[1]))
+if connection.vendor == 'postgresql':
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+print(create_token())
+'''
+
+
+def recreate_postgres_database(name):
+    import psycopg
+
+    with psycopg.connect(
+        dbname='postgres',
+        host=os.environ.get('POSTGRES_HOST', 'localhost'),
+        port=os.environ.get('POSTGRES_PORT') or None,
+        user=os.environ.get('POSTGRES_USER', 'projectuser'),
+        password=os.environ.get('POSTGRES_PASSWORD', 'password'),
+        autocommit=True,
+    ) as connection:
+        connection.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        connection.execute(f'CREATE DATABASE "{name}"')
+
+
+def prepare(env, users):
+    """Migrate and seed the database env points at; returns an API token."""
+    subprocess.run(
+        [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True,
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', SEED_SCRIPT, str(users)],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def endpoint_requests(token, users):
+    return {
+        'check-username': [
+            build_request('POST', '/api/auth/check-username/', HOST, form={'username': f'N/{n}'})
+            for n in range(1, min(users, 200), 2)
+        ],
+        'verify-code': [
+            build_request('POST', '/api/auth/verify-code/', HOST, form={'username': 'N/1', 'code': '123456'})
+        ],
+        'users': [
+            build_request('GET', '/api/auth/users/', HOST, headers={'Authorization': f'Token {token}'})
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=5000, help='rows seeded into the roster')
+    parser.add_argument('--postgres-db', default='login_api_bench')
+    parser.add_argument('--worker-class', default='gthread', choices=['sync', 'gthread', 'uvicorn'])
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) + 1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per endpoint')
+    args = parser.parse_args()
+
+    server_env = {
+        'DJANGO_DEBUG': 'false',
+        'WEB_WORKER_CLASS': args.worker_class,
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        # Every request comes from one address; keep the throttle out of it
+        'CHECK_USERNAME_RATE': '1000000/min',
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = {
+            'sqlite': dict(os.environ, **server_env, DATABASE_ENGINE='sqlite',
+                           SQLITE_PATH=str(Path(tmp) / 'bench.sqlite3')),
+            'postgresql': dict(os.environ, **server_env, DATABASE_ENGINE='postgresql',
+                               POSTGRES_DB=args.postgres_db),
+        }
+        recreate_postgres_database(args.postgres_db)
+
+        print(f'{args.users} users, {args.worker_class} w={args.workers} t={args.threads}, '
+              f'{args.concurrency} clients, {args.duration}s per endpoint')
+        results = {}
+        for profile, env in profiles.items():
+            token = prepare(env, args.users)
+            requests = endpoint_requests(token, args.users)
+            port = free_port()
+            server = start_server(env, port)
+            try:
+                print(profile)
+                for name, payloads in requests.items():
+                    run_load(HOST, port, payloads, concurrency=args.concurrency, duration=1.0)
+                    result = run_load(HOST, port, payloads, concurrency=args.concurrency, duration=args.duration)
+                    results[profile, name] = result.throughput
+                    print(f'  {name:<15} {result.summary()}')
+            finally:
+                stop_server(server)
+
+        print('\nPostgreSQL vs SQLite (req/s)')
+        for name in requests:
+            sqlite, postgres = results['sqlite', name], results['postgresql', name]
+            print(f'  {name:<15} {sqlite:9.1f} {postgres:9.1f}  {postgres / sqlite:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Login-path lookup cost at scale.
+
+Seeds a throwaway database (1M users by default), then times each lookup
+the login flow performs, fed with messy client input (wrong case, stray
+spaces), and prints its query plan. Case-insensitive iexact lookups are
+included for contrast: they can't use the unique indexes and scan the
+table.
+
+    python -m benchmarks.bench_lookup [--rows 1000000] [--probes 2000]
+"""
+import argparse
+import random
+import time
+
+from authentication.testing import seed_users
+from benchmarks.utils import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--probes', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from authentication.backends import CodeBackend
+    from authentication.models import User
+    from authentication.utils import normalize_phone, normalize_service_number
+
+    with test_database():
+        start = time.perf_counter()
+        seed_users(args.rows)
+        print(f'seeded {args.rows:,} users in {time.perf_counter() - start:.1f}s\n')
+
+        rng = random.Random(42)
+        ids = [rng.randrange(args.rows) for _ in range(args.probes)]
+        backend = CodeBackend()
+
+        # Raw client input, deliberately not in canonical form
+        def service_number(i):
+            return f" n/{i} " if i % 2 else f"na/ {i}"
+
+        def username(i):
+            return f" Officer{i}"
+
+        def phone(i):
+            return f"+234 803 {i % 10_000_000:07d}"
+
+        lookups = {
+            'check-username (serviceNumber)': (
+                lambda i: User.objects.filter(serviceNumber=normalize_service_number(service_number(i))).first(),
+                lambda i: User.objects.filter(serviceNumber=normalize_service_number(service_number(i))),
+            ),
+            'CodeBackend by service number': (
+                lambda i: backend.get_login_user(service_number(i)),
+                None,
+            ),
+            'CodeBackend by username': (
+                lambda i: backend.get_login_user(username(i)),
+                None,
+            ),
+            'get_by_natural_key': (
+                lambda i: User.objects.get_by_natural_key(service_number(i)),
+                None,
+            ),
+            'phone_e164': (
+                lambda i: User.objects.filter(phone_e164=normalize_phone(phone(i))).first(),
+                lambda i: User.objects.filter(phone_e164=normalize_phone(phone(i))),
+            ),
+            'serviceNumber__iexact (avoid)': (
+                lambda i: User.objects.filter(serviceNumber__iexact=service_number(i).strip()).first(),
+                lambda i: User.objects.filter(serviceNumber__iexact=service_number(i).strip()),
+            ),
+        }
+
+        for name, (lookup, queryset) in lookups.items():
+            probes = ids if 'iexact' not in name else ids[:20]
+            start = time.perf_counter()
+            misses = sum(lookup(i) is None for i in probes)
+            elapsed = (time.perf_counter() - start) / len(probes)
+            print(f'{name:<32} {elapsed * 1e6:10.1f} us/lookup  misses {misses}')
+            if queryset is not None:
+                for line in queryset(ids[0]).explain().splitlines():
+                    print(f'    {line}')
+
+        # The backend's OR query, shown once
+        from django.db.models import Q
+        print('CodeBackend query plan')
+        plan = User.objects.filter(Q(username='officer1') | Q(serviceNumber='N/1')).explain()
+        for line in plan.splitlines():
+            print(f'    {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Memory per request on the read paths, before and after the projections.
+
+users/ over a 100k-row roster is rendered in a fresh interpreter per
+variant and run, so peak RSS isn't polluted by the other variant:
+
+    instances    ListAPIView.list: a User instance per row through
+                 UserListSerializer (the previous implementation)
+    projection   UserListView.list: values_list() rows through
+                 serialize_roster()
+
+Each variant is run twice: once for peak RSS (ru_maxrss, and its growth
+over the interpreter at rest) and once, after a warm-up request, under
+tracemalloc for the peak of Python allocations during the request. The
+check-username and login lookups are compared the same way, per lookup.
+
+    python -m benchmarks.bench_memory [--users 100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_databases import prepare
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+REQUEST_SCRIPT = r'''
+import json, resource, sys, tracemalloc
+from benchmarks.utils import setup_django
+setup_django()
+from rest_framework import generics
+from rest_framework.test import APIRequestFactory, force_authenticate
+from authentication.models import User
+from authentication.views import UserListView
+
+variant, trace = sys.argv[1], sys.argv[2] == 'trace'
+if variant == 'instances':
+    UserListView.list = generics.ListAPIView.list
+view = UserListView.as_view()
+user = User.objects.get(serviceNumber='N/1')
+factory = APIRequestFactory()
+
+def request():
+    request = factory.get('/api/auth/users/', HTTP_HOST='localhost')
+    force_authenticate(request, user=user)
+    return len(view(request).render().content)
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if trace:
+    request()  # imports and first-call caches stay out of the trace
+    tracemalloc.start()
+size = request()
+result = {'bytes': size}
+if trace:
+    result['traced_peak'] = tracemalloc.get_traced_memory()[1]
+else:
+    result['rss_before'] = before * 1024
+    result['rss_peak'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps(result))
+'''
+
+LOOKUP_SCRIPT = r'''
+import json, tracemalloc
+from benchmarks.utils import setup_django
+setup_django()
+from django.db.models import Q
+from authentication.backends import LOGIN_FIELDS
+from authentication.models import User
+
+def check_before(n):
+    user = User.objects.filter(serviceNumber=f'N/{n}').first()
+    return user.serviceNumber, user.phone
+
+def check_after(n):
+    return User.objects.filter(serviceNumber=f'N/{n}').values_list('serviceNumber', 'phone').first()
+
+def login_before(n):
+    return User.objects.get(Q(username=f'officer{n}') | Q(serviceNumber=f'N/{n}'))
+
+def login_after(n):
+    return User.objects.only(*LOGIN_FIELDS).get(Q(username=f'officer{n}') | Q(serviceNumber=f'N/{n}'))
+
+results = {}
+for name, lookup in [('check-username', (check_before, check_after)), ('login', (login_before, login_after))]:
+    for label, func in zip(('before', 'after'), lookup):
+        func(1)
+        peaks = []
+        for n in range(1, 200, 2):
+            tracemalloc.start()
+            result = func(n)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results[f'{name} {label}'] = sum(peaks) / len(peaks)
+print(json.dumps(results))
+'''
+
+
+def run(script, env, *args):
+    result = subprocess.run(
+        [sys.executable, '-c', script, *args],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DJANGO_DEBUG='false', SQLITE_PATH=str(Path(tmp) / 'memory.sqlite3'))
+        prepare(env, args.users)
+
+        print(f'users/ with {args.users:,} rows, one request')
+        print(f"  {'variant':<12} {'body MB':>8} {'traced peak MB':>15} {'RSS growth MB':>14} {'peak RSS MB':>12}")
+        for variant in ('instances', 'projection'):
+            rss = run(REQUEST_SCRIPT, env, variant, 'rss')
+            traced = run(REQUEST_SCRIPT, env, variant, 'trace')
+            print(
+                f"  {variant:<12} {rss['bytes'] / mb:>8.1f} {traced['traced_peak'] / mb:>15.1f} "
+                f"{(rss['rss_peak'] - rss['rss_before']) / mb:>14.1f} {rss['rss_peak'] / mb:>12.1f}"
+            )
+
+        print('\nLookups, traced peak per call')
+        for name, peak in run(LOOKUP_SCRIPT, env).items():
+            print(f'  {name:<24} {peak / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Per-request cost of the middleware stack on API routes.
+
+Runs check-username and users/ through a WSGI handler built with Django's
+stock session/CSRF/auth/messages/X-Frame-Options middleware and
+SessionAuthentication (the stack before API routes were scoped out), then
+with the project's MIDDLEWARE, and prints the median time per request.
+Requests go straight into the handler, so socket and server overhead are
+left out and the difference is the middleware and authentication work.
+
+    python -m benchmarks.bench_middleware [--requests 2000] [--rounds 10] [--users 200]
+"""
+import argparse
+import io
+import statistics
+import time
+from collections import defaultdict
+
+from authentication.testing import seed_users
+from benchmarks.utils import create_token, setup_django, test_database
+
+STOCK_MIDDLEWARE = {
+    'core.middleware.SessionMiddleware': 'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.AuthenticationMiddleware': 'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.MessageMiddleware': 'django.contrib.messages.middleware.MessageMiddleware',
+}
+
+
+def environ(method, path, body=b'', **extra):
+    return {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(body),
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)), 'REMOTE_ADDR': '127.0.0.1',
+        **extra,
+    }
+
+
+def measure(handler, make_environ, count):
+    samples = []
+    for i in range(count):
+        env = make_environ(i)
+        start = time.perf_counter()
+        response = handler(env, lambda status, headers: None)
+        b''.join(response)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint and stack')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--users', type=int, default=200, help='rows seeded into the roster')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test.utils import override_settings
+    from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+    from rest_framework.views import APIView
+
+    stock_middleware = [STOCK_MIDDLEWARE.get(path, path) for path in settings.MIDDLEWARE]
+    # Views copy DEFAULT_AUTHENTICATION_CLASSES at import time, so patch the
+    # class attribute they inherit rather than the setting
+    stacks = {
+        'stock': (stock_middleware, [TokenAuthentication, SessionAuthentication]),
+        'lean': (settings.MIDDLEWARE, APIView.authentication_classes),
+    }
+
+    with test_database():
+        seed_users(args.users)
+        token = create_token()
+        endpoints = {
+            # Each lookup counts against the check-username throttle, so
+            # spread them over client addresses
+            'check-username': lambda i: environ(
+                'POST', '/api/auth/check-username/', f'username=N%2F{i % args.users | 1}'.encode(),
+                REMOTE_ADDR=f'10.0.{i // 250 % 250}.{i % 250}',
+            ),
+            'users': lambda i: environ('GET', '/api/auth/users/', HTTP_AUTHORIZATION=f'Token {token}'),
+        }
+
+        handlers = {}
+        for stack, (middleware, _) in stacks.items():
+            with override_settings(MIDDLEWARE=middleware):
+                handlers[stack] = WSGIHandler()
+
+        # Alternate the stacks in short rounds so drift (throttle cache,
+        # CPU frequency) hits both equally
+        samples = defaultdict(list)
+        default_authentication = APIView.authentication_classes
+        try:
+            for round_number in range(-1, args.rounds):
+                for stack, (_, authentication_classes) in stacks.items():
+                    APIView.authentication_classes = authentication_classes
+                    for name, make_environ in endpoints.items():
+                        cache.clear()
+                        result = measure(handlers[stack], make_environ, args.requests // args.rounds)
+                        if round_number >= 0:  # the first round only warms up
+                            samples[stack, name].append(result)
+        finally:
+            APIView.authentication_classes = default_authentication
+        results = {key: statistics.median(values) for key, values in samples.items()}
+
+        print(f'{args.requests} requests per endpoint, {args.users} users, median per request')
+        print(f"  {'endpoint':<16} {'stock us':>10} {'lean us':>10} {'saved us':>10} {'saved':>7}")
+        for name in endpoints:
+            before, after = results['stock', name], results['lean', name]
+            print(
+                f'  {name:<16} {before * 1e6:>10.1f} {after * 1e6:>10.1f} '
+                f'{(before - after) * 1e6:>10.1f} {(before - after) / before:>7.1%}'
+            )
+
+
+if __name__ == '__main__':
+    main()
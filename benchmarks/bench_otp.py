@@ -0,0 +1,99 @@
+"""
+Latency of the two login steps with static passcodes and with SMS codes.
+
+Runs in-process against a seeded throwaway SQLite file, with the
+in-memory SMS backend standing in for the provider (--provider-ms of
+simulated round trip per message):
+
+    static        passcode login, no SMS
+    sms-inline    SMS_DISPATCH_ASYNC off: check-username sends the SMS itself
+    sms-async     the default: the SMS thread sends it
+
+For each mode it prints the median and p95 of check-username and
+verify-code. For sms-async it also prints how long the queue took to
+drain, i.e. when the last message reached the provider.
+
+    python -m benchmarks.bench_otp [--users 1000] [--requests 50] [--provider-ms 200]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_databases import prepare
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50, help='logins per mode, one per user')
+    parser.add_argument('--provider-ms', type=float, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DJANGO_DEBUG='false', SQLITE_PATH=str(Path(tmp) / 'otp.sqlite3'),
+                          CHECK_USERNAME_RATE='1000000/min')
+        prepare(dict(os.environ), args.users)
+
+        from benchmarks.utils import setup_django
+        setup_django()
+        from django.core.cache import cache
+        from django.test import Client, override_settings
+        from authentication import audit, sms
+
+        modes = {
+            'static': {'LOGIN_CODE_MODE': 'static'},
+            'sms-inline': {'LOGIN_CODE_MODE': 'sms', 'SMS_DISPATCH_ASYNC': False},
+            'sms-async': {'LOGIN_CODE_MODE': 'sms', 'SMS_DISPATCH_ASYNC': True},
+        }
+        client = Client(HTTP_HOST='localhost')
+        service_numbers = [f'N/{n}' for n in range(1, args.users, 2)][:args.requests]
+
+        print(f'{len(service_numbers)} logins per mode, provider round trip {args.provider_ms:.0f} ms')
+        print(f"{'mode':<12} {'check p50':>10} {'check p95':>10} {'verify p50':>11} {'verify p95':>11}  queue drained")
+        for mode, overrides in modes.items():
+            cache.clear()
+            sms.outbox.clear()
+            with override_settings(
+                SMS_BACKEND='authentication.sms.LocMemBackend',
+                SMS_LOCMEM_DELAY=args.provider_ms / 1000,
+                LOGIN_AUDIT_ENABLED=False,
+                **overrides,
+            ):
+                checks = []
+                started = time.perf_counter()
+                for service_number in service_numbers:
+                    start = time.perf_counter()
+                    response = client.post('/api/auth/check-username/', {'username': service_number})
+                    checks.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.content
+                sms.dispatcher.join()
+                drained = time.perf_counter() - started
+
+                # Codes by phone number, as the users would read them
+                codes = {entry['to']: entry['message'].split()[4].rstrip('.') for entry in sms.outbox}
+                verifies = []
+                for service_number in service_numbers:
+                    n = int(service_number[2:])
+                    code = codes.get(f'0803{n:07d}', '123456')
+                    start = time.perf_counter()
+                    response = client.post('/api/auth/verify-code/', {'username': service_number, 'code': code})
+                    verifies.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.content
+            audit.flush()
+
+            ms = 1000
+            print(f'{mode:<12} {statistics.median(checks) * ms:>10.2f} {percentile(checks, 0.95) * ms:>10.2f} '
+                  f'{statistics.median(verifies) * ms:>11.2f} {percentile(verifies, 0.95) * ms:>11.2f}  '
+                  + (f'{drained:.2f}s' if mode == 'sms-async' else ''))
+
+
+if __name__ == '__main__':
+    main()
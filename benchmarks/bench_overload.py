@@ -0,0 +1,99 @@
+"""
+A shift-change login storm, with and without the concurrency limiter.
+
+Seeds a throwaway SQLite file and serves it through gunicorn.conf.py,
+gthread (WSGI) and uvicorn (ASGI, async views), each with
+DJANGO_CONCURRENCY_LIMIT off and on. Three client groups run at once
+for --duration seconds:
+
+    check-username    --check clients
+    verify-code       --verify clients (a PBKDF2 hash per request)
+    users             --roster clients refreshing users/
+
+Clients give up after --timeout seconds, as a phone app would, and honour
+Retry-After on a 503. Every request carries X-Request-Start stamped when
+it is sent, the way the proxy would stamp it. This lets the gthread
+deployment shed requests that queued in gunicorn.
+
+For each endpoint the benchmark prints goodput (2xx per second), the
+latency of the 2xx responses, how many were shed with 503, and how many
+timed out. The default client counts overload a single core a few times
+over. Far larger storms need shedding in front of the app as well: a worker
+still has to accept and parse each request before it can refuse it.
+
+    python -m benchmarks.bench_overload [--check 100] [--verify 20] [--roster 30] [--duration 20]
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_databases import endpoint_requests, prepare
+from benchmarks.bench_server import HOST, start_server, stop_server
+from benchmarks.loadgen import free_port, run_mixed
+
+DEPLOYMENTS = {
+    'wsgi': {'WEB_WORKER_CLASS': 'gthread'},
+    'wsgi+limit': {'WEB_WORKER_CLASS': 'gthread', 'DJANGO_CONCURRENCY_LIMIT': 'true'},
+    'asgi': {'WEB_WORKER_CLASS': 'uvicorn'},
+    'asgi+limit': {'WEB_WORKER_CLASS': 'uvicorn', 'DJANGO_CONCURRENCY_LIMIT': 'true'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000, help='rows seeded into the roster')
+    parser.add_argument('--check', type=int, default=100, help='check-username clients')
+    parser.add_argument('--verify', type=int, default=20, help='verify-code clients')
+    parser.add_argument('--roster', type=int, default=30, help='users/ clients')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds before a client gives up')
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) + 1)
+    parser.add_argument('--threads', type=int, default=4, help='threads per gthread worker')
+    parser.add_argument('--deployments', nargs='+', default=list(DEPLOYMENTS), choices=list(DEPLOYMENTS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DJANGO_DEBUG='false',
+            SQLITE_PATH=str(Path(tmp) / 'overload.sqlite3'),
+            WEB_CONCURRENCY=str(args.workers),
+            GUNICORN_THREADS=str(args.threads),
+            DJANGO_CONCURRENCY_LIMIT='false',
+            # Every request comes from one address; keep the throttle out of it
+            CHECK_USERNAME_RATE='1000000/min',
+        )
+        token = prepare(env, args.users)
+        requests = endpoint_requests(token, args.users)
+        groups = {
+            'check-username': (requests['check-username'], args.check),
+            'verify-code': (requests['verify-code'], args.verify),
+            'users': (requests['users'], args.roster),
+        }
+
+        print(f'{args.users} users, {args.workers} workers, clients: {args.check} check-username, '
+              f'{args.verify} verify-code, {args.roster} users; {args.duration}s, {args.timeout}s timeout')
+        print(f"{'':<17} {'2xx/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'503':>7} {'timeouts':>9}")
+        for deployment in args.deployments:
+            port = free_port()
+            server = start_server(dict(env, **DEPLOYMENTS[deployment]), port)
+            try:
+                run_mixed(HOST, port, {name: (payloads, 1) for name, (payloads, _) in groups.items()}, duration=2.0)
+                results = run_mixed(
+                    HOST, port, groups, duration=args.duration, timeout=args.timeout,
+                    stamp_header='X-Request-Start', retry_after=True,
+                )
+            finally:
+                stop_server(server)
+            print(deployment)
+            for name, result in results.items():
+                ok = sorted(result.ok_latencies)
+                p50 = ok[len(ok) // 2] * 1000 if ok else float('nan')
+                p99 = ok[min(len(ok) - 1, int(len(ok) * 0.99))] * 1000 if ok else float('nan')
+                print(f'  {name:<15} {len(ok) / result.duration:8.1f} {p50:8.1f} {p99:8.1f} '
+                      f'{result.statuses.get(503, 0):7d} {result.errors:9d}')
+
+
+if __name__ == '__main__':
+    main()
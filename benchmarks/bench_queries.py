@@ -0,0 +1,111 @@
+"""
+Queries, database time and wall time per endpoint and admin page at scale.
+
+The same pages as the query-budget tests in authentication/tests.py, against
+a larger seeded database (100k users by default). Each page is requested
+--repeat times; the query count, the median database time and the median
+wall time are printed, along with any full scan of the user table. With
+--explain, the query plans are printed too.
+
+    python -m benchmarks.bench_queries [--users 100000] [--attempts 200000] [--repeat 20] [--explain]
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from authentication.testing import seed_users
+from benchmarks.utils import create_token, setup_django, test_database
+
+
+def seed_attempts(count, users, batch_size=5000):
+    from django.utils import timezone
+    from authentication.models import LoginAttempt
+
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        LoginAttempt.objects.bulk_create([
+            LoginAttempt(
+                created_at=now - timedelta(seconds=i),
+                username=f'N/{i % users}' if i % 2 else f'NA/{i % users}',
+                successful=bool(i % 4),
+                ip_address=f'10.{i // 62500 % 250}.{i // 250 % 250}.{i % 250}',
+                user_agent='python-requests/2.32',
+                latency_ms=40,
+            )
+            for i in range(start, min(start + batch_size, count))
+        ], batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--attempts', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--explain', action='store_true', help='print every query plan')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client, override_settings
+    from authentication.models import User
+    from core.querylog import QueryLog, full_scans
+
+    with test_database(), override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        LOGIN_AUDIT_ENABLED=False,
+    ):
+        start = time.perf_counter()
+        seed_users(args.users)
+        seed_attempts(args.attempts, args.users)
+        print(f'seeded {args.users:,} users and {args.attempts:,} login attempts '
+              f'in {time.perf_counter() - start:.1f}s\n')
+
+        token = create_token()
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', serviceNumber='N/999999999', code='654321',
+        )
+        user_id = User.objects.get(serviceNumber='N/1').pk
+        api = Client()
+        staff = Client()
+        staff.force_login(admin)
+        batch = [f'N/{n}' for n in range(1, 1000, 2)]
+
+        pages = {
+            'check-username': lambda: api.post('/api/auth/check-username/', {'username': ' n/17 '}),
+            'check-username-batch': lambda: api.post(
+                '/api/auth/check-username/batch/', {'usernames': batch}, content_type='application/json',
+            ),
+            'verify-code': lambda: api.post('/api/auth/verify-code/', {'username': 'N/1', 'code': '123456'}),
+            'users': lambda: api.get('/api/auth/users/', HTTP_AUTHORIZATION=f'Token {token}'),
+            'admin-index': lambda: staff.get('/admin/'),
+            'admin-user-changelist': lambda: staff.get('/admin/authentication/user/'),
+            'admin-user-change': lambda: staff.get(f'/admin/authentication/user/{user_id}/change/'),
+            'admin-loginattempt-changelist': lambda: staff.get('/admin/authentication/loginattempt/'),
+            'admin-loginattempt-search-ip': lambda: staff.get('/admin/authentication/loginattempt/?q=10.0.1.7'),
+        }
+
+        print(f"{'page':<32} {'queries':>7} {'db ms':>9} {'wall ms':>9}  full scans of user table")
+        for name, request in pages.items():
+            db_times, wall_times = [], []
+            for _ in range(args.repeat):
+                cache.clear()  # so the check-username throttle never kicks in
+                with QueryLog() as log:
+                    start = time.perf_counter()
+                    request().getvalue()
+                    wall_times.append(time.perf_counter() - start)
+                db_times.append(log.duration)
+            plans = log.plans()
+            scans = sum(bool(full_scans(plan, User._meta.db_table, connection.vendor)) for _, plan in plans)
+            print(f'{name:<32} {log.count:>7} {statistics.median(db_times) * 1000:>9.2f} '
+                  f'{statistics.median(wall_times) * 1000:>9.2f}  {scans or ""}')
+            if args.explain:
+                for sql, plan in plans:
+                    print(f'    {sql[:100]}')
+                    for line in plan:
+                        print(f'        {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Bytes on the wire and encode time for the users/ payload, per renderer and
+content coding.
+
+    python -m benchmarks.bench_renderers [--rows 10000]
+
+MessagePack and brotli rows are only reported when those optional packages
+are installed.
+"""
+import argparse
+
+from benchmarks.utils import setup_django, timed
+
+
+def make_users(count):
+    return [
+        {
+            'id': i + 1,
+            'username': f'officer{i}',
+            'name': f'Officer {i}',
+            'serviceNumber': f'N/{i + 1}',
+            'email': f'officer{i}@example.com',
+            'phone': f'0803{i:07d}',
+            'profile_image': f'http://localhost:8000/media/profile_images/officer{i}.jpg' if i % 3 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils.text import compress_string
+    from rest_framework.renderers import JSONRenderer
+    from authentication.renderers import COMPACT_RENDERER_CLASSES
+    from core.middleware import brotli
+
+    users = make_users(args.rows)
+    codings = {'identity': None, 'gzip': compress_string}
+    if brotli is not None:
+        codings['br'] = lambda data: brotli.compress(data, quality=5)
+
+    print(f'{args.rows} rows')
+    print(f"  {'renderer':<36} {'coding':<9} {'bytes':>12} {'encode ms':>10}")
+    for renderer_class in [JSONRenderer, *COMPACT_RENDERER_CLASSES]:
+        renderer = renderer_class()
+        for coding, compress in codings.items():
+            def encode():
+                body = renderer.render(users, renderer.media_type, {})
+                return compress(body) if compress else body
+            elapsed, body = timed(encode)
+            print(f'  {renderer.media_type:<36} {coding:<9} {len(body):>12,} {elapsed * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Sweep gunicorn settings against the login and roster endpoints.
+
+Seeds a throwaway SQLite database, then for every combination of worker
+class, worker count, thread count, preload, max-requests and keep-alive
+starts gunicorn with gunicorn.conf.py (configured through the same
+environment variables a deployment would use), drives check-username and
+users/ with the asyncio load generator, and prints throughput per core.
+The best configuration per endpoint is listed last.
+
+    python -m benchmarks.bench_server
+    python -m benchmarks.bench_server --classes gthread uvicorn --workers 2 4 --threads 2 8
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.loadgen import build_request, free_port, run_load, wait_for_port
+from authentication.testing import seed_users
+from benchmarks.utils import create_token, setup_django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+HOST = '127.0.0.1'
+
+
+def prepare_database(path, users):
+    os.environ['SQLITE_PATH'] = str(path)
+    os.environ['DJANGO_DEBUG'] = 'false'
+    # Every request comes from one address; keep the throttle out of it
+    os.environ['CHECK_USERNAME_RATE'] = '1000000/min'
+    setup_django()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    seed_users(users)
+    return create_token()
+
+
+def endpoint_requests(token, host):
+    return {
+        'check-username': [
+            build_request('POST', '/api/auth/check-username/', host, form={'username': f'N/{n}'})
+            for n in range(1, 200, 2)
+        ],
+        'users': [
+            build_request('GET', '/api/auth/users/', host, headers={'Authorization': f'Token {token}'})
+        ],
+    }
+
+
+def start_server(env_overrides, port):
+    # Throughput runs measure the server, not the load shedding in front of
+    # it; bench_overload turns the limiter on explicitly
+    env = {'DJANGO_CONCURRENCY_LIMIT': 'false', **os.environ, **env_overrides, 'GUNICORN_BIND': f'{HOST}:{port}'}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn'],
+        cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(HOST, port)
+    except TimeoutError:
+        process.kill()
+        raise
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def configurations(args):
+    for worker_class, workers, preload, max_requests, keepalive in itertools.product(
+        args.classes, args.workers, args.preload, args.max_requests, args.keepalive,
+    ):
+        # Threads only mean something for gthread workers
+        for threads in (args.threads if worker_class == 'gthread' else [1]):
+            yield {
+                'WEB_WORKER_CLASS': worker_class,
+                'WEB_CONCURRENCY': str(workers),
+                'GUNICORN_THREADS': str(threads),
+                'GUNICORN_PRELOAD': str(preload).lower(),
+                'GUNICORN_MAX_REQUESTS': str(max_requests),
+                'GUNICORN_KEEPALIVE': str(keepalive),
+            }
+
+
+def describe(config):
+    return (
+        f"{config['WEB_WORKER_CLASS']:<8} w={config['WEB_CONCURRENCY']:<3} "
+        f"t={config['GUNICORN_THREADS']:<3} preload={config['GUNICORN_PRELOAD']:<5} "
+        f"max_req={config['GUNICORN_MAX_REQUESTS']:<5} keepalive={config['GUNICORN_KEEPALIVE']}"
+    )
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--classes', nargs='+', default=['sync', 'gthread', 'uvicorn'],
+                        choices=['sync', 'gthread', 'uvicorn'])
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({cores, cores + 1, 2 * cores + 1}))
+    parser.add_argument('--threads', type=int, nargs='+', default=[4])
+    parser.add_argument('--preload', type=lambda v: v.lower() == 'true', nargs='+', default=[True])
+    parser.add_argument('--max-requests', type=int, nargs='+', default=[1000])
+    parser.add_argument('--keepalive', type=int, nargs='+', default=[5])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per endpoint')
+    parser.add_argument('--users', type=int, default=500, help='rows seeded into the roster')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        token = prepare_database(Path(tmp) / 'bench.sqlite3', args.users)
+        requests = endpoint_requests(token, HOST)
+        best = {}
+
+        print(f'{cores} core(s), {args.users} users, {args.concurrency} clients, {args.duration}s per endpoint')
+        for config in configurations(args):
+            port = free_port()
+            try:
+                server = start_server(config, port)
+            except TimeoutError:
+                print(f'{describe(config)}  failed to start')
+                continue
+            try:
+                print(describe(config))
+                for name, payloads in requests.items():
+                    # Warm up workers so imports and first connections aren't measured
+                    run_load(HOST, port, payloads, concurrency=args.concurrency, duration=1.0)
+                    result = run_load(HOST, port, payloads, concurrency=args.concurrency, duration=args.duration)
+                    per_core = result.throughput / cores
+                    print(f'  {name:<15} {per_core:9.1f} req/s/core  {result.summary()}')
+                    if per_core > best.get(name, (0, None))[0]:
+                        best[name] = (per_core, config)
+            finally:
+                stop_server(server)
+
+        print('\nBest per endpoint')
+        for name, (per_core, config) in best.items():
+            print(f'  {name:<15} {per_core:9.1f} req/s/core  {describe(config)}')
+
+
+if __name__ == '__main__':
+    main()
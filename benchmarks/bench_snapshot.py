@@ -0,0 +1,87 @@
+"""
+Full-roster reads: users/ against the precomputed snapshot file.
+
+Seeds a throwaway SQLite file, builds the roster snapshot, serves both
+through gunicorn.conf.py and drives each with the asyncio load generator:
+
+    users/            ORM query, serialization, compression per request
+    users/snapshot/   the signed-URL lookup a client makes first
+    snapshot file     the precompressed file behind that URL
+
+Both the API route and the file are fetched with gzip and brotli. The
+benchmark prints throughput, latency and body size for each, and the time
+a snapshot takes to build.
+
+    python -m benchmarks.bench_snapshot [--users 10000] [--concurrency 16] [--duration 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from benchmarks.bench_databases import prepare
+from benchmarks.bench_server import BASE_DIR, HOST, start_server, stop_server
+from benchmarks.loadgen import build_request, free_port, run_load
+
+
+def body_size(port, path, headers):
+    request = urllib.request.Request(f'http://{HOST}:{port}{path}', headers=headers)
+    with urllib.request.urlopen(request) as response:
+        return len(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10_000, help='rows seeded into the roster')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per request type')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DJANGO_DEBUG='false',
+            SQLITE_PATH=str(Path(tmp) / 'snapshot.sqlite3'),
+            ROSTER_SNAPSHOT_DIR=str(Path(tmp) / 'snapshots'),
+        )
+        token = prepare(env, args.users)
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, 'manage.py', 'build_roster_snapshot'],
+            cwd=BASE_DIR, env=env, check=True, capture_output=True,
+        )
+        print(f'{args.users} users, snapshot built in {time.perf_counter() - start:.2f}s '
+              f'(including interpreter start-up)')
+
+        port = free_port()
+        server = start_server(env, port)
+        try:
+            auth = {'Authorization': f'Token {token}'}
+            request = urllib.request.Request(f'http://{HOST}:{port}/api/auth/users/snapshot/', headers=auth)
+            with urllib.request.urlopen(request) as response:
+                url = json.load(response)['url']
+            file_path = url.split(f'{HOST}:{port}', 1)[1]
+
+            print(f"  {'':<26} {'body bytes':>11}")
+            for name, path, headers in [
+                ('users/ gzip', '/api/auth/users/', {**auth, 'Accept-Encoding': 'gzip'}),
+                ('users/ br', '/api/auth/users/', {**auth, 'Accept-Encoding': 'br'}),
+                ('users/snapshot/', '/api/auth/users/snapshot/', auth),
+                ('snapshot file gzip', file_path, {'Accept-Encoding': 'gzip'}),
+                ('snapshot file br', file_path, {'Accept-Encoding': 'br'}),
+            ]:
+                payloads = [build_request('GET', path, HOST, headers=headers)]
+                run_load(HOST, port, payloads, concurrency=args.concurrency, duration=1.0)
+                result = run_load(HOST, port, payloads, concurrency=args.concurrency, duration=args.duration)
+                print(f'  {name:<26} {body_size(port, path, headers):>11,}  {result.summary()}')
+        finally:
+            stop_server(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Headless benchmark for the desktop client's users table.
+
+Compares the old full rebuild (delete every row, insert the whole roster)
+with UsersTable's paged, id-diffed refresh. Tk calls are made against an
+in-memory stand-in for ttk.Treeview, so no display is needed.
+
+    python -m benchmarks.bench_users_table [--sizes 10000 100000]
+"""
+import argparse
+import time
+
+from main import UsersTable, user_row
+
+
+class FakeTree:
+    """Records Treeview calls; keeps just enough state to behave like one."""
+
+    def __init__(self):
+        self.values = {}  # iid -> values, in display order
+        self.counter = 0
+        self.calls = 0
+
+    def get_children(self):
+        self.calls += 1
+        return tuple(self.values)
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.calls += 1
+        if iid is None:
+            self.counter += 1
+            iid = f"I{self.counter}"
+        if index == "end" or index >= len(self.values):
+            self.values[iid] = values
+        else:
+            items = list(self.values.items())
+            items.insert(index, (iid, values))
+            self.values = dict(items)
+        return iid
+
+    def item(self, iid, values=None):
+        self.calls += 1
+        self.values[iid] = values
+
+    def move(self, iid, parent, index):
+        values = self.values.pop(iid)
+        self.insert(parent, index, iid, values)
+
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            del self.values[iid]
+
+
+def make_users(count, changed_every=0):
+    users = []
+    for i in range(count):
+        name = f"Officer {i}"
+        if changed_every and i % changed_every == 0:
+            name += " (updated)"
+        users.append({
+            "id": i + 1,
+            "serviceNumber": f"N/{i + 1}",
+            "name": name,
+            "email": f"officer{i}@example.com",
+            "phone": "0803******12",
+        })
+    return users
+
+
+def full_rebuild(tree, users):
+    for item in tree.get_children():
+        tree.delete(item)
+    for user in users:
+        tree.insert("", "end", values=user_row(user))
+
+
+def measure(label, func, tree):
+    calls = tree.calls
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed * 1000:10.1f} ms {tree.calls - calls:10d} Tk calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        users = make_users(size)
+        updated = make_users(size, changed_every=100)
+        print(f"{size} rows")
+
+        tree = FakeTree()
+        measure("full rebuild: first load", lambda: full_rebuild(tree, users), tree)
+        measure("full rebuild: refresh", lambda: full_rebuild(tree, updated), tree)
+
+        tree = FakeTree()
+        table = UsersTable(tree)
+        measure("paged: first load", lambda: table.load(users), tree)
+        measure("paged: refresh, no changes", lambda: table.load(users), tree)
+        measure("paged: refresh, 1% changed", lambda: table.load(updated), tree)
+        measure("paged: scroll one page", table.load_more, tree)
+        measure("paged: search", lambda: table.search("officer 4242"), tree)
+        measure("paged: clear search", lambda: table.search(""), tree)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Minimal asyncio HTTP/1.1 load generator used by the server benchmarks.
+
+Each simulated client holds one keep-alive connection and issues requests
+back to back for the duration of the run. No third-party HTTP client is
+needed, which keeps the client side cheap enough not to be the bottleneck.
+"""
+import asyncio
+import socket
+import statistics
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+
+def build_request(method, path, host, headers=None, form=None):
+    """Encode one HTTP/1.1 request as bytes, ready to be sent repeatedly."""
+    body = urlencode(form).encode() if form is not None else b''
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host}', 'Connection: keep-alive']
+    if form is not None:
+        lines.append('Content-Type: application/x-www-form-urlencoded')
+    if body or method in ('POST', 'PUT', 'PATCH'):
+        lines.append(f'Content-Length: {len(body)}')
+    for name, value in (headers or {}).items():
+        lines.append(f'{name}: {value}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+@dataclass
+class LoadResult:
+    duration: float
+    latencies: list = field(default_factory=list)
+    ok_latencies: list = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    errors: int = 0
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return float('nan')
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self):
+        mean = statistics.fmean(self.latencies) if self.latencies else float('nan')
+        return (
+            f'{self.throughput:9.1f} req/s  mean {mean * 1000:7.1f} ms  '
+            f'p50 {self.percentile(50) * 1000:7.1f} ms  p99 {self.percentile(99) * 1000:7.1f} ms  '
+            f'errors {self.errors}  statuses {dict(sorted(self.statuses.items()))}'
+        )
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    status = int(status_line.split(' ', 2)[1])
+    headers = {}
+    for line in header_lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    return status, headers
+
+
+def stamp(payload, header):
+    """Add header: t=<now> after the request line, as a proxy would on receipt."""
+    request_line, rest = payload.split(b'\r\n', 1)
+    return b'%s\r\n%s: t=%.6f\r\n%s' % (request_line, header.encode(), time.time(), rest)
+
+
+async def _client(host, port, requests, deadline, result, timeout, stamp_header=None, retry_after=False):
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        payload = requests[index % len(requests)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            writer.write(stamp(payload, stamp_header) if stamp_header else payload)
+            status, headers = await asyncio.wait_for(_read_response(reader), timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            result.errors += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latency = time.perf_counter() - start
+        result.latencies.append(latency)
+        if 200 <= status < 300:
+            result.ok_latencies.append(latency)
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+        if headers.get('connection', '').lower() == 'close':
+            writer.close()
+            reader = writer = None
+        if retry_after and status == 503 and 'retry-after' in headers:
+            await asyncio.sleep(min(float(headers['retry-after']), deadline - time.perf_counter()))
+    if writer is not None:
+        writer.close()
+
+
+async def _run(host, port, requests, concurrency, duration, timeout):
+    start = time.perf_counter()
+    deadline = start + duration
+    result = LoadResult(duration=duration)
+    await asyncio.gather(*(
+        _client(host, port, requests, deadline, result, timeout) for _ in range(concurrency)
+    ))
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def run_load(host, port, requests, concurrency=16, duration=5.0, timeout=30.0):
+    """
+    Hammer host:port with the given pre-encoded requests (cycled in order)
+    from concurrency keep-alive clients for duration seconds.
+    """
+    return asyncio.run(_run(host, port, requests, concurrency, duration, timeout))
+
+
+async def _run_mixed(host, port, groups, duration, timeout, stamp_header, retry_after):
+    start = time.perf_counter()
+    deadline = start + duration
+    results = {name: LoadResult(duration=duration) for name in groups}
+    await asyncio.gather(*(
+        _client(host, port, requests, deadline, results[name], timeout, stamp_header, retry_after)
+        for name, (requests, concurrency) in groups.items()
+        for _ in range(concurrency)
+    ))
+    for result in results.values():
+        result.duration = time.perf_counter() - start
+    return results
+
+
+def run_mixed(host, port, groups, duration=5.0, timeout=30.0, stamp_header=None, retry_after=False):
+    """
+    Run several client groups at once; groups maps a name to (requests,
+    concurrency) and a LoadResult is returned per name. stamp_header adds
+    a request-start time to every request as it is sent; retry_after makes
+    clients wait out a 503's Retry-After before their next request.
+    """
+    return asyncio.run(_run_mixed(host, port, groups, duration, timeout, stamp_header, retry_after))
+
+
+def wait_for_port(host, port, timeout=30.0):
+    """Block until something accepts connections on host:port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'nothing listening on {host}:{port} after {timeout}s')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,45 @@
+import os
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """Configure Django for a standalone benchmark run from the repo root."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+
+def timed(func, repeat=5):
+    """Best wall-clock time of func() over repeat runs, in seconds, and its result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def create_token(service_number='N/1'):
+    from rest_framework.authtoken.models import Token
+    from authentication.models import User
+
+    token, _ = Token.objects.get_or_create(user=User.objects.get(serviceNumber=service_number))
+    return token.key
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """Create a throwaway test database for the default connection."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
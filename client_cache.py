@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Upper bound for cached image bytes before least recently used ones go
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "simple_login_client"
+
+
+class ClientCache:
+    """
+    Local cache for the desktop client.
+
+    Roster rows live in SQLite together with the ETag/Last-Modified
+    validators they were served with, so they can be shown immediately and
+    revalidated with a conditional request. They are keyed by URL, which
+    names the server, and by account, so whoever logs in next on the same
+    machine never sees (or revalidates) another user's roster. Images are stored as files named
+    by the SHA-256 of their content, indexed by URL, and evicted least
+    recently used first once the cache grows past max_bytes.
+
+    Safe to use from the Tk thread and the worker pool at the same time.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory or default_cache_dir())
+        self.image_dir = self.directory / "images"
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.directory / "cache.sqlite3", check_same_thread=False)
+        with self.lock, self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS validators (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT
+                );
+                CREATE TABLE IF NOT EXISTS roster (
+                    url TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (url, position)
+                );
+                CREATE TABLE IF NOT EXISTS images (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS images_accessed ON images (accessed);
+                CREATE INDEX IF NOT EXISTS images_digest ON images (digest);
+            """)
+
+    def conditional_headers(self, url, account=""):
+        """Headers that turn a GET for url into a revalidation of what is cached."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified FROM validators WHERE url = ?", (self._key(url, account),)
+            ).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def get_roster(self, url, account=""):
+        """Return the cached roster for url in server order, or None."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT data FROM roster WHERE url = ? ORDER BY position", (self._key(url, account),)
+            ).fetchall()
+        if not rows:
+            return None
+        return [json.loads(data) for data, in rows]
+
+    def store_roster(self, url, users, headers, account=""):
+        url = self._key(url, account)
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM roster WHERE url = ?", (url,))
+            self.db.executemany(
+                "INSERT INTO roster (url, position, data) VALUES (?, ?, ?)",
+                ((url, position, json.dumps(user)) for position, user in enumerate(users)),
+            )
+            self._store_validators(url, headers)
+
+    def get_image(self, url):
+        """Return cached bytes for url, or None. Marks the image as recently used."""
+        with self.lock, self.db:
+            row = self.db.execute("SELECT digest FROM images WHERE url = ?", (url,)).fetchone()
+            if not row:
+                return None
+            self.db.execute("UPDATE images SET accessed = ? WHERE url = ?", (time.time(), url))
+        try:
+            return self._image_path(row[0]).read_bytes()
+        except FileNotFoundError:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM images WHERE url = ?", (url,))
+            return None
+
+    def store_image(self, url, data, headers=None):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._image_path(digest)
+        if not path.exists():
+            # Write then rename so a crash never leaves a truncated image behind
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO images (url, digest, size, accessed) VALUES (?, ?, ?, ?)",
+                (url, digest, len(data), time.time()),
+            )
+            if headers is not None:
+                self._store_validators(url, headers)
+            self._evict()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def _key(url, account):
+        # Images are shared between accounts and keyed by bare URL
+        return f"{account}\n{url}" if account else url
+
+    def _image_path(self, digest):
+        return self.image_dir / digest[:2] / digest
+
+    def _store_validators(self, url, headers):
+        self.db.execute(
+            "INSERT OR REPLACE INTO validators (url, etag, last_modified) VALUES (?, ?, ?)",
+            (url, headers.get("ETag"), headers.get("Last-Modified")),
+        )
+
+    def _evict(self):
+        """Drop least recently used images until the cache fits in max_bytes."""
+        # Identical content shared by several URLs is only stored once
+        total = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM images)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for url, digest, size in self.db.execute(
+            "SELECT url, digest, size FROM images ORDER BY accessed"
+        ).fetchall():
+            self.db.execute("DELETE FROM images WHERE url = ?", (url,))
+            self.db.execute("DELETE FROM validators WHERE url = ?", (url,))
+            still_used = self.db.execute(
+                "SELECT 1 FROM images WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            if not still_used:
+                self._image_path(digest).unlink(missing_ok=True)
+                total -= size
+            if total <= self.max_bytes:
+                break
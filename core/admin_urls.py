@@ -0,0 +1,13 @@
+"""
+Admin URLconf.
+
+core.urls mounts this module through a URLResolver holding its dotted
+path, which Django only imports when a request path falls under admin/
+(or when reverse() has to look inside it). API-only workers therefore never
+import the admin modules, the app ModelAdmins or their forms.
+"""
+from django.contrib import admin
+
+import authentication.admin  # noqa: F401  registers the app's ModelAdmins
+
+urlpatterns, app_name, _ = admin.site.urls
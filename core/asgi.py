@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Route the API to the native async views (authentication/async_views.py)
+os.environ.setdefault('DJANGO_ASYNC_API', 'true')
 
 application = get_asgi_application()
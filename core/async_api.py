@@ -0,0 +1,111 @@
+"""
+Async DRF views for the ASGI deployment (core/asgi.py).
+
+DRF's APIView.dispatch is synchronous, so under ASGI Django runs every API
+view through sync_to_async. AsyncAPIView keeps DRF's request handling but
+awaits the handler and authenticates with aauthenticate() where the
+authenticator has one (see core.authentication), so a request only leaves
+the event loop for the queries it actually runs.
+
+Content negotiation, permission checks, throttles, exception handling and
+finalize_response() stay DRF's own code. They are in-memory work
+(throttle history is in the cache, not the database) and run on the loop.
+"""
+import asyncio
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions
+from rest_framework.views import APIView
+
+
+async def aiterate(queryset, chunk_size):
+    """
+    Like QuerySet.aiterator(), which in Django 5.2 runs the query of a
+    values()/values_list() queryset on the event loop and fails with
+    SynchronousOnlyOperation. Each chunk is fetched in a thread here.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await fetch()
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            break
+
+
+class AsyncAPIView(APIView):
+    """
+    An APIView whose handlers are coroutines. Mix it in ahead of a sync
+    view to reuse that view's configuration:
+
+        class UserListView(AsyncAPIView, views.UserListView):
+            async def get(self, request): ...
+
+    Django treats the view as async once every handler it defines is a
+    coroutine (options() is exempt, and DRF's sync one is still served).
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch, with the authentication and the handler awaited
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """APIView.initial() with authentication awaited."""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        """
+        Request._authenticate(), awaiting aauthenticate() where available.
+        Sets request.user up front, so later sync code never queries for it.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
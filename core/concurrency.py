@@ -0,0 +1,187 @@
+"""
+Adaptive concurrency limiting and load shedding for the API.
+
+ConcurrencyLimitMiddleware caps the requests a worker process works on at
+once. Each route in CONCURRENCY_LIMIT_ROUTES has its own limit, and the
+limit tracks that route's latency. A request over the limit is answered
+at once with 503 and Retry-After. It costs a few microseconds, where
+queueing would cost a PBKDF2 hash for a client that has already given up.
+
+Limits follow AIMD, as TCP congestion control does. Each response slower
+than the route's latency target multiplies the limit by
+CONCURRENCY_LIMIT_BACKOFF. Fast responses add one per limit's worth of
+requests. The target is set per route, not learned. A worker recycled
+in the middle of a storm would otherwise learn its idea of "fast" from
+overloaded samples.
+
+Routes belong to a priority class. A class can fill only its
+CONCURRENCY_PRIORITY_SHARES fraction of the worker's total capacity, the
+sum of the route limits. Background traffic such as users/ refreshes is
+therefore shed first, and login requests keep the rest.
+
+The limiter only counts requests the worker has accepted. A gthread
+worker handles GUNICORN_THREADS at a time and queues the rest in gunicorn,
+where the middleware can't see them. When the front-end proxy stamps
+requests with CONCURRENCY_REQUEST_START_HEADER (nginx:
+proxy_set_header X-Request-Start "t=${msec}";), requests that waited longer
+than CONCURRENCY_MAX_QUEUE_WAIT are shed as soon as a thread picks them up.
+Each class gets its share of that wait.
+
+All state is per process, like gunicorn's own queue.
+"""
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+
+class AIMDLimit:
+    """One route's concurrency limit, adjusted from its latency."""
+
+    def __init__(self, target, initial, min_limit, max_limit, backoff):
+        self.target = target
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.inflight = 0
+
+    def update(self, latency, inflight):
+        """Record a response that took latency seconds and started with inflight requests running."""
+        if latency > self.target:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif inflight + 1 >= self.limit / 2:
+            # +1 per limit's worth of fast responses. A route using under half
+            # its limit gives no evidence that more would stay fast.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class ConcurrencyLimiter:
+    """The limits of one worker process, for every route in CONCURRENCY_LIMIT_ROUTES."""
+
+    def __init__(self):
+        self.routes = [(prefix, priority) for prefix, priority, _ in settings.CONCURRENCY_LIMIT_ROUTES]
+        self.shares = dict(settings.CONCURRENCY_PRIORITY_SHARES)
+        self.limits = {
+            prefix: AIMDLimit(
+                target,
+                settings.CONCURRENCY_LIMIT_INITIAL,
+                settings.CONCURRENCY_LIMIT_MIN,
+                settings.CONCURRENCY_LIMIT_MAX,
+                settings.CONCURRENCY_LIMIT_BACKOFF,
+            )
+            for prefix, _, target in settings.CONCURRENCY_LIMIT_ROUTES
+        }
+        self.inflight = 0
+        self.shed = 0
+        self.lock = threading.Lock()
+
+    def match(self, path):
+        """The (limit, priority) of the first route path falls under, or None."""
+        for prefix, priority in self.routes:
+            if path.startswith(prefix):
+                return self.limits[prefix], priority
+        return None
+
+    def acquire(self, limit, priority):
+        """Take a slot for a request; returns the in-flight count it started with, or None to shed it."""
+        with self.lock:
+            capacity = sum(route.limit for route in self.limits.values())
+            if limit.inflight >= limit.limit or self.inflight >= capacity * self.shares[priority]:
+                self.shed += 1
+                return None
+            inflight = limit.inflight
+            limit.inflight += 1
+            self.inflight += 1
+            return inflight
+
+    def release(self, limit, inflight, latency):
+        with self.lock:
+            limit.inflight -= 1
+            self.inflight -= 1
+            limit.update(latency, inflight)
+
+    def reject(self):
+        with self.lock:
+            self.shed += 1
+
+
+def queue_wait(value, now):
+    """
+    Seconds since the proxy's request-start stamp, or None. Accepts
+    "t=<time>" or a bare time, in seconds, milliseconds or microseconds
+    since the epoch (nginx, Heroku and most APMs use one of these).
+    """
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, now - started)
+
+
+def overloaded():
+    response = JsonResponse({'detail': 'Server is busy. Try again shortly.'}, status=503)
+    response['Retry-After'] = str(settings.CONCURRENCY_RETRY_AFTER)
+    return response
+
+
+class ConcurrencyLimitMiddleware:
+    # Works in either mode; under ASGI every waiting request is visible to it
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONCURRENCY_LIMIT_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limiter = ConcurrencyLimiter()
+        self.start_header = 'HTTP_' + settings.CONCURRENCY_REQUEST_START_HEADER.upper().replace('-', '_')
+        self.max_queue_wait = settings.CONCURRENCY_MAX_QUEUE_WAIT
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        route = self.limiter.match(request.path_info)
+        if route is None:
+            return self.get_response(request)
+        inflight = self.admit(request, *route)
+        if inflight is None:
+            return overloaded()
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.limiter.release(route[0], inflight, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        route = self.limiter.match(request.path_info)
+        if route is None:
+            return await self.get_response(request)
+        inflight = self.admit(request, *route)
+        if inflight is None:
+            return overloaded()
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.limiter.release(route[0], inflight, time.perf_counter() - started)
+
+    def admit(self, request, limit, priority):
+        stamp = request.META.get(self.start_header)
+        if stamp and self.max_queue_wait:
+            waited = queue_wait(stamp, time.time())
+            if waited is not None and waited > self.max_queue_wait * self.limiter.shares[priority]:
+                self.limiter.reject()
+                return None
+        return self.limiter.acquire(limit, priority)
@@ -0,0 +1,197 @@
+"""
+Production serving of user uploads (MEDIA_ROOT).
+
+MediaMiddleware sits at the top of the middleware stack and answers
+GET/HEAD requests under MEDIA_URL itself, so image fetches skip the rest of
+the middleware, URL resolving and view dispatch. Responses carry an ETag
+and Last-Modified, honour conditional requests and single byte ranges,
+and get far-future immutable caching when the name is content-hashed
+(see core.storage.ContentHashedStorage).
+
+File bodies are sent as FileResponse, which gunicorn turns into a
+zero-copy sendfile(). With MEDIA_SENDFILE_HEADER set (X-Accel-Redirect for
+nginx, X-Sendfile for Apache/lighttpd) the body is left to the front-end
+server entirely.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotFound
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Names written by ContentHashedStorage: <stem>.<12 hex chars>.<ext>
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}(\.[^./]+)?$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    A window onto an open file, for 206 responses. Reads stop at the end of
+    the range, while fileno() is exposed so gunicorn can still sendfile();
+    gunicorn bounds that by the response's Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def seekable(self):
+        # Keep FileResponse from deriving Content-Length from the whole file
+        return False
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range,
+    None to ignore the header (malformed or multiple ranges), or False when
+    the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if size == 0:
+        return False  # no byte of an empty file can be addressed
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def serve_media(request, name):
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        st = os.stat(path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        return HttpResponseNotFound()
+    if not stat.S_ISREG(st.st_mode):
+        return HttpResponseNotFound()
+
+    etag = quote_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}')
+    last_modified = int(st.st_mtime)
+    immutable = bool(HASHED_NAME_RE.search(name))
+
+    def add_headers(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        if immutable:
+            response.headers['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={settings.MEDIA_MUTABLE_MAX_AGE}'
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return add_headers(conditional)
+
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_SENDFILE_HEADER:
+        # The front-end server reads the file (and handles Range) itself
+        response = HttpResponse(content_type=content_type)
+        response.headers[settings.MEDIA_SENDFILE_HEADER] = (
+            settings.MEDIA_SENDFILE_PREFIX + name
+            if settings.MEDIA_SENDFILE_HEADER == 'X-Accel-Redirect' else path
+        )
+        return add_headers(response)
+
+    start, end = 0, st.st_size - 1
+    status = 200
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and request.method == 'GET' and range_applies(request, etag, last_modified):
+        byte_range = parse_range(range_header, st.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{st.st_size}'
+            return add_headers(response)
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+    length = end - start + 1
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    elif status == 206:
+        response = FileResponse(FileRange(open(path, 'rb'), start, length), content_type=content_type, status=206)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response.headers['Content-Length'] = str(length)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return add_headers(response)
+
+
+def range_applies(request, etag, last_modified):
+    """If-Range: only honour Range when the client's copy is still current."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class MediaMiddleware:
+    # Works in either mode, so an ASGI stack isn't switched to sync for it;
+    # serve_media only stats and opens a local file
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.MEDIA_URL.lstrip('/')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        path = request.path_info
+        if path.startswith(self.prefix) and request.method in ('GET', 'HEAD'):
+            return serve_media(request, path[len(self.prefix):])
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        path = request.path_info
+        if path.startswith(self.prefix) and request.method in ('GET', 'HEAD'):
+            return serve_media(request, path[len(self.prefix):])
+        return await self.get_response(request)
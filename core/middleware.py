@@ -0,0 +1,206 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from whitenoise import middleware as whitenoise_middleware
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+def parse_accept_encoding(header):
+    """Return {coding: qvalue} for an Accept-Encoding header."""
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(header):
+    """
+    Pick the content coding to use for a response: brotli when it is
+    installed and the client accepts it at least as much as gzip, then gzip,
+    otherwise None.
+    """
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get('*', 0.0)
+    br = codings.get('br', wildcard) if brotli else 0.0
+    gzip = codings.get('gzip', wildcard)
+    if br > 0 and br >= gzip:
+        return 'br'
+    if gzip > 0:
+        return 'gzip'
+    return None
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiated brotli/gzip compression for API responses.
+
+    Only paths under COMPRESSION_PATH_PREFIXES are considered, and bodies
+    smaller than COMPRESSION_MIN_SIZE bytes are sent as is, since small
+    responses don't gain enough to pay for the CPU. This also keeps the
+    short, token-bearing verify-code response out of compression.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.path_prefixes = tuple(getattr(settings, 'COMPRESSION_PATH_PREFIXES', ('/api/',)))
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+    async def __acall__(self, request):
+        # MiddlewareMixin would run process_response in a thread; it only
+        # compresses bytes in memory, so run it on the loop
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if not request.path_info.startswith(self.path_prefixes):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is None:
+            return response
+
+        # Both codings are applied here rather than gzip through
+        # GZipMiddleware.process_response: that one looks for "gzip" in the
+        # header itself and would skip a client that only sent "*"
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(response.streaming_content, encoding)
+            else:
+                response.streaming_content = self._compress_sequence(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed_content = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed_content = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # Same reasoning as GZipMiddleware: the encoded body is no longer
+        # byte-identical, so a strong ETag has to become weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compress_sequence(self, sequence, encoding):
+        if encoding == 'gzip':
+            yield from compress_sequence(sequence, max_random_bytes=self.max_random_bytes)
+            return
+        compressor = brotli.Compressor(quality=self.brotli_quality)
+        for chunk in sequence:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+    async def _compress_async(self, sequence, encoding):
+        if encoding == 'gzip':
+            # Like GZipMiddleware: each chunk is a complete gzip member
+            async for chunk in sequence:
+                yield compress_string(chunk, max_random_bytes=self.max_random_bytes)
+            return
+        compressor = brotli.Compressor(quality=self.brotli_quality)
+        async for chunk in sequence:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class WhiteNoiseMiddleware(whitenoise_middleware.WhiteNoiseMiddleware):
+    """
+    WhiteNoise, usable in an async stack. The stock class is sync-only,
+    which makes Django run everything below it through a sync bridge
+    under ASGI. Here only static file responses leave the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+# Browser-only middleware, skipped for token-authenticated API routes.
+#
+# Sessions, authentication and messages exist for the admin and other
+# cookie-based pages. Token clients never send a session cookie, so for paths
+# under API_PATH_PREFIXES these classes hand the request straight to the next
+# layer. Everything else (the admin) gets the stock behaviour. They subclass
+# the Django classes so the admin's system checks still find them.
+#
+# CSRF and X-Frame-Options stay on Django's own classes, which the deploy
+# checks look for by path. API views opt out per view instead: DRF views are
+# csrf_exempt, and authentication/urls.py marks them xframe_options_exempt.
+
+class SiteOnlyMiddlewareMixin:
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.api_prefixes = tuple(getattr(settings, 'API_PATH_PREFIXES', ('/api/',)))
+
+    def is_api_request(self, request):
+        return request.path_info.startswith(self.api_prefixes)
+
+    def __call__(self, request):
+        if self.is_api_request(request):
+            # A coroutine when the chain is async; the handler awaits it
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SiteOnlyMiddlewareMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(SiteOnlyMiddlewareMixin, auth_middleware.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(SiteOnlyMiddlewareMixin, messages_middleware.MessageMiddleware):
+    pass
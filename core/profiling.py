@@ -0,0 +1,219 @@
+"""
+Opt-in request profiling for production.
+
+ProfilingMiddleware profiles a request when
+
+- it carries the PROFILING_HEADER (X-Profile) along with
+  PROFILING_KEY_HEADER (X-Profile-Key) set to PROFILING_SECRET, or
+- it is picked by sampling, 1 in PROFILING_SAMPLE_RATE requests.
+
+The header value chooses the profiler: "cprofile" (deterministic, every
+call, noticeable overhead) or "sample" (a thread that records the request
+thread's stack every PROFILING_SAMPLE_INTERVAL seconds, cheap enough to
+leave on at a low rate). Anything else uses PROFILING_MODE. The client
+address is no use as a credential behind a proxy, so on-demand profiling is
+off while PROFILING_SECRET is empty.
+
+Profiles are written to PROFILING_DIR as <time_ns>-<pid>-<method>-<path>
+with a .prof (pstats) or .folded (collapsed stacks, weighted in
+microseconds) suffix. The directory is a ring: after each write only the
+newest PROFILING_MAX_FILES profiles are kept. `manage.py collapse_profiles`
+merges them into one collapsed-stack file for flamegraph.pl/speedscope.
+
+Under ASGI the middleware stays async, so the chain isn't adapted to sync
+for it. A profile then covers the event loop thread for the length of the
+request: the async views and middleware, plus whatever other requests ran
+on the loop meanwhile. ORM calls run in sync_to_async threads and show up
+as time spent awaiting. One request per worker is profiled at a time.
+
+With PROFILING_ENABLED off the middleware removes itself at start-up.
+"""
+import cProfile
+import functools
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_SUFFIXES = ('.prof', '.folded')
+SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
+
+@functools.lru_cache(maxsize=4096)
+def frame_label(filename, lineno, funcname):
+    """
+    One frame in a collapsed stack: "func (path:line)". Paths are made
+    relative to sys.path entries, and ';' is reserved as the separator.
+    """
+    if filename and filename[0] not in '<~':
+        for entry in sorted(filter(None, sys.path), key=len, reverse=True):
+            if filename.startswith(entry + os.sep):
+                filename = filename[len(entry) + 1:]
+                break
+    label = f'{funcname} ({filename}:{lineno})' if filename != '~' else funcname
+    return label.replace(';', ':')
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='request-stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            # Weight each sample by the time since the previous one: a busy
+            # request thread holding the GIL delays the sampler
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += elapsed
+
+    def collapsed(self):
+        """Collapsed-stack lines weighted in microseconds."""
+        for stack, seconds in self.stacks.items():
+            yield f"{';'.join(frame_label(*frame) for frame in stack)} {round(seconds * 1e6)}\n"
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.PROFILING_HEADER.upper().replace('-', '_')
+        self.key_header = 'HTTP_' + settings.PROFILING_KEY_HEADER.upper().replace('-', '_')
+        self.secret = settings.PROFILING_SECRET.encode()
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.mode = settings.PROFILING_MODE
+        self.interval = settings.PROFILING_SAMPLE_INTERVAL
+        self.directory = Path(settings.PROFILING_DIR)
+        self.max_files = settings.PROFILING_MAX_FILES
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.profiling = False
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.profile_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        stop = self.start(mode)
+        try:
+            response = self.get_response(request)
+        finally:
+            suffix, write = stop()
+        return self.finish(request, response, self.save(request, suffix, write))
+
+    async def __acall__(self, request):
+        mode = self.profile_mode(request)
+        # One profile at a time: the loop thread is shared by every request,
+        # and cProfile allows only one active profiler per thread
+        if mode is None or self.profiling:
+            return await self.get_response(request)
+        self.profiling = True
+        try:
+            stop = self.start(mode)
+            try:
+                response = await self.get_response(request)
+            finally:
+                suffix, write = stop()
+        finally:
+            self.profiling = False
+        name = await sync_to_async(self.save, thread_sensitive=False)(request, suffix, write)
+        return self.finish(request, response, name)
+
+    def start(self, mode):
+        """Start profiling the current thread; returns stop(), which returns (suffix, write)."""
+        if mode == 'sample':
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+
+            def stop():
+                sampler.stop()
+                return '.folded', lambda path: Path(path).write_text(''.join(sampler.collapsed()))
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+            def stop():
+                profiler.disable()
+                return '.prof', profiler.dump_stats
+        return stop
+
+    def finish(self, request, response, name):
+        if self.header in request.META and self.authorized(request):
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    def profile_mode(self, request):
+        """'cprofile', 'sample' or None when this request isn't profiled."""
+        requested = request.META.get(self.header)
+        if requested is not None and self.authorized(request):
+            return requested if requested in ('cprofile', 'sample') else self.mode
+        if self.sample_rate and random.random() * self.sample_rate < 1:
+            return self.mode
+        return None
+
+    def authorized(self, request):
+        key = request.META.get(self.key_header, '').encode()
+        return bool(self.secret) and hmac.compare_digest(key, self.secret)
+
+    def save(self, request, suffix, write):
+        """Write a profile atomically via write(path), trim the ring, return its file name."""
+        slug = SLUG_RE.sub('_', request.path_info).strip('_')[:80] or 'root'
+        name = f'{time.time_ns()}-{os.getpid()}-{request.method}-{slug}{suffix}'
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, self.directory / name)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.trim()
+        return name
+
+    def trim(self):
+        # Names start with time_ns, so sorting them sorts by age
+        profiles = sorted(
+            entry.name for entry in os.scandir(self.directory)
+            if entry.name.endswith(PROFILE_SUFFIXES)
+        )
+        for name in profiles[:-self.max_files]:
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:  # another worker got there first
+                pass
@@ -0,0 +1,111 @@
+"""
+Query recording and plan inspection for the query-budget tests
+(authentication/tests.py) and benchmarks/bench_queries.py.
+
+    with QueryLog() as log:
+        client.get('/api/auth/users/')
+    log.count, log.duration            # queries run, seconds spent in the database
+    log.plans()                        # [(sql, [plan lines]), ...] via EXPLAIN
+    full_scans(plan, 'authentication_user')
+"""
+import re
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+
+from django.db import connections
+
+# Plan lines that read a whole table rather than an index range
+FULL_SCAN_PATTERNS = {
+    'sqlite': r'^SCAN {table}$',
+    'postgresql': r'Seq Scan on {table}\b',
+}
+# Numbers that change from run to run in PostgreSQL plans
+PLAN_NOISE_RE = re.compile(r'\s*\((cost|actual time|rows)=[^)]*\)')
+# Parameter values inlined by client-side binding (keys, ids, timestamps)
+PLAN_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|(?<=[=<>] )-?\d+(?:\.\d+)?\b")
+
+
+@dataclass
+class Query:
+    sql: str
+    params: object
+    many: bool
+    duration: float
+
+
+class QueryLog:
+    """Records every query run on one connection inside the block, with its duration."""
+
+    def __init__(self, using='default'):
+        self.connection = connections[using]
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        self._stack.enter_context(self.connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(sql, params, many, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def plans(self):
+        """EXPLAIN every SELECT/UPDATE/DELETE recorded; returns [(sql, plan lines)]."""
+        return [
+            (query.sql, explain(self.connection, query.sql, query.params))
+            for query in self.queries
+            if not query.many and query.sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))
+        ]
+
+
+def explain(connection, sql, params):
+    """
+    The query plan of sql as a list of lines, without run-specific numbers.
+
+    On PostgreSQL sequential scans are disabled while planning: on small
+    test tables a seq scan is the cheapest plan even when a usable index
+    exists, and the point is to show whether there is one.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            rows = cursor.fetchall()
+        finally:
+            if connection.vendor == 'postgresql':
+                cursor.execute('RESET enable_seqscan')
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail); indent children under their parent
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return lines
+    return [PLAN_LITERAL_RE.sub('?', PLAN_NOISE_RE.sub('', row[0])) for row in rows]
+
+
+def full_scans(plan, table, vendor='sqlite'):
+    """Lines of plan that scan every row of table."""
+    pattern = FULL_SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        return []
+    pattern = re.compile(pattern.format(table=re.escape(table)))
+    return [line for line in plan if pattern.search(line.strip())]
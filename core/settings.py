@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,7 +24,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-#)m%!^22d6c70g*2=8@-pptt9aalou8$cu_ka-cotgzh%quiat'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', 'true').lower() in ('1', 'true', 'yes')
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '137.184.37.240']
 
@@ -31,7 +32,9 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', '137.184.37.240']
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # SimpleAdminConfig skips admin autodiscovery at boot; admin modules are
+    # imported on first use through core/admin_urls.py
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -48,17 +51,32 @@ CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Outermost so a profile covers the whole stack; inactive unless
+    # PROFILING_ENABLED is set
+    'core.profiling.ProfilingMiddleware',
+    # Sheds overload before any other work is done; see core.concurrency
+    'core.concurrency.ConcurrencyLimitMiddleware',
+    'core.media.MediaMiddleware',
+    'authentication.snapshots.SnapshotMiddleware',
+    'core.middleware.WhiteNoiseMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    # The core.middleware classes below skip API_PATH_PREFIXES; API views
+    # are exempted from CSRF and X-Frame-Options individually
+    'core.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.AuthenticationMiddleware',
+    'core.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Token-authenticated routes that don't need sessions or messages. The
+# admin keeps the full stack.
+API_PATH_PREFIXES = ['/api/']
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -85,20 +103,55 @@ WSGI_APPLICATION = 'core.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql_psycopg2',
-#         'NAME': 'login_api_db',
-#         'USER': 'projectuser',
-#         'PASSWORD': 'password',
-#         'HOST': 'localhost',
-#         'PORT': '',
-#     }
-# }
+# Production runs PostgreSQL: DATABASE_ENGINE=postgresql plus the POSTGRES_*
+# variables below. Needs psycopg 3 with psycopg-pool.
+if os.environ.get('DATABASE_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'login_api_db'),
+            'USER': os.environ.get('POSTGRES_USER', 'projectuser'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'password'),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', ''),
+            # The pool replaces persistent connections; Django requires 0 here
+            'CONN_MAX_AGE': 0,
+            # Server-side cursors stream the roster (UserListView). They don't
+            # survive a transaction-mode pgbouncer; set this to true behind one.
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get(
+                'POSTGRES_DISABLE_SERVER_SIDE_CURSORS', 'false'
+            ).lower() in ('1', 'true', 'yes'),
+            'OPTIONS': {
+                # One psycopg_pool per worker process, opened after the fork.
+                # max_size should cover GUNICORN_THREADS plus the audit flusher.
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', '8')),
+                    'timeout': float(os.environ.get('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            },
+        }
+    }
+
+# Rows fetched per round trip when streaming the roster
+ROSTER_CHUNK_SIZE = 2000
+
+# Precomputed roster snapshots (see authentication.snapshots), rebuilt
+# ROSTER_SNAPSHOT_DEBOUNCE seconds after the last User change (0 rebuilds
+# on commit, inline) and at most ROSTER_SNAPSHOT_MAX_DELAY after the first.
+# users/snapshot/ hands out signed URLs under ROSTER_SNAPSHOT_URL that
+# expire after ROSTER_SNAPSHOT_URL_MAX_AGE seconds.
+ROSTER_SNAPSHOT_DIR = os.environ.get('ROSTER_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+ROSTER_SNAPSHOT_URL = 'snapshots/'
+ROSTER_SNAPSHOT_URL_MAX_AGE = 300
+ROSTER_SNAPSHOT_DEBOUNCE = 2.0
+ROSTER_SNAPSHOT_MAX_DELAY = 30.0
+# 11 is ~15x slower to build (36 s for 100k users) for 15% smaller files
+ROSTER_SNAPSHOT_BROTLI_QUALITY = 9
 
 
 # Password validation
@@ -139,11 +192,35 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+STORAGES = {
+    # Uploads get a content hash in their name so they can be cached forever
+    "default": {
+        "BACKEND": "core.storage.ContentHashedStorage",
+    },
+    # collectstatic writes hashed names, a manifest and gzip/brotli copies;
+    # whitenoise serves the hashed names as immutable. Run it on deploy.
+    # (STATICFILES_STORAGE is no longer read by Django 5.1+.)
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Tests render admin pages without running collectstatic first
+TEST_RUNNER = 'core.test_runner.TestRunner'
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media is served by core.media.MediaMiddleware. Content-hashed names are
+# cached for a year as immutable; anything else for an hour.
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MUTABLE_MAX_AGE = 60 * 60
+# Hand file bodies to the front-end server instead of sending them from
+# Python: 'X-Accel-Redirect' (nginx, with an internal location at
+# MEDIA_SENDFILE_PREFIX aliased to MEDIA_ROOT) or 'X-Sendfile'.
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER') or None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -155,19 +232,100 @@ AUTH_USER_MODEL = 'authentication.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        # DRF's TokenAuthentication with an async lookup for AsyncAPIView
+        'core.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        # Service-number lookups per client; each batch entry counts as one
+        'check_username': os.environ.get('CHECK_USERNAME_RATE', '600/min'),
+    },
 }
 
+# Serve the API from the async views in authentication/async_views.py.
+# core/asgi.py turns this on; under WSGI the sync views are used.
+ASYNC_API = os.environ.get('DJANGO_ASYNC_API', 'false').lower() in ('1', 'true', 'yes')
+
+# Maximum number of service numbers accepted by check-username/batch/
+CHECK_USERNAME_BATCH_LIMIT = 500
+
+# Login audit log (see authentication.audit). Events are buffered per worker
+# and written in one batch when the buffer fills or the interval elapses.
+LOGIN_AUDIT_ENABLED = True
+LOGIN_AUDIT_BUFFER_SIZE = 100
+LOGIN_AUDIT_FLUSH_INTERVAL = 5.0  # seconds
+
+# Response compression for API routes (see core.middleware.CompressionMiddleware).
+# brotli is used when the package is installed and the client asks for it.
+COMPRESSION_PATH_PREFIXES = ['/api/']
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Request profiling (see core.profiling). Off unless DJANGO_PROFILING is set.
+# A request is profiled when it sends PROFILING_HEADER with PROFILING_SECRET
+# in PROFILING_KEY_HEADER (no secret, no on-demand profiles), or 1 in
+# PROFILING_SAMPLE_RATE requests (0 disables sampling).
+# Aggregate with: python manage.py collapse_profiles > stacks.folded
+PROFILING_ENABLED = os.environ.get('DJANGO_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+PROFILING_HEADER = 'X-Profile'
+PROFILING_KEY_HEADER = 'X-Profile-Key'
+PROFILING_SECRET = os.environ.get('PROFILING_SECRET', '')
+PROFILING_SAMPLE_RATE = int(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_MODE = 'sample'  # or 'cprofile'
+PROFILING_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_FILES = 500
+
+# Adaptive concurrency limits (see core.concurrency). Each route prefix
+# gets a per-worker limit that shrinks when responses miss its latency
+# target (seconds). Requests over it get 503 + Retry-After. The first
+# matching prefix wins; other paths are not limited. Each priority class
+# may fill its share of the worker's total limit and of
+# CONCURRENCY_MAX_QUEUE_WAIT.
+CONCURRENCY_LIMIT_ENABLED = os.environ.get('DJANGO_CONCURRENCY_LIMIT', 'true').lower() in ('1', 'true', 'yes')
+CONCURRENCY_LIMIT_ROUTES = [
+    ('/api/auth/check-username/', 'critical', 0.5),
+    ('/api/auth/verify-code/', 'critical', 2.0),
+    ('/api/auth/users/', 'background', 2.0),
+]
+CONCURRENCY_PRIORITY_SHARES = {'critical': 1.0, 'background': 0.5}
+CONCURRENCY_LIMIT_INITIAL = 10
+CONCURRENCY_LIMIT_MIN = 1
+CONCURRENCY_LIMIT_MAX = 500
+CONCURRENCY_LIMIT_BACKOFF = 0.9
+# Set by the proxy when it receives the request; requests that queued
+# longer than CONCURRENCY_MAX_QUEUE_WAIT seconds are shed (0 disables)
+CONCURRENCY_REQUEST_START_HEADER = 'X-Request-Start'
+CONCURRENCY_MAX_QUEUE_WAIT = float(os.environ.get('CONCURRENCY_MAX_QUEUE_WAIT', '2'))
+CONCURRENCY_RETRY_AFTER = 2  # seconds
+
 AUTHENTICATION_BACKENDS = [
     'authentication.backends.CodeBackend',
+    'authentication.backends.OTPBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
 
-# SMS Settings
-# SMS_API_TOKEN = 'sms_api_token'
-# SMS_SENDER_ID = 'sender_id'
+# Second login step. 'static' checks each user's passcode; 'sms' texts a
+# one-time code from check-username and verify-code accepts only that code
+# (see authentication.otp). Codes live in the default cache, backed by the
+# database, so workers with separate local caches still find them.
+LOGIN_CODE_MODE = os.environ.get('LOGIN_CODE_MODE', 'static')
+OTP_LENGTH = 6
+OTP_TTL = 300  # seconds
+OTP_MAX_ATTEMPTS = 5
+OTP_RESEND_INTERVAL = 60  # seconds before check-username texts another code
+OTP_MESSAGE = 'Your login code is {code}. It expires in {minutes} minutes.'
+
+# SMS (see authentication.sms). Set SMS_BACKEND to
+# authentication.sms.LocMemBackend to keep messages in memory instead.
+SMS_BACKEND = os.environ.get('SMS_BACKEND', 'authentication.sms.SmartSMSBackend')
+SMS_API_TOKEN = os.environ.get('SMS_API_TOKEN', '')
+SMS_SENDER_ID = os.environ.get('SMS_SENDER_ID', '')
+SMS_TIMEOUT = 10  # seconds
+# Send from a per-worker thread; off runs sends inline on the request
+SMS_DISPATCH_ASYNC = True
+SMS_QUEUE_SIZE = 1000
+# Simulated provider round trip for LocMemBackend, in seconds
+SMS_LOCMEM_DELAY = float(os.environ.get('SMS_LOCMEM_DELAY', '0'))
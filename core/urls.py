@@ -14,16 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
+from django.urls import path, include, URLResolver
+from django.urls.resolvers import RoutePattern
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # Equivalent to path('admin/', include(...)), except that the admin
+    # URLconf is only imported on first use (see core/admin_urls.py)
+    URLResolver(RoutePattern('admin/'), 'core.admin_urls', app_name='admin', namespace='admin'),
     path('api/auth/', include('authentication.urls')),
     
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media files are served by core.media.MediaMiddleware, in DEBUG and in production
@@ -0,0 +1,100 @@
+"""
+Worker warm-up.
+
+A freshly forked worker otherwise pays for URLconf imports, serializer
+introspection, its first database connection and cache client set-up on
+the first requests it serves. warm_up() does that work up front; gunicorn
+calls it from post_worker_init, before the worker accepts connections.
+
+Database connections are per thread, so a gthread worker passes its request
+thread pool and every one of those threads opens its own connection (with
+the psycopg pool, that fills the pool to one connection per thread).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+# Routes resolved during warm-up. Admin URLs are deliberately left out so
+# the admin stays unloaded in workers that only serve the API.
+WARMUP_PATHS = [
+    '/api/auth/check-username/',
+    '/api/auth/check-username/batch/',
+    '/api/auth/verify-code/',
+    '/api/auth/users/',
+]
+
+
+def warm_urls():
+    for path in WARMUP_PATHS:
+        resolve(path)
+
+
+def warm_serializers():
+    from rest_framework.renderers import JSONRenderer
+    from authentication.serializers import (
+        BatchUsernameCheckSerializer, CodeVerificationSerializer, UserListSerializer,
+        UsernameCheckSerializer,
+    )
+
+    for serializer_class in (
+        UsernameCheckSerializer, BatchUsernameCheckSerializer, CodeVerificationSerializer,
+        UserListSerializer,
+    ):
+        serializer_class().fields
+    JSONRenderer().render({'warm': True})
+
+
+def connect_all():
+    for alias in settings.DATABASES:
+        connections[alias].ensure_connection()
+
+
+def warm_database(executor=None, threads=1):
+    """Connect on this thread, or on each of the executor's threads."""
+    if executor is None:
+        connect_all()
+        return
+    # Tasks wait for each other, so no thread can pick up a second one and
+    # the executor has to start all of its threads
+    barrier = threading.Barrier(threads, timeout=10)
+
+    def connect():
+        barrier.wait()
+        connect_all()
+
+    for future in [executor.submit(connect) for _ in range(threads)]:
+        future.result()
+
+
+def warm_caches():
+    for alias in settings.CACHES:
+        caches[alias].get('warmup')
+
+
+def warm_up(executor=None, threads=1):
+    """
+    Run every warm-up step; returns {step: seconds}. Failures are logged, not
+    raised. executor is the pool of `threads` threads serving requests, if any.
+    """
+    timings = {}
+    steps = ((warm_urls, ()), (warm_serializers, ()), (warm_database, (executor, threads)), (warm_caches, ()))
+    for step, args in steps:
+        start = time.perf_counter()
+        try:
+            step(*args)
+        except Exception:
+            logger.exception('Warm-up step %s failed', step.__name__)
+        timings[step.__name__] = time.perf_counter() - start
+    logger.info(
+        'Worker warmed up in %.1f ms (%s)',
+        sum(timings.values()) * 1000,
+        ', '.join(f'{name} {seconds * 1000:.1f} ms' for name, seconds in timings.items()),
+    )
+    return timings
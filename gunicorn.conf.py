@@ -0,0 +1,94 @@
+"""
+Gunicorn server configuration.
+
+Gunicorn loads this file automatically when started from the project root:
+
+    gunicorn                       # serves core.wsgi, or core.asgi for uvicorn workers
+
+Every setting can be overridden from the environment so deployments (and
+benchmarks/bench_server.py) tune the server without editing code:
+
+    WEB_WORKER_CLASS          sync | gthread | uvicorn (default: gthread)
+    WEB_CONCURRENCY           worker processes (default: 2 * cores + 1,
+                              cores + 1 for gthread/uvicorn)
+    GUNICORN_THREADS          threads per gthread worker (default: 4)
+    GUNICORN_PRELOAD          load the app before forking (default: true)
+    GUNICORN_MAX_REQUESTS     recycle a worker after this many requests, 0 = never
+                              (default: 1000)
+    GUNICORN_MAX_REQUESTS_JITTER
+                              random extra requests so workers don't all
+                              recycle at once (default: 10% of max requests)
+    GUNICORN_KEEPALIVE        seconds to hold idle keep-alive connections (default: 5)
+    GUNICORN_TIMEOUT          seconds before a silent worker is killed (default: 30)
+    GUNICORN_BIND             address to listen on (default: 0.0.0.0:8000)
+    GUNICORN_WARMUP           run core.warmup.warm_up() in each worker before it
+                              accepts traffic (default: true)
+"""
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn_worker.UvicornWorker',
+}
+
+worker_profile = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+if worker_profile not in WORKER_CLASSES:
+    raise ValueError(
+        f"WEB_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, got {worker_profile!r}"
+    )
+
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+wsgi_app = 'core.asgi:application' if worker_profile == 'uvicorn' else 'core.wsgi:application'
+worker_class = WORKER_CLASSES[worker_profile]
+
+# Sync workers block on every request and need more processes to cover
+# I/O waits; threaded and async workers overlap I/O inside one process.
+workers = env_int('WEB_CONCURRENCY', 2 * cores + 1 if worker_profile == 'sync' else cores + 1)
+threads = env_int('GUNICORN_THREADS', 4) if worker_profile == 'gthread' else 1
+
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = timeout
+
+# Heartbeat files on tmpfs so a slow disk can't make healthy workers look dead
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+
+warmup = env_bool('GUNICORN_WARMUP', True)
+
+
+def post_worker_init(worker):
+    # Runs in the forked worker before it starts accepting connections
+    if warmup:
+        from core.warmup import warm_up
+        # gthread workers serve requests from worker.tpool, not this thread
+        warm_up(getattr(worker, 'tpool', None), threads)
+
+
+def worker_exit(server, worker):
+    # Write out login audit events still buffered in this worker
+    from authentication import audit
+    audit.flush()
@@ -2,8 +2,108 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import requests
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
 from io import BytesIO
+from client_cache import ClientCache
+
+# (connect, read) timeouts in seconds so a dead link can never wedge a worker
+REQUEST_TIMEOUT = (5, 30)
+# How often the Tk loop drains finished background tasks
+POLL_INTERVAL_MS = 50
+# Rows materialised in the users table per scroll step
+PAGE_SIZE = 200
+# User fields shown in the users table, in column order
+USER_FIELDS = ("serviceNumber", "name", "email", "phone")
+
+
+def user_row(user):
+    return tuple(user.get(field) or "" for field in USER_FIELDS)
+
+
+class UsersTable:
+    """
+    Holds the full roster in memory and mirrors only what is needed into a
+    Treeview. Rows are inserted a page at a time as the user scrolls,
+    refreshes are diffed by user id so unchanged rows cost no Tk calls, and
+    search runs against a lowercase index instead of the widget.
+    """
+
+    def __init__(self, tree, page_size=PAGE_SIZE):
+        self.tree = tree
+        self.page_size = page_size
+        self.rows = {}          # user id -> row values
+        self.order = []         # user ids in server order
+        self.search_index = {}  # user id -> lowercase text searched by filter
+        self.query = ""
+        self.visible = []       # user ids matching the query, in order
+        self.rendered = 0       # how many of visible are in the tree
+
+    def load(self, users):
+        """Replace the roster, touching only rows that were added, changed or removed."""
+        rows = {}
+        for user in users:
+            rows[str(user["id"])] = user_row(user)
+        
+        changed = {uid for uid, row in rows.items() if self.rows.get(uid) != row}
+        for uid in self.rows.keys() - rows.keys():
+            del self.search_index[uid]
+        for uid in changed:
+            self.search_index[uid] = " ".join(rows[uid]).lower()
+        
+        self.rows = rows
+        self.order = list(rows)
+        self.sync(max(self.rendered, self.page_size), changed)
+
+    def search(self, query):
+        query = query.strip().lower()
+        if query == self.query:
+            return
+        self.query = query
+        self.sync(self.page_size)
+
+    def load_more(self):
+        """Append the next page of matching rows, if any are left."""
+        if self.rendered >= len(self.visible):
+            return
+        end = min(self.rendered + self.page_size, len(self.visible))
+        for uid in self.visible[self.rendered:end]:
+            self.tree.insert("", tk.END, iid=uid, values=self.rows[uid])
+        self.rendered = end
+
+    def sync(self, count, changed=()):
+        """Make the tree show the first count matching rows."""
+        if self.query:
+            visible = [uid for uid in self.order if self.query in self.search_index[uid]]
+        else:
+            visible = self.order
+        target = visible[:count]
+        target_ids = set(target)
+        
+        shown = self.visible[:self.rendered]
+        stale = [uid for uid in shown if uid not in target_ids]
+        if stale:
+            self.tree.delete(*stale)
+        
+        stale_ids = set(stale)
+        kept = [uid for uid in shown if uid not in stale_ids]
+        kept_ids = set(kept)
+        in_order = kept == [uid for uid in target if uid in kept_ids]
+        
+        for index, uid in enumerate(target):
+            if uid not in kept_ids:
+                self.tree.insert("", index, iid=uid, values=self.rows[uid])
+                continue
+            if uid in changed:
+                self.tree.item(uid, values=self.rows[uid])
+            if not in_order:
+                self.tree.move(uid, "", index)
+        
+        self.visible = visible
+        self.rendered = len(target)
+
 
 class SimpleLoginApp:
     def __init__(self, root):
@@ -16,6 +116,20 @@ class SimpleLoginApp:
         self.api_base_url = "http://localhost:8000/api/auth/"
         self.token = None
         self.current_user = None
+        self.account = None  # id of the logged-in user, scopes cached rosters
+        
+        # Network I/O runs on a worker pool; results come back through a queue
+        # that the Tk main loop drains with root.after, so the UI never blocks
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="api")
+        self.results = queue.Queue()
+        self.tasks = {}  # task name -> (generation, future, cancel event)
+        self.generations = {}
+        
+        # Roster and images from previous runs, shown before revalidating
+        self.cache = ClientCache()
+        
+        # Busy indicator shown while any request is in flight
+        self.setup_status_bar()
         
         # Create the main notebook (tabbed interface)
         self.notebook = ttk.Notebook(root)
@@ -39,6 +153,98 @@ class SimpleLoginApp:
         # Disable tabs until login
         self.notebook.tab(1, state="disabled")
         self.notebook.tab(2, state="disabled")
+        
+        # Start delivering background results and clean up the pool on exit
+        self.root.after(POLL_INTERVAL_MS, self.process_results)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def setup_status_bar(self):
+        status_bar = ttk.Frame(self.root)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        
+        self.busy_var = tk.StringVar()
+        ttk.Label(status_bar, textvariable=self.busy_var).pack(side=tk.LEFT)
+        self.busy_bar = ttk.Progressbar(status_bar, mode="indeterminate", length=120)
+        self.busy = False
+
+    def run_in_background(self, name, func, on_success, on_error=None):
+        """
+        Run func(cancelled) on the worker pool and hand its result to
+        on_success (or its exception to on_error) on the Tk thread.
+        Starting a task under a name that is already in flight supersedes
+        it: the old task is cancelled and its result is discarded.
+        """
+        self.cancel_task(name)
+        generation = self.generations.get(name, 0) + 1
+        self.generations[name] = generation
+        cancelled = threading.Event()
+        future = self.executor.submit(func, cancelled)
+        self.tasks[name] = (generation, future, cancelled)
+        future.add_done_callback(
+            lambda f: self.results.put((name, generation, f, on_success, on_error))
+        )
+        self.update_busy()
+
+    def cancel_task(self, name):
+        task = self.tasks.pop(name, None)
+        if task:
+            _, future, cancelled = task
+            cancelled.set()
+            future.cancel()
+
+    def process_results(self):
+        """
+        Deliver finished background tasks to their callbacks. Runs on the Tk
+        thread, which is the only thread allowed to touch widgets.
+        """
+        while True:
+            try:
+                name, generation, future, on_success, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            
+            # Skip results from tasks that were superseded by a newer click
+            task = self.tasks.get(name)
+            if not task or task[0] != generation or future.cancelled():
+                continue
+            del self.tasks[name]
+            
+            error = future.exception()
+            if error is None:
+                on_success(future.result())
+            elif on_error:
+                on_error(error)
+            else:
+                print(f"Background task {name} failed: {error}")
+        
+        self.update_busy()
+        self.root.after(POLL_INTERVAL_MS, self.process_results)
+
+    def update_busy(self):
+        busy = bool(self.tasks)
+        if busy == self.busy:
+            return
+        self.busy = busy
+        if busy:
+            self.busy_var.set("Working...")
+            self.busy_bar.pack(side=tk.RIGHT)
+            self.busy_bar.start(10)
+            self.root.config(cursor="watch")
+        else:
+            self.busy_var.set("")
+            self.busy_bar.stop()
+            self.busy_bar.pack_forget()
+            self.root.config(cursor="")
+
+    def on_close(self):
+        for name in list(self.tasks):
+            self.cancel_task(name)
+        self.root.destroy()
+        # Tasks already running may still write to the cache, so wait for
+        # them before closing it. The window is gone, so a slow request
+        # can't leave it frozen.
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.cache.close()
 
     def setup_login_ui(self):
         # Create a frame for login form with some padding and styling
@@ -80,6 +286,14 @@ class SimpleLoginApp:
         for widget in self.users_frame.winfo_children():
             widget.destroy()
             
+        # Search box filters the in-memory roster as you type
+        search_frame = ttk.Frame(self.users_frame)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.users_table.search(self.search_var.get()))
+        ttk.Entry(search_frame, textvariable=self.search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
         # Create a frame for the users list
         list_frame = ttk.Frame(self.users_frame)
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -93,9 +307,18 @@ class SimpleLoginApp:
             self.users_tree.heading(col, text=col)
             self.users_tree.column(col, width=100)
         
-        # Add a scrollbar
+        # Rows are loaded lazily, a page at a time
+        self.users_table = UsersTable(self.users_tree)
+        
+        # Add a scrollbar; nearing the bottom pulls in the next page
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.users_tree.yview)
-        self.users_tree.configure(yscroll=scrollbar.set)
+        
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) > 0.9:
+                self.users_table.load_more()
+        
+        self.users_tree.configure(yscroll=on_scroll)
         
         # Pack the treeview and scrollbar
         self.users_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -105,7 +328,10 @@ class SimpleLoginApp:
         refresh_button = ttk.Button(self.users_frame, text="Refresh Users", command=self.fetch_users)
         refresh_button.pack(pady=10)
         
-        # Fetch users
+        # Show the cached roster straight away, then revalidate it
+        cached_users = self.cache.get_roster(f"{self.api_base_url}users/", self.account)
+        if cached_users:
+            self.users_table.load(cached_users)
         self.fetch_users()
 
     def setup_profile_ui(self):
@@ -137,20 +363,39 @@ class SimpleLoginApp:
         
         # Display profile image if available
         if "profile_image" in self.current_user and self.current_user["profile_image"]:
-            try:
-                response = requests.get(self.current_user["profile_image"])
-                if response.status_code == 200:
-                    img_data = BytesIO(response.content)
-                    img = Image.open(img_data)
-                    img = img.resize((150, 150), Image.LANCZOS)
-                    photo = ImageTk.PhotoImage(img)
-                    
-                    img_label = ttk.Label(profile_info)
-                    img_label.image = photo  # Keep a reference to prevent garbage collection
-                    img_label.configure(image=photo)
-                    img_label.grid(row=row, column=0, columnspan=2, pady=10)
-            except Exception as e:
-                print(f"Error loading profile image: {e}")
+            image_url = self.current_user["profile_image"]
+            
+            def load_image(cancelled):
+                # Download and resize off the Tk thread; only PhotoImage
+                # creation has to happen on the main loop
+                data = self.cache.get_image(image_url)
+                if data is None:
+                    response = requests.get(image_url, stream=True, timeout=REQUEST_TIMEOUT)
+                    response.raise_for_status()
+                    img_data = BytesIO()
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if cancelled.is_set():
+                            response.close()
+                            return None
+                        img_data.write(chunk)
+                    data = img_data.getvalue()
+                    self.cache.store_image(image_url, data, response.headers)
+                img = Image.open(BytesIO(data))
+                return img.resize((150, 150), Image.LANCZOS)
+            
+            def show_image(img):
+                if img is None or not profile_info.winfo_exists():
+                    return
+                photo = ImageTk.PhotoImage(img)
+                img_label = ttk.Label(profile_info)
+                img_label.image = photo  # Keep a reference to prevent garbage collection
+                img_label.configure(image=photo)
+                img_label.grid(row=row, column=0, columnspan=2, pady=10)
+            
+            self.run_in_background(
+                "profile_image", load_image, show_image,
+                lambda e: print(f"Error loading profile image: {e}")
+            )
 
     def check_username(self):
         service_number = self.service_number_var.get()
@@ -158,38 +403,46 @@ class SimpleLoginApp:
         if not service_number:
             self.status_var.set("Please enter a service number")
             return
-            
-        try:
-            response = requests.post(
+        
+        def request(cancelled):
+            return requests.post(
                 f"{self.api_base_url}check-username/", 
-                data={"username": service_number}
+                data={"username": service_number},
+                timeout=REQUEST_TIMEOUT
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("exists", False):
-                    # Show masked phone number
-                    self.phone_label.config(text=f"Phone: {data.get('phone', '')}")
-                    
-                    # Enable passcode entry and login button
-                    self.passcode_entry.config(state="normal")
-                    self.login_button.config(state="normal")
-                    
-                    # Focus on passcode entry
-                    self.passcode_entry.focus()
-                    
-                    self.status_var.set("Service number found. Please enter your passcode.")
-                else:
-                    self.status_var.set("Service number not found.")
-                    self.phone_label.config(text="")
-            elif response.status_code == 404:
+        
+        self.status_var.set("Checking service number...")
+        self.run_in_background("check_username", request, self.on_username_checked, self.on_connection_error)
+
+    def on_username_checked(self, response):
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("exists", False):
+                # Show masked phone number
+                self.phone_label.config(text=f"Phone: {data.get('phone', '')}")
+                
+                # Enable passcode entry and login button
+                self.passcode_entry.config(state="normal")
+                self.login_button.config(state="normal")
+                
+                # Focus on passcode entry
+                self.passcode_entry.focus()
+                
+                self.status_var.set("Service number found. Please enter your passcode.")
+            else:
                 self.status_var.set("Service number not found.")
                 self.phone_label.config(text="")
-            else:
-                self.status_var.set("Error checking service number.")
-                
-        except requests.RequestException as e:
-            self.status_var.set(f"Connection error: {str(e)}")
+        elif response.status_code == 404:
+            self.status_var.set("Service number not found.")
+            self.phone_label.config(text="")
+        else:
+            self.status_var.set("Error checking service number.")
+
+    def on_connection_error(self, error):
+        if isinstance(error, requests.RequestException):
+            self.status_var.set(f"Connection error: {str(error)}")
+        else:
+            self.status_var.set(f"Error: {str(error)}")
 
     def verify_code(self):
         service_number = self.service_number_var.get()
@@ -198,73 +451,88 @@ class SimpleLoginApp:
         if not service_number or not passcode:
             self.status_var.set("Please enter both service number and passcode")
             return
-            
-        try:
-            response = requests.post(
+        
+        def request(cancelled):
+            return requests.post(
                 f"{self.api_base_url}verify-code/", 
                 data={
                     "username": service_number,
                     "code": passcode
-                }
+                },
+                timeout=REQUEST_TIMEOUT
             )
+        
+        self.status_var.set("Logging in...")
+        self.run_in_background("verify_code", request, self.on_code_verified, self.on_connection_error)
+
+    def on_code_verified(self, response):
+        if response.status_code == 200:
+            data = response.json()
+            self.token = data.get("token")
+            self.current_user = data
+            self.account = str(data.get("id"))
             
-            if response.status_code == 200:
-                data = response.json()
-                self.token = data.get("token")
-                self.current_user = data
-                
-                # Enable other tabs
-                self.notebook.tab(1, state="normal")
-                self.notebook.tab(2, state="normal")
-                
-                # Setup other UIs
-                self.setup_users_ui()
-                self.setup_profile_ui()
-                
-                # Switch to users tab
-                self.notebook.select(1)
-                
-                self.status_var.set("Login successful!")
-            else:
-                error_msg = "Login failed"
-                if response.status_code == 401:
-                    error_msg = "Invalid credentials"
-                self.status_var.set(error_msg)
-                
-        except requests.RequestException as e:
-            self.status_var.set(f"Connection error: {str(e)}")
+            # Enable other tabs
+            self.notebook.tab(1, state="normal")
+            self.notebook.tab(2, state="normal")
+            
+            # Setup other UIs
+            self.setup_users_ui()
+            self.setup_profile_ui()
+            
+            # Switch to users tab
+            self.notebook.select(1)
+            
+            self.status_var.set("Login successful!")
+        else:
+            error_msg = "Login failed"
+            if response.status_code == 401:
+                error_msg = "Invalid credentials"
+            self.status_var.set(error_msg)
 
     def fetch_users(self):
         if not self.token:
             return
-            
-        try:
+        
+        token = self.token
+        account = self.account
+        url = f"{self.api_base_url}users/"
+        
+        def request(cancelled):
+            # Ask where the current roster snapshot is. Its ETag is the
+            # snapshot's hash, so a 304 means the cached roster is current.
             response = requests.get(
-                f"{self.api_base_url}users/",
-                headers={"Authorization": f"Token {self.token}"}
+                f"{url}snapshot/",
+                headers={"Authorization": f"Token {token}", **self.cache.conditional_headers(url, account)},
+                timeout=REQUEST_TIMEOUT
             )
-            
-            if response.status_code == 200:
-                users = response.json()
-                
-                # Clear existing items
-                for item in self.users_tree.get_children():
-                    self.users_tree.delete(item)
-                    
-                # Add users to treeview
-                for user in users:
-                    self.users_tree.insert("", tk.END, values=(
-                        user.get("serviceNumber", ""),
-                        # user.get("username", ""),
-                        user.get("name", ""),
-                        user.get("email", ""),
-                        user.get("phone", "")
-                    ))
-            else:
-                messagebox.showerror("Error", "Failed to fetch users")
-                
-        except requests.RequestException as e:
-            messagebox.showerror("Connection Error", str(e))
+            if response.status_code != 200:
+                return response.status_code, None
+            # The snapshot itself is a precompressed static file behind a
+            # short-lived signed URL; no token needed
+            snapshot = requests.get(response.json()["url"], timeout=REQUEST_TIMEOUT)
+            if snapshot.status_code != 200:
+                return snapshot.status_code, None
+            # Decode and cache the roster on the worker, it can be large
+            users = snapshot.json()
+            self.cache.store_roster(url, users, response.headers, account)
+            return snapshot.status_code, users
+        
+        self.run_in_background("fetch_users", request, self.on_users_fetched, self.on_fetch_users_error)
+
+    def on_users_fetched(self, result):
+        status_code, users = result
+        if status_code == 304:
+            return
+        if users is None:
+            messagebox.showerror("Error", "Failed to fetch users")
+            return
+        
+        # Only rows that differ from what is already shown are touched
+        self.users_table.load(users)
+
+    def on_fetch_users_error(self, error):
+        messagebox.showerror("Connection Error", str(error))
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,100 @@
+"""
+Tests of the desktop client's local cache.
+
+    python -m unittest test_client_cache
+"""
+import hashlib
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from client_cache import ClientCache
+
+ROSTER_URL = "http://localhost:8000/api/auth/users/"
+
+
+class ClientCacheTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.cache = self.open()
+
+    def open(self, **kwargs):
+        cache = ClientCache(self.directory, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def image_files(self):
+        return sorted(path.name for path in (self.directory / "images").glob("*/*"))
+
+    def test_validators(self):
+        self.assertEqual(self.cache.conditional_headers(ROSTER_URL, "1"), {})
+        headers = {"ETag": '"abc"', "Last-Modified": "Mon, 19 Oct 2026 10:00:00 GMT"}
+        self.cache.store_roster(ROSTER_URL, [{"id": 1}], headers, "1")
+        self.assertEqual(self.cache.conditional_headers(ROSTER_URL, "1"), {
+            "If-None-Match": '"abc"', "If-Modified-Since": "Mon, 19 Oct 2026 10:00:00 GMT",
+        })
+        self.cache.store_roster(ROSTER_URL, [{"id": 1}], {"ETag": '"def"'}, "1")
+        self.assertEqual(self.cache.conditional_headers(ROSTER_URL, "1"), {"If-None-Match": '"def"'})
+
+    def test_roster_survives_a_restart(self):
+        users = [{"id": 2, "name": "b"}, {"id": 1, "name": "a"}]
+        self.cache.store_roster(ROSTER_URL, users, {"ETag": '"abc"'}, "1")
+        self.cache.close()
+        self.assertEqual(self.open().get_roster(ROSTER_URL, "1"), users)
+
+    def test_roster_is_scoped_by_account_and_server(self):
+        self.cache.store_roster(ROSTER_URL, [{"id": 1}], {"ETag": '"abc"'}, "1")
+        self.assertIsNone(self.cache.get_roster(ROSTER_URL, "2"))
+        self.assertEqual(self.cache.conditional_headers(ROSTER_URL, "2"), {})
+        self.assertIsNone(self.cache.get_roster("http://other:8000/api/auth/users/", "1"))
+        self.cache.store_roster(ROSTER_URL, [{"id": 2}], {}, "2")
+        self.assertEqual(self.cache.get_roster(ROSTER_URL, "1"), [{"id": 1}])
+
+    def test_images_are_content_addressed(self):
+        self.cache.store_image("http://a/1.png", b"same")
+        self.cache.store_image("http://a/2.png", b"same", {"ETag": '"x"'})
+        self.assertEqual(self.image_files(), [hashlib.sha256(b"same").hexdigest()])
+        self.assertEqual(self.cache.get_image("http://a/2.png"), b"same")
+        self.assertEqual(self.cache.conditional_headers("http://a/2.png"), {"If-None-Match": '"x"'})
+        self.assertIsNone(self.cache.get_image("http://a/3.png"))
+
+    def test_missing_image_file(self):
+        self.cache.store_image("http://a/1.png", b"data")
+        for path in (self.directory / "images").glob("*/*"):
+            path.unlink()
+        self.assertIsNone(self.cache.get_image("http://a/1.png"))
+        self.assertIsNone(self.cache.get_image("http://a/1.png"))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.open(max_bytes=10)
+        with mock.patch("client_cache.time.time", side_effect=range(100)):
+            cache.store_image("http://a/1.png", b"1111")
+            cache.store_image("http://a/2.png", b"2222", {"ETag": '"2"'})
+            cache.store_image("http://a/dup.png", b"1111")  # shares 1.png's file
+            cache.get_image("http://a/1.png")
+            # 12 bytes: 2.png goes, being the oldest access with its own file
+            cache.store_image("http://a/3.png", b"3333")
+        self.assertIsNone(cache.get_image("http://a/2.png"))
+        self.assertEqual(cache.conditional_headers("http://a/2.png"), {})
+        self.assertEqual(cache.get_image("http://a/1.png"), b"1111")
+        self.assertEqual(cache.get_image("http://a/3.png"), b"3333")
+        self.assertEqual(len(self.image_files()), 2)
+
+    def test_shared_file_is_kept_until_its_last_url_goes(self):
+        cache = self.open(max_bytes=4)
+        with mock.patch("client_cache.time.time", side_effect=range(100)):
+            cache.store_image("http://a/1.png", b"1111")
+            cache.store_image("http://a/dup.png", b"1111")
+            cache.get_image("http://a/dup.png")
+            cache.store_image("http://a/2.png", b"2222")
+        # Both URLs of the old file had to go before the cache fit again
+        self.assertIsNone(cache.get_image("http://a/1.png"))
+        self.assertIsNone(cache.get_image("http://a/dup.png"))
+        self.assertEqual(self.image_files(), [hashlib.sha256(b"2222").hexdigest()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Tests of the desktop client's users table and shutdown. Both run without a
+Tk main loop: the table talks to a stub Treeview, and the app is built
+around stub widgets.
+
+    python -m unittest test_main
+"""
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from main import SimpleLoginApp, UsersTable
+
+
+class StubTree:
+    """The part of ttk.Treeview that UsersTable uses, counting every call."""
+
+    def __init__(self):
+        self.ids = []
+        self.values = {}
+        self.calls = 0
+
+    def insert(self, parent, index, iid, values):
+        self.calls += 1
+        self.ids.insert(len(self.ids) if index == "end" else index, iid)
+        self.values[iid] = values
+
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            self.ids.remove(iid)
+            del self.values[iid]
+
+    def item(self, iid, values):
+        self.calls += 1
+        self.values[iid] = values
+
+    def move(self, iid, parent, index):
+        self.calls += 1
+        self.ids.remove(iid)
+        self.ids.insert(index, iid)
+
+
+def users(count, start=1, name="user"):
+    return [
+        {"id": n, "serviceNumber": f"N/{n}", "name": f"{name} {n}", "email": f"u{n}@example.com", "phone": None}
+        for n in range(start, start + count)
+    ]
+
+
+class UsersTableTests(unittest.TestCase):
+    def setUp(self):
+        self.tree = StubTree()
+        self.table = UsersTable(self.tree, page_size=3)
+
+    def test_load_renders_one_page(self):
+        self.table.load(users(7))
+        self.assertEqual(self.tree.ids, ["1", "2", "3"])
+        self.assertEqual(self.tree.values["1"], ("N/1", "user 1", "u1@example.com", ""))
+
+    def test_load_more(self):
+        self.table.load(users(7))
+        self.table.load_more()
+        self.assertEqual(self.tree.ids, ["1", "2", "3", "4", "5", "6"])
+        self.table.load_more()
+        self.table.load_more()  # nothing left
+        self.assertEqual(self.tree.ids, [str(n) for n in range(1, 8)])
+
+    def test_reload_only_touches_changes(self):
+        self.table.load(users(7))
+        self.table.load_more()
+        self.tree.calls = 0
+        self.table.load(users(7))
+        self.assertEqual(self.tree.calls, 0)
+
+        changed = users(7)
+        changed[1]["name"] = "renamed"
+        del changed[0]
+        self.table.load(changed)
+        # Row 1 deleted, row 2 updated in place, row 8 doesn't exist: 2 to 7 shown
+        self.assertEqual(self.tree.ids, ["2", "3", "4", "5", "6", "7"])
+        self.assertEqual(self.tree.values["2"][1], "renamed")
+        self.assertEqual(self.tree.calls, 3)  # delete, item, insert of row 7
+
+    def test_reorder(self):
+        self.table.load(users(3))
+        self.table.load(list(reversed(users(3))))
+        self.assertEqual(self.tree.ids, ["3", "2", "1"])
+
+    def test_search(self):
+        self.table.load(users(12) + users(2, start=100, name="Smith"))
+        self.table.search("  SMITH ")
+        self.assertEqual(self.tree.ids, ["100", "101"])
+        self.tree.calls = 0
+        self.table.search("smith")  # same query: no work
+        self.assertEqual(self.tree.calls, 0)
+        self.table.search("u1")  # matches the email column: u1, u10, u11, u12, u100, u101
+        self.assertEqual(self.tree.ids, ["1", "10", "11"])
+        self.table.load_more()
+        self.assertEqual(self.tree.ids, ["1", "10", "11", "12", "100", "101"])
+        self.table.search("")
+        self.assertEqual(self.tree.ids, ["1", "2", "3"])
+
+    def test_sync_keeps_rows_that_stay_visible(self):
+        self.table.load(users(5))
+        self.table.search("user")
+        self.tree.calls = 0
+        self.table.sync(3)
+        self.assertEqual(self.tree.calls, 0)
+
+
+class ShutdownTests(unittest.TestCase):
+    def test_running_tasks_finish_before_the_cache_closes(self):
+        app = SimpleLoginApp.__new__(SimpleLoginApp)
+        app.root = mock.Mock()
+        app.executor = ThreadPoolExecutor(max_workers=1)
+        app.tasks = {}
+        app.cache = mock.Mock()
+        started = threading.Event()
+
+        def store(cancelled):
+            started.set()
+            cancelled.wait(0.05)
+            app.cache.store_roster("url", [], {})
+
+        future = app.executor.submit(store, threading.Event())
+        started.wait()
+        app.on_close()
+        self.assertTrue(future.done())
+        self.assertEqual(
+            [name for name, args, kwargs in app.cache.mock_calls], ["store_roster", "close"]
+        )
+        app.root.destroy.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()